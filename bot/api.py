@@ -1,33 +1,99 @@
 import asyncio
-import json
 import logging
+import math
+import time
 
 from aiohttp import web
 from aiogram import Bot
 from aiogram.types import LabeledPrice
 
-from config import ALLOWED_PRICES, BOT_TOKEN, CORS_ALLOW_ORIGIN, INIT_DATA_MAX_AGE_SECONDS
+from config import (
+    ALLOWED_PRICES,
+    BOT_TOKEN,
+    BACKGROUND_TASKS_MAX_CONCURRENCY,
+    BACKGROUND_TASKS_MAX_QUEUE,
+    BACKGROUND_TASKS_POLICY,
+    CORS_ALLOW_ORIGIN,
+    GIFT_DELIVERY_LEASE_SECONDS,
+    GIFT_DELIVERY_MAX_ATTEMPTS,
+    GIFT_DELIVERY_POLL_SECONDS,
+    GIFT_DELIVERY_RETRY_BASE_SECONDS,
+    GIFT_DELIVERY_WORKERS,
+    INIT_DATA_MAX_AGE_SECONDS,
+    LEADERBOARD_STREAM_FLUSH_MS,
+    LEADERBOARD_STREAM_KEEPALIVE_SECONDS,
+    LEADERBOARD_STREAM_QUEUE_SIZE,
+    LOAD_SHED_WRITE_QUEUE_DEPTH,
+    METRICS_ENABLED,
+    METRICS_TOKEN,
+    PROFILING_DIR,
+    PROFILING_ENABLED,
+    PROFILING_MAX_FILES,
+    PROFILING_MODE,
+    PROFILING_SAMPLE_EVERY,
+    PROFILING_SECRET,
+    RATE_LIMIT_DEFAULT_PER_MINUTE,
+    RATE_LIMIT_ENABLED,
+    RATE_LIMIT_INVOICE_PER_MINUTE,
+    RATE_LIMIT_ROULETTE_PER_MINUTE,
+    SESSION_TOKEN_TTL_SECONDS,
+)
+from gift_delivery import GiftDeliveryWorkers
 from gifts import TELEGRAM_GIFTS
+from invoice_cache import InvoiceLinkCache
+from leaderboard import LeaderboardPageCache
+from leaderboard_stream import LeaderboardBroadcaster
+from logging_setup import should_log
+from metrics import HTTP_REQUEST_SECONDS, REGISTRY
+from pagination import SQLITE_MAX_INTEGER, decode_cursor, encode_cursor
 from payments import build_invoice_payload
-from security import extract_user_from_init_data, verify_telegram_init_data
+from profiling import RequestProfiler
+from rate_limit import AdmissionControl
+from serialization import JSONDecodeError, dumps, loads
+from tasks import BackgroundTaskSupervisor
+from telegram_scheduler import TelegramCallScheduler
+from webhook import WebhookUpdates
+from security import (
+    extract_user_from_init_data,
+    issue_session_token,
+    secrets_match,
+    verify_session_token,
+    verify_telegram_init_data,
+)
 
 
 logger = logging.getLogger(__name__)
 
-def _fire_and_forget(coro, *, label: str) -> None:
-    task = asyncio.create_task(coro)
+BATCH_MAX_QUERIES = 8
+# При перегрузке записи первыми отказываем маршрутам, без которых пользователь легко обойдется пару секунд.
+# Счета и сессии не сбрасываем: это оплата и вход.
+SHEDDABLE_ROUTES = {
+    "/api/roulette/win",
+    "/api/leaderboard",
+    "/api/leaderboard/me",
+    "/api/history",
+    "/api/batch",
+    "/api/gifts/deliveries/{delivery_id}",
+}
 
-    def _log_result(done_task: asyncio.Task) -> None:
-        try:
-            done_task.result()
-        except Exception:
-            logger.exception("background_task_failed", extra={"label": label})
 
-    task.add_done_callback(_log_result)
+async def _upsert_user_in_background(app: web.Application, user: dict, *, label: str) -> None:
+    # Повторные обновления профиля одного пользователя, еще ждущие в очереди, схлопываются в одно.
+    await app["background_tasks"].submit(app["db"].upsert_user(user), label=label, key=("upsert_user", user.get("id")))
+
+
+def _json_response(data, *, status: int = 200, headers: dict | None = None) -> web.Response:
+    return web.Response(body=dumps(data), status=status, content_type="application/json", headers=headers)
 
 
 def _json_error(error: str, status: int) -> web.Response:
-    return web.json_response({"error": error}, status=status)
+    return _json_response({"error": error}, status=status)
+
+
+async def _read_json(request: web.Request):
+    if "json_body" not in request:
+        request["json_body"] = loads(await request.read())
+    return request["json_body"]
 
 
 async def create_stars_invoice(bot: Bot, amount: int, user_id: int) -> str:
@@ -58,31 +124,34 @@ def _resolve_init_data(
     return None, "missing"
 
 
-async def _create_invoice_response(
-    *,
-    app: web.Application,
-    amount: int,
-    init_data: str | None,
-    x_telegram_init_data: str | None,
-) -> web.Response:
-    effective_init_data, init_data_source = _resolve_init_data(init_data, x_telegram_init_data)
+def authenticated(handler):
+    handler.requires_auth = True
+    return handler
 
-    logger.info(
-        "invoice_request_received",
-        extra={
-            "amount": amount,
-            "has_init_data": bool(effective_init_data),
-            "init_data_source": init_data_source,
-        },
-    )
 
-    if amount not in ALLOWED_PRICES:
-        logger.warning("invoice_request_invalid_amount", extra={"amount": amount})
-        return _json_error("invalid_amount", 400)
+async def _authenticate(request: web.Request) -> tuple[dict | None, str]:
+    authorization = request.headers.get("Authorization", "")
+    if authorization.startswith("Bearer "):
+        return verify_session_token(authorization.removeprefix("Bearer "), BOT_TOKEN), "session"
+
+    # EventSource не умеет передавать заголовки, поэтому токен сессии принимается и в query.
+    session_token = request.query.get("token")
+    if session_token:
+        return verify_session_token(session_token, BOT_TOKEN), "session"
+
+    init_data = request.query.get("init_data")
+    x_telegram_init_data = request.headers.get("X-Telegram-Init-Data")
+    if not x_telegram_init_data and not init_data and request.method == "POST":
+        try:
+            payload = await _read_json(request)
+        except JSONDecodeError:
+            payload = None
+        if isinstance(payload, dict) and isinstance(payload.get("init_data"), str):
+            init_data = payload["init_data"]
 
+    effective_init_data, init_data_source = _resolve_init_data(init_data, x_telegram_init_data)
     if not effective_init_data:
-        logger.warning("invoice_request_missing_init_data")
-        return _json_error("invalid_init_data", 401)
+        return None, init_data_source
 
     parsed_init_data = verify_telegram_init_data(
         effective_init_data,
@@ -90,26 +159,253 @@ async def _create_invoice_response(
         INIT_DATA_MAX_AGE_SECONDS,
     )
     if not parsed_init_data:
-        logger.warning("invoice_request_invalid_init_data")
-        return _json_error("invalid_init_data", 401)
+        return None, init_data_source
+
+    # По auth_date ограничивается срок токена сессии, выданного в обмен на эту initData.
+    request["init_data_auth_date"] = int(parsed_init_data["auth_date"])
+    return extract_user_from_init_data(parsed_init_data), init_data_source
+
 
-    user = extract_user_from_init_data(parsed_init_data)
+@web.middleware
+async def auth_middleware(request: web.Request, handler):
+    if not getattr(handler, "requires_auth", False):
+        return await handler(request)
+
+    user, auth_source = await _authenticate(request)
     if not user:
-        logger.warning("invoice_request_user_missing_in_init_data")
-        return _json_error("invalid_init_data", 401)
+        logger.warning("auth_failed", extra={"path": request.path, "auth_source": auth_source})
+        return _json_error("invalid_session_token" if auth_source == "session" else "invalid_init_data", 401)
 
+    request["user"] = user
+    request["auth_source"] = auth_source
+    return await handler(request)
+
+
+def _route_key(request: web.Request) -> str:
+    resource = request.match_info.route.resource
+    # Неизвестные пути сводим к одному ключу, иначе сканеры раздуют метрики и корзины лимитов.
+    return resource.canonical if resource is not None else "unmatched"
+
+
+def _too_many_requests(error: str, status: int, retry_after: float) -> web.Response:
+    response = _json_error(error, status)
+    response.headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+@web.middleware
+async def metrics_middleware(request: web.Request, handler):
+    started_at = time.perf_counter()
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as exc:
+        status = exc.status
+        raise
+    finally:
+        HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - started_at,
+            request.method,
+            _route_key(request),
+            str(status),
+        )
+
+
+def _app_metric_families(app: web.Application):
     db = app["db"]
+    yield "stargifter_db_write_queue_depth", "gauge", "Writes waiting for the group commit.", (), [((), db.write_queue_depth)]
+    yield "stargifter_db_read_queue_depth", "gauge", "Reads waiting for a reader thread.", (), [((), db.read_queue_depth)]
+    yield (
+        "stargifter_db_profile_cache_total",
+        "counter",
+        "Profile cache lookups on user upsert.",
+        ("result",),
+        [(("hit",), db.profile_cache_hits), (("miss",), db.profile_cache_misses)],
+    )
+
+    tasks: BackgroundTaskSupervisor = app["background_tasks"]
+    yield (
+        "stargifter_background_tasks",
+        "gauge",
+        "Background tasks currently queued or running.",
+        ("state",),
+        [(("queued",), tasks.queued), (("running",), tasks.running)],
+    )
+    yield (
+        "stargifter_background_tasks_total",
+        "counter",
+        "Background tasks by outcome.",
+        ("outcome",),
+        [
+            (("submitted",), tasks.submitted),
+            (("completed",), tasks.completed),
+            (("coalesced",), tasks.coalesced),
+            (("dropped",), tasks.dropped),
+            (("failed",), tasks.failed),
+        ],
+    )
+
+    deliveries: GiftDeliveryWorkers = app["gift_delivery"]
+    yield (
+        "stargifter_gift_deliveries_total",
+        "counter",
+        "Gift delivery attempts by outcome.",
+        ("outcome",),
+        [(("delivered",), deliveries.delivered), (("retried",), deliveries.retried), (("failed",), deliveries.failed)],
+    )
+
+    invoice_links: InvoiceLinkCache | None = app["invoice_links"]
+    if invoice_links is not None:
+        yield (
+            "stargifter_invoice_link_cache_total",
+            "counter",
+            "Invoice link cache lookups.",
+            ("result",),
+            [(("hit",), invoice_links.hits), (("miss",), invoice_links.misses)],
+        )
+
+    scheduler: TelegramCallScheduler | None = app["telegram_scheduler"]
+    if scheduler is not None:
+        yield (
+            "stargifter_telegram_queue_depth",
+            "gauge",
+            "Bot API calls waiting for a global rate limit token, by priority.",
+            ("priority",),
+            [((priority,), depth) for priority, depth in scheduler.queue_depths().items()],
+        )
+        yield "stargifter_telegram_calls_total", "counter", "Bot API calls sent by the scheduler, retries included.", (), [((), scheduler.calls)]
+        yield "stargifter_telegram_retries_total", "counter", "Bot API calls retried after a 429.", (), [((), scheduler.retries)]
+
+    admission: AdmissionControl | None = app["admission"]
+    if admission is not None:
+        yield (
+            "stargifter_requests_rejected_total",
+            "counter",
+            "API requests rejected by admission control.",
+            ("reason",),
+            [(("rate_limited",), admission.rate_limited), (("shed",), admission.shed)],
+        )
+
+    webhook: WebhookUpdates | None = app["webhook"]
+    if webhook is not None:
+        yield (
+            "stargifter_webhook_updates_total",
+            "counter",
+            "Webhook updates by outcome.",
+            ("outcome",),
+            [(("received",), webhook.received), (("failed",), webhook.failed)],
+        )
+        yield "stargifter_webhook_updates_in_flight", "gauge", "Webhook updates being processed.", (), [((), webhook.in_flight)]
+
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    if METRICS_TOKEN:
+        authorization = request.headers.get("Authorization", "")
+        if not secrets_match(f"Bearer {METRICS_TOKEN}", authorization):
+            return web.Response(status=401)
+
+    body = REGISTRY.render([lambda: _app_metric_families(request.app)])
+    return web.Response(
+        body=body.encode(),
+        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8", "Cache-Control": "no-store"},
+    )
+
+
+async def handle_slow_requests(request: web.Request) -> web.Response:
+    profiler: RequestProfiler = request.app["profiler"]
+    if not profiler.authorized(request):
+        return _json_error("forbidden", 403)
+
+    try:
+        limit = max(1, min(int(request.query.get("limit", "20")), 200))
+    except ValueError:
+        return _json_error("invalid_limit", 400)
+
+    return _json_response({"requests": profiler.slowest(limit), "profiled": profiler.profiled})
+
+
+@web.middleware
+async def load_shedding_middleware(request: web.Request, handler):
+    admission: AdmissionControl | None = request.app.get("admission")
+    if admission is None or _route_key(request) not in SHEDDABLE_ROUTES:
+        return await handler(request)
+
+    # Проверка стоит до авторизации, чтобы при перегрузке не тратить время даже на HMAC.
+    # Отложенные upsert из очереди фоновых задач — это те же записи, только еще не дошедшие до базы.
+    write_queue_depth = request.app["db"].write_queue_depth
+    background_queue_depth = request.app["background_tasks"].queued
+    if admission.should_shed(write_queue_depth + background_queue_depth):
+        logger.warning(
+            "request_shed",
+            extra={
+                "path": request.path,
+                "write_queue_depth": write_queue_depth,
+                "background_queue_depth": background_queue_depth,
+            },
+        )
+        return _too_many_requests("overloaded", 503, 1)
+
+    return await handler(request)
+
+
+@web.middleware
+async def rate_limit_middleware(request: web.Request, handler):
+    admission: AdmissionControl | None = request.app.get("admission")
+    if admission is None or "user" not in request:
+        return await handler(request)
+
+    route = _route_key(request)
+    retry_after = admission.admit(route, int(request["user"]["id"]))
+    if retry_after > 0:
+        logger.warning("request_rate_limited", extra={"path": route, "user_id": request["user"]["id"]})
+        return _too_many_requests("rate_limited", 429, retry_after)
+
+    return await handler(request)
+
+
+async def _create_invoice_response(
+    *,
+    app: web.Application,
+    amount: int,
+    user: dict,
+    auth_source: str | None = None,
+) -> web.Response:
+    if should_log(logger, "invoice_request_received"):
+        logger.info(
+            "invoice_request_received",
+            extra={
+                "amount": amount,
+                "user_id": user.get("id"),
+                "auth_source": auth_source,
+            },
+        )
+
+    if amount not in ALLOWED_PRICES:
+        logger.warning("invoice_request_invalid_amount", extra={"amount": amount})
+        return _json_error("invalid_amount", 400)
+
     bot = app["bot"]
 
-    _fire_and_forget(db.upsert_user(user), label="upsert_user_invoice")
+    await _upsert_user_in_background(app, user, label="upsert_user_invoice")
 
+    invoice_links: InvoiceLinkCache | None = app.get("invoice_links")
+    user_id = int(user["id"])
     try:
-        invoice_link = await create_stars_invoice(bot, amount, int(user["id"]))
+        if invoice_links is None:
+            invoice_link = await create_stars_invoice(bot, amount, user_id)
+        else:
+            invoice_link = await invoice_links.get_or_create(
+                amount,
+                user_id,
+                lambda: create_stars_invoice(bot, amount, user_id),
+            )
     except Exception:
         logger.exception("invoice_creation_failed", extra={"user_id": user.get("id"), "amount": amount})
         return _json_error("invoice_creation_failed", 500)
 
-    return web.json_response(
+    return _json_response(
         {
             "invoice_link": invoice_link,
             "invoiceLink": invoice_link,
@@ -117,10 +413,9 @@ async def _create_invoice_response(
     )
 
 
+@authenticated
 async def handle_invoice_get(request: web.Request) -> web.Response:
     amount_raw = request.query.get("amount")
-    init_data = request.query.get("init_data")
-    x_telegram_init_data = request.headers.get("X-Telegram-Init-Data")
 
     if amount_raw is None:
         return _json_error("invalid_amount", 400)
@@ -133,170 +428,312 @@ async def handle_invoice_get(request: web.Request) -> web.Response:
     return await _create_invoice_response(
         app=request.app,
         amount=amount,
-        init_data=init_data,
-        x_telegram_init_data=x_telegram_init_data,
+        user=request["user"],
+        auth_source=request.get("auth_source"),
     )
 
 
-
-
-async def handle_leaderboard(request: web.Request) -> web.Response:
-    init_data = request.query.get("init_data")
-    x_telegram_init_data = request.headers.get("X-Telegram-Init-Data")
-    effective_init_data, _ = _resolve_init_data(init_data, x_telegram_init_data)
-
-    if not effective_init_data:
+@authenticated
+async def handle_session(request: web.Request) -> web.Response:
+    if request["auth_source"] == "session":
         return _json_error("invalid_init_data", 401)
 
-    parsed_init_data = verify_telegram_init_data(
-        effective_init_data,
+    user = request["user"]
+    # Токен не должен жить дольше initData, из которой получен.
+    token, expires_at = issue_session_token(
+        user,
         BOT_TOKEN,
-        INIT_DATA_MAX_AGE_SECONDS,
+        SESSION_TOKEN_TTL_SECONDS,
+        not_after=request["init_data_auth_date"] + INIT_DATA_MAX_AGE_SECONDS,
+    )
+    await _upsert_user_in_background(request.app, user, label="upsert_user_session")
+
+    return _json_response(
+        {
+            "token": token,
+            "expires_at": expires_at,
+            "expiresAt": expires_at,
+        }
     )
-    if not parsed_init_data:
-        return _json_error("invalid_init_data", 401)
 
-    user = extract_user_from_init_data(parsed_init_data)
-    if not user:
-        return _json_error("invalid_init_data", 401)
 
-    limit_raw = request.query.get("limit", "50")
-    offset_raw = request.query.get("offset", "0")
+class _QueryError(Exception):
+    def __init__(self, error: str, status: int = 400) -> None:
+        super().__init__(error)
+        self.error = error
+        self.status = status
 
+
+def _parse_pagination(params, *, default_limit: int, cursor_types: tuple[type, ...]) -> tuple[int, int, tuple | None]:
     try:
-        limit = int(limit_raw)
-        offset = int(offset_raw)
-    except ValueError:
-        return _json_error("invalid_pagination", 400)
+        limit = int(params.get("limit", default_limit))
+        offset = int(params.get("offset", 0))
+    except (TypeError, ValueError):
+        raise _QueryError("invalid_pagination")
 
-    if limit < 1 or limit > 100 or offset < 0:
-        return _json_error("invalid_pagination", 400)
+    if limit < 1 or limit > 100 or not 0 <= offset <= SQLITE_MAX_INTEGER:
+        raise _QueryError("invalid_pagination")
 
-    _fire_and_forget(request.app["db"].upsert_user(user), label="upsert_user_leaderboard")
-    leaderboard = await request.app["db"].get_leaderboard(limit=limit, offset=offset)
-    return web.json_response(
-        {
-            "leaderboard": leaderboard,
-            "pagination": {
-                "limit": limit,
-                "offset": offset,
-            },
-        }
+    cursor_raw = params.get("cursor")
+    if not cursor_raw:
+        return limit, offset, None
+
+    after = decode_cursor(cursor_raw, cursor_types) if isinstance(cursor_raw, str) else None
+    if after is None:
+        raise _QueryError("invalid_cursor")
+
+    return limit, offset, after
+
+
+def _parse_radius(params) -> int:
+    try:
+        radius = int(params.get("radius", 2))
+    except (TypeError, ValueError):
+        raise _QueryError("invalid_radius")
+
+    if radius < 0 or radius > 50:
+        raise _QueryError("invalid_radius")
+
+    return radius
+
+
+def _pagination(limit: int, offset: int, next_cursor: str | None) -> dict:
+    return {
+        "limit": limit,
+        "offset": offset,
+        "next_cursor": next_cursor,
+        "nextCursor": next_cursor,
+    }
+
+
+async def _leaderboard_page(db, limit: int, offset: int, after: tuple | None) -> dict:
+    leaderboard = await db.get_leaderboard(limit=limit, offset=offset, after=after)
+    next_cursor = (
+        encode_cursor(leaderboard[-1]["spentStars"], leaderboard[-1]["userId"]) if len(leaderboard) == limit else None
     )
+    return {"leaderboard": leaderboard, "pagination": _pagination(limit, offset, next_cursor)}
+
+
+async def _history_page(db, user_id: int, limit: int, offset: int, after: tuple | None) -> dict:
+    history = await db.get_action_history(user_id=user_id, limit=limit, offset=offset, after=after)
+    next_cursor = encode_cursor(history[-1]["occurredAt"], history[-1]["id"]) if len(history) == limit else None
+    return {"history": history, "pagination": _pagination(limit, offset, next_cursor)}
+
+
+async def _leaderboard_rank(db, user_id: int, radius: int) -> dict:
+    rank = await db.get_leaderboard_rank(user_id, radius=radius)
+    if rank is None:
+        raise _QueryError("user_not_found", 404)
+    return rank
+
+
+def _gift_catalog() -> dict:
+    return {"gifts": [{"giftId": gift_key, "giftName": gift["name"]} for gift_key, gift in TELEGRAM_GIFTS.items()]}
 
 
+@authenticated
+async def handle_leaderboard(request: web.Request) -> web.Response:
+    user = request["user"]
+
+    try:
+        limit, offset, after = _parse_pagination(request.query, default_limit=50, cursor_types=(int, int))
+    except _QueryError as exc:
+        return _json_error(exc.error, exc.status)
+
+    await _upsert_user_in_background(request.app, user, label="upsert_user_leaderboard")
+
+    page_cache: LeaderboardPageCache | None = request.app.get("leaderboard_pages")
+    page_key = (limit, offset, after)
+    page = page_cache.get(page_key) if page_cache is not None else None
+    if page is None:
+        generation = page_cache.generation if page_cache is not None else 0
+        body = dumps(await _leaderboard_page(request.app["db"], limit, offset, after))
+        if page_cache is None:
+            return web.Response(body=body, content_type="application/json")
+
+        # Страница по курсору зависит от позиции курсора, поэтому сбрасываем ее при любом изменении.
+        page = page_cache.put(
+            page_key,
+            body,
+            first_position=offset if after is None else 0,
+            last_position=offset + limit - 1 if after is None else math.inf,
+            generation=generation,
+        )
+
+    headers = {"ETag": page.etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("If-None-Match", "")
+    if if_none_match == "*" or page.etag in (tag.strip() for tag in if_none_match.split(",")):
+        return web.Response(status=304, headers=headers)
+
+    return web.Response(body=page.body, content_type="application/json", headers=headers)
+
+
+@authenticated
+async def handle_leaderboard_me(request: web.Request) -> web.Response:
+    user = request["user"]
+
+    try:
+        radius = _parse_radius(request.query)
+        await request.app["db"].upsert_user(user)
+        rank = await _leaderboard_rank(request.app["db"], int(user["id"]), radius)
+    except _QueryError as exc:
+        return _json_error(exc.error, exc.status)
+
+    return _json_response(rank)
+
+
+@authenticated
 async def handle_action_history(request: web.Request) -> web.Response:
-    init_data = request.query.get("init_data")
-    x_telegram_init_data = request.headers.get("X-Telegram-Init-Data")
-    effective_init_data, _ = _resolve_init_data(init_data, x_telegram_init_data)
+    user = request["user"]
 
-    if not effective_init_data:
-        return _json_error("invalid_init_data", 401)
+    try:
+        limit, offset, after = _parse_pagination(request.query, default_limit=100, cursor_types=(str, int))
+    except _QueryError as exc:
+        return _json_error(exc.error, exc.status)
 
-    parsed_init_data = verify_telegram_init_data(
-        effective_init_data,
-        BOT_TOKEN,
-        INIT_DATA_MAX_AGE_SECONDS,
-    )
-    if not parsed_init_data:
-        return _json_error("invalid_init_data", 401)
+    await _upsert_user_in_background(request.app, user, label="upsert_user_history")
+    return _json_response(await _history_page(request.app["db"], int(user["id"]), limit, offset, after))
 
-    user = extract_user_from_init_data(parsed_init_data)
-    if not user:
-        return _json_error("invalid_init_data", 401)
 
-    limit_raw = request.query.get("limit", "100")
-    offset_raw = request.query.get("offset", "0")
+async def _run_batch_query(app: web.Application, user: dict, query) -> dict:
+    query_type = query.get("type") if isinstance(query, dict) else None
+    db = app["db"]
 
     try:
-        limit = int(limit_raw)
-        offset = int(offset_raw)
-    except ValueError:
-        return _json_error("invalid_pagination", 400)
+        if query_type == "leaderboard":
+            data = await _leaderboard_page(db, *_parse_pagination(query, default_limit=50, cursor_types=(int, int)))
+        elif query_type == "history":
+            data = await _history_page(
+                db,
+                int(user["id"]),
+                *_parse_pagination(query, default_limit=100, cursor_types=(str, int)),
+            )
+        elif query_type == "me":
+            data = await _leaderboard_rank(db, int(user["id"]), _parse_radius(query))
+        elif query_type == "gifts":
+            data = _gift_catalog()
+        else:
+            raise _QueryError("invalid_query_type")
+    except _QueryError as exc:
+        return {"type": query_type if isinstance(query_type, str) else None, "status": exc.status, "error": exc.error}
+
+    return {"type": query_type, "status": 200, "data": data}
+
+
+@authenticated
+async def handle_batch(request: web.Request) -> web.Response:
+    try:
+        payload = await _read_json(request)
+    except JSONDecodeError:
+        return _json_error("invalid_json", 400)
 
-    if limit < 1 or limit > 100 or offset < 0:
-        return _json_error("invalid_pagination", 400)
+    queries = payload.get("queries") if isinstance(payload, dict) else None
+    if not isinstance(queries, list) or not queries or len(queries) > BATCH_MAX_QUERIES:
+        return _json_error("invalid_batch", 400)
 
-    _fire_and_forget(request.app["db"].upsert_user(user), label="upsert_user_history")
-    history = await request.app["db"].get_action_history(user_id=int(user["id"]), limit=limit, offset=offset)
+    user = request["user"]
+    # Ранг нового пользователя появится только после записи профиля, поэтому для "me" ждем upsert.
+    if any(isinstance(query, dict) and query.get("type") == "me" for query in queries):
+        await request.app["db"].upsert_user(user)
+    else:
+        await _upsert_user_in_background(request.app, user, label="upsert_user_batch")
 
-    return web.json_response(
-        {
-            "history": history,
-            "pagination": {
-                "limit": limit,
-                "offset": offset,
-            },
+    results = await asyncio.gather(*(_run_batch_query(request.app, user, query) for query in queries))
+    return _json_response({"results": results})
+
+
+@authenticated
+async def handle_leaderboard_stream(request: web.Request) -> web.StreamResponse:
+    broadcaster: LeaderboardBroadcaster | None = request.app.get("leaderboard_stream")
+    if broadcaster is None:
+        return _json_error("stream_unavailable", 503)
+
+    response = web.StreamResponse(
+        headers={
+            "Content-Type": "text/event-stream",
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
         }
     )
+    _apply_cors_headers(response)
+    await response.prepare(request)
+
+    with broadcaster.subscribe() as subscription:
+        try:
+            await response.write(b"retry: 3000\n\n")
+            while True:
+                try:
+                    message = await asyncio.wait_for(subscription.get(), LEADERBOARD_STREAM_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    message = b": keepalive\n\n"
+
+                if message is None:
+                    break
+                await response.write(message)
+        except ConnectionResetError:
+            pass
+
+    return response
 
 
+@authenticated
 async def handle_roulette_win(request: web.Request) -> web.Response:
     try:
-        payload = await request.json()
-    except json.JSONDecodeError:
+        payload = await _read_json(request)
+    except JSONDecodeError:
         return _json_error("invalid_json", 400)
 
+    if not isinstance(payload, dict):
+        return _json_error("invalid_json", 400)
+
+    user = request["user"]
     gift_key = payload.get("gift_key")
     spin_price = payload.get("spin_price")
-    init_data = payload.get("init_data")
-    x_telegram_init_data = request.headers.get("X-Telegram-Init-Data")
 
     if not isinstance(gift_key, str) or not gift_key:
         return _json_error("invalid_gift_key", 400)
 
-    if init_data is not None and not isinstance(init_data, str):
-        return _json_error("invalid_init_data", 400)
-
     if spin_price is not None and (not isinstance(spin_price, int) or spin_price <= 0):
         return _json_error("invalid_spin_price", 400)
 
-    effective_init_data, _ = _resolve_init_data(init_data, x_telegram_init_data)
-    if not effective_init_data:
-        return _json_error("invalid_init_data", 401)
-
-    parsed_init_data = verify_telegram_init_data(
-        effective_init_data,
-        BOT_TOKEN,
-        INIT_DATA_MAX_AGE_SECONDS,
-    )
-    if not parsed_init_data:
-        return _json_error("invalid_init_data", 401)
-
-    user = extract_user_from_init_data(parsed_init_data)
-    if not user:
-        return _json_error("invalid_init_data", 401)
-
     gift = TELEGRAM_GIFTS.get(gift_key)
     if not gift:
         logger.warning("gift_not_supported", extra={"gift_key": gift_key})
         return _json_error("gift_not_supported", 400)
 
     await request.app["db"].upsert_user(user)
-
-    try:
-        await request.app["bot"].send_gift(user_id=int(user["id"]), gift_id=gift["gift_id"])
-    except Exception:
-        logger.exception("gift_send_failed", extra={"user_id": user.get("id"), "gift_key": gift_key, "gift_name": gift["name"]})
-        return _json_error("gift_send_failed", 500)
-
-    await request.app["db"].add_action_history(
-        user_id=int(user["id"]),
-        action_type="won",
-        gift_key=gift_key,
-        gift_name=gift["name"],
-        spin_price=spin_price,
-    )
-    await request.app["db"].add_action_history(
+    delivery_id = await request.app["db"].create_gift_delivery(
         user_id=int(user["id"]),
-        action_type="received",
         gift_key=gift_key,
+        gift_id=gift["gift_id"],
         gift_name=gift["name"],
         spin_price=spin_price,
     )
 
-    logger.info("gift_sent", extra={"user_id": user.get("id"), "gift_key": gift_key, "gift_name": gift["name"], "gift_id": gift["gift_id"]})
-    return web.json_response({"ok": True})
+    # Сам подарок отправят воркеры из очереди доставки, запрос не ждет Telegram.
+    gift_delivery: GiftDeliveryWorkers | None = request.app.get("gift_delivery")
+    if gift_delivery is not None:
+        gift_delivery.wake()
+
+    logger.info("gift_delivery_queued", extra={"user_id": user.get("id"), "gift_key": gift_key, "delivery_id": delivery_id})
+    return _json_response({"ok": True, "delivery_id": delivery_id, "deliveryId": delivery_id}, status=202)
+
+
+@authenticated
+async def handle_gift_delivery(request: web.Request) -> web.Response:
+    try:
+        delivery_id = int(request.match_info["delivery_id"])
+    except ValueError:
+        return _json_error("delivery_not_found", 404)
+    # Числа вне INTEGER SQLite драйвер не передает в запрос, а бросает OverflowError.
+    if not 1 <= delivery_id <= SQLITE_MAX_INTEGER:
+        return _json_error("delivery_not_found", 404)
+
+    delivery = await request.app["db"].get_gift_delivery(delivery_id, user_id=int(request["user"]["id"]))
+    if delivery is None:
+        return _json_error("delivery_not_found", 404)
+
+    return _json_response(delivery)
 
 
 @web.middleware
@@ -306,31 +743,174 @@ async def cors_middleware(request: web.Request, handler):
     else:
         response = await handler(request)
 
+    if not response.prepared:
+        _apply_cors_headers(response)
+    return response
+
+
+def _apply_cors_headers(response: web.StreamResponse) -> None:
     allow_origins = [origin.strip() for origin in (CORS_ALLOW_ORIGIN or "").split(",") if origin.strip()]
     response.headers["Access-Control-Allow-Origin"] = allow_origins[0] if allow_origins else "*"
     response.headers["Access-Control-Allow-Methods"] = "GET, POST, OPTIONS"
-    response.headers["Access-Control-Allow-Headers"] = "Content-Type, X-Telegram-Init-Data"
-    return response
+    response.headers["Access-Control-Allow-Headers"] = "Authorization, Content-Type, X-Telegram-Init-Data"
+
+
+async def _start_leaderboard_stream(app: web.Application) -> None:
+    app["leaderboard_stream"].start()
+
+
+async def _close_leaderboard_stream(app: web.Application) -> None:
+    await app["leaderboard_stream"].close()
+
+
+async def _start_gift_delivery(app: web.Application) -> None:
+    app["gift_delivery"].start()
+
+
+async def _stop_gift_delivery(app: web.Application) -> None:
+    await app["gift_delivery"].stop()
+
 
+async def _close_background_tasks(app: web.Application) -> None:
+    await app["background_tasks"].close()
 
-async def run_api_server(bot_instance, db_instance, host, port):
-    app = web.Application(middlewares=[cors_middleware])
+
+async def _close_webhook(app: web.Application) -> None:
+    await app["webhook"].close()
+
+
+def create_app(
+    bot_instance,
+    db_instance,
+    *,
+    invoice_links: InvoiceLinkCache | None = None,
+    telegram_scheduler: TelegramCallScheduler | None = None,
+    webhook: WebhookUpdates | None = None,
+    webhook_path: str = "/telegram/webhook",
+) -> web.Application:
+    middlewares = [cors_middleware, load_shedding_middleware, auth_middleware, rate_limit_middleware]
+    profiler = None
+    if PROFILING_ENABLED:
+        profiler = RequestProfiler(
+            PROFILING_DIR,
+            secret=PROFILING_SECRET,
+            mode=PROFILING_MODE,
+            sample_every=PROFILING_SAMPLE_EVERY,
+            max_files=PROFILING_MAX_FILES,
+        )
+        middlewares.insert(0, profiler.middleware)
+    if METRICS_ENABLED:
+        middlewares.insert(0, metrics_middleware)
+    app = web.Application(middlewares=middlewares)
+    app["profiler"] = profiler
     app["bot"] = bot_instance
     app["db"] = db_instance
+    app["invoice_links"] = invoice_links
+    app["telegram_scheduler"] = telegram_scheduler
+    app["admission"] = None
+    if RATE_LIMIT_ENABLED:
+        app["admission"] = AdmissionControl(
+            budgets={
+                "/api/roulette/win": (RATE_LIMIT_ROULETTE_PER_MINUTE, 5),
+                "/api/invoice": (RATE_LIMIT_INVOICE_PER_MINUTE, 5),
+            },
+            default_budget=(RATE_LIMIT_DEFAULT_PER_MINUTE, 20),
+            shed_queue_depth=LOAD_SHED_WRITE_QUEUE_DEPTH,
+        )
+    app["background_tasks"] = BackgroundTaskSupervisor(
+        max_concurrency=BACKGROUND_TASKS_MAX_CONCURRENCY,
+        max_queue=BACKGROUND_TASKS_MAX_QUEUE,
+        policy=BACKGROUND_TASKS_POLICY,
+    )
+    # on_cleanup срабатывает после завершения активных запросов, поэтому новых фоновых задач уже не будет.
+    app.on_cleanup.append(_close_background_tasks)
+    if invoice_links is not None:
+        # Оплата могла пройти в другом процессе: изменение spent_stars приходит через синхронизацию индекса,
+        # а без индекса — через опрос изменений пользователей.
+        if db_instance.leaderboard is not None:
+            db_instance.leaderboard.add_score_listener(invoice_links.invalidate_user)
+        else:
+            db_instance.add_user_change_listener(invoice_links.invalidate_user)
+    app["leaderboard_pages"] = None
+    app["leaderboard_stream"] = None
+    if db_instance.leaderboard is not None:
+        app["leaderboard_pages"] = LeaderboardPageCache()
+        db_instance.leaderboard.add_listener(app["leaderboard_pages"].invalidate)
+        app["leaderboard_stream"] = LeaderboardBroadcaster(
+            db_instance.leaderboard,
+            flush_interval=LEADERBOARD_STREAM_FLUSH_MS / 1000,
+            queue_size=LEADERBOARD_STREAM_QUEUE_SIZE,
+        )
+        app.on_startup.append(_start_leaderboard_stream)
+        app.on_shutdown.append(_close_leaderboard_stream)
+
+    app["gift_delivery"] = GiftDeliveryWorkers(
+        bot_instance,
+        db_instance,
+        workers=GIFT_DELIVERY_WORKERS,
+        max_attempts=GIFT_DELIVERY_MAX_ATTEMPTS,
+        retry_base_seconds=GIFT_DELIVERY_RETRY_BASE_SECONDS,
+        poll_interval=GIFT_DELIVERY_POLL_SECONDS,
+        lease_seconds=GIFT_DELIVERY_LEASE_SECONDS,
+    )
+    app.on_startup.append(_start_gift_delivery)
+    app.on_shutdown.append(_stop_gift_delivery)
+
+    app["webhook"] = webhook
+    if webhook is not None:
+        app.router.add_post(webhook_path, webhook.handle)
+        app.on_shutdown.append(_close_webhook)
 
     app.router.add_get("/api/invoice", handle_invoice_get)
+    app.router.add_post("/api/session", handle_session)
     app.router.add_get("/api/leaderboard", handle_leaderboard)
+    app.router.add_get("/api/leaderboard/me", handle_leaderboard_me)
+    app.router.add_get("/api/leaderboard/stream", handle_leaderboard_stream)
     app.router.add_get("/api/history", handle_action_history)
     app.router.add_post("/api/roulette/win", handle_roulette_win)
+    app.router.add_get("/api/gifts/deliveries/{delivery_id}", handle_gift_delivery)
+    app.router.add_post("/api/batch", handle_batch)
+    if METRICS_ENABLED:
+        app.router.add_get("/metrics", handle_metrics)
+    if profiler is not None:
+        app.router.add_get("/api/debug/slow-requests", handle_slow_requests)
 
     app.router.add_options("/api/invoice", lambda request: web.Response(status=204))
+    app.router.add_options("/api/session", lambda request: web.Response(status=204))
     app.router.add_options("/api/leaderboard", lambda request: web.Response(status=204))
+    app.router.add_options("/api/leaderboard/me", lambda request: web.Response(status=204))
     app.router.add_options("/api/history", lambda request: web.Response(status=204))
     app.router.add_options("/api/roulette/win", lambda request: web.Response(status=204))
+    app.router.add_options("/api/gifts/deliveries/{delivery_id}", lambda request: web.Response(status=204))
+    app.router.add_options("/api/batch", lambda request: web.Response(status=204))
+    return app
 
+
+async def run_api_server(
+    bot_instance,
+    db_instance,
+    host,
+    port,
+    *,
+    invoice_links: InvoiceLinkCache | None = None,
+    telegram_scheduler: TelegramCallScheduler | None = None,
+    webhook: WebhookUpdates | None = None,
+    webhook_path: str = "/telegram/webhook",
+    reuse_port: bool = False,
+) -> web.AppRunner:
+    app = create_app(
+        bot_instance,
+        db_instance,
+        invoice_links=invoice_links,
+        telegram_scheduler=telegram_scheduler,
+        webhook=webhook,
+        webhook_path=webhook_path,
+    )
     runner = web.AppRunner(app)
     await runner.setup()
-    site = web.TCPSite(runner, host, port)
+    # С reuse_port несколько процессов слушают один порт, ядро само распределяет соединения.
+    site = web.TCPSite(runner, host, port, reuse_port=reuse_port or None)
     await site.start()
 
-    logger.info("api_server_started", extra={"host": host, "port": port})
+    logger.info("api_server_started", extra={"host": host, "port": port, "reuse_port": reuse_port})
+    return runner
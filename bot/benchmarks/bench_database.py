@@ -0,0 +1,371 @@
+import argparse
+import asyncio
+import json
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from database import Database  # noqa: E402
+
+
+# Какой индекс и по каким столбцам должен обслуживать каждый запрос. План проверяется на сгенерированных данных,
+# потому что на пустых таблицах планировщик вправе выбрать полный просмотр. Для keyset-запросов важен поиск
+# по обоим столбцам курсора: поиск только по первому просматривает всю группу с равным значением.
+EXPECTED_PLANS = {
+    "leaderboard_page": ("idx_users_leaderboard",),
+    "leaderboard_keyset": (
+        "idx_users_leaderboard (spent_stars=? AND user_id>?)",
+        "idx_users_leaderboard (spent_stars<?)",
+    ),
+    "leaderboard_rank": ("idx_users_leaderboard",),
+    "history_page": ("idx_action_history_user_time (user_id=?)",),
+    "history_keyset": ("idx_action_history_user_time (user_id=? AND occurred_at<?)",),
+    "leaderboard_sync_poll": ("idx_users_updated_at",),
+    "gift_deliveries_due": ("idx_gift_deliveries_due",),
+    "claim_gift_deliveries": ("idx_gift_deliveries_due",),
+}
+FORBIDDEN_PLAN_STEPS = ("USE TEMP B-TREE", "SCAN action_history", "SCAN gift_deliveries")
+# Выборка по двум статусам идет через MULTI-INDEX OR и сортирует только просроченные доставки, а их немного.
+ALLOWED_PLAN_STEPS = {"claim_gift_deliveries": ("USE TEMP B-TREE",)}
+# Глубокая keyset-страница должна быть заметно быстрее той же страницы через OFFSET, иначе курсор ничего не дает.
+KEYSET_MIN_SPEEDUP = 2.0
+# На малых объемах OFFSET сам укладывается в миллисекунду, и разница тонет в накладных расходах запроса:
+# ниже этого числа пользователей нарушение только выводится как предупреждение.
+KEYSET_SPEEDUP_MIN_USERS = 200_000
+
+
+def generate(path: Path, *, users: int, history: int, heavy_users: int, seed: int) -> None:
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA cache_size=-200000")
+    random.seed(seed)
+
+    # Индексы строятся после загрузки: так генерация 10M строк занимает минуты, а не десятки минут.
+    conn.execute("DROP INDEX IF EXISTS idx_users_leaderboard")
+    conn.execute("DROP INDEX IF EXISTS idx_users_updated_at")
+    conn.execute("DROP INDEX IF EXISTS idx_action_history_user_time")
+    with conn:
+        conn.execute(
+            """
+            WITH RECURSIVE seq(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < ?)
+            INSERT INTO users (user_id, username, first_name, photo_url, spent_stars, updated_at)
+            SELECT
+                100000 + n,
+                'user_' || n,
+                'User',
+                'https://t.me/i/userpic/320/user_' || n || '.jpg',
+                CASE WHEN n % 4 = 0 THEN abs(random()) % 50000 ELSE 0 END,
+                datetime('2026-01-01', '+' || (n % 86400) || ' seconds')
+            FROM seq
+            """,
+            (users,),
+        )
+        # Треть истории приходится на нескольких «тяжелых» пользователей, остальное размазано по всем.
+        conn.execute(
+            """
+            WITH RECURSIVE seq(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < ?)
+            INSERT INTO action_history (user_id, action_type, gift_key, gift_name, spin_price, occurred_at)
+            SELECT
+                CASE WHEN n % 3 = 0 THEN 100001 + n % ? ELSE 100001 + abs(random()) % ? END,
+                CASE WHEN n % 2 = 0 THEN 'won' ELSE 'received' END,
+                'rose',
+                'Rose',
+                50,
+                datetime('2026-01-01', '+' || (n / 4) || ' seconds')
+            FROM seq
+            """,
+            (history, heavy_users, users),
+        )
+        # Очередь доставки в основном состоит из завершенных записей, ожидающих — единицы процентов.
+        conn.execute(
+            """
+            WITH RECURSIVE seq(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < ?)
+            INSERT INTO gift_deliveries (user_id, gift_key, gift_id, gift_name, status, attempts, next_attempt_at)
+            SELECT
+                100001 + abs(random()) % ?,
+                'rose',
+                '5168103777563050263',
+                'Rose',
+                CASE WHEN n % 50 = 0 THEN 'pending' ELSE 'delivered' END,
+                1,
+                unixepoch('2026-01-01') + n
+            FROM seq
+            """,
+            (max(1, history // 100), users),
+        )
+    conn.close()
+
+
+async def _timed(fn, iterations: int) -> dict:
+    samples = []
+    for _ in range(iterations):
+        started_at = time.perf_counter()
+        await fn()
+        samples.append(time.perf_counter() - started_at)
+    samples.sort()
+    return {
+        "iterations": iterations,
+        "mean_ms": round(statistics.fmean(samples) * 1000, 4),
+        "p50_ms": round(samples[len(samples) // 2] * 1000, 4),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 4),
+    }
+
+
+async def _throughput(make_call, *, concurrency: int, operations: int) -> dict:
+    remaining = operations
+    latencies = []
+
+    async def _worker() -> None:
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            started_at = time.perf_counter()
+            await make_call()
+            latencies.append(time.perf_counter() - started_at)
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(_worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started_at
+    latencies.sort()
+    return {
+        "operations": operations,
+        "concurrency": concurrency,
+        "ops_per_second": round(operations / elapsed, 1),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 4),
+        "p95_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 4),
+    }
+
+
+def _traced(conn: sqlite3.Connection, call) -> list[str]:
+    statements: list[str] = []
+    conn.set_trace_callback(statements.append)
+    try:
+        call()
+    finally:
+        conn.set_trace_callback(None)
+    return [statement for statement in statements if statement.lstrip().upper().startswith(("SELECT", "UPDATE", "WITH"))]
+
+
+def query_plans(db: Database, heavy_user: int, deep_offset: int) -> dict[str, list[str]]:
+    conn = sqlite3.connect(db.path)
+    conn.row_factory = sqlite3.Row
+    middle = db._get_leaderboard_sync(conn, 1, deep_offset)[0]
+    newest = db._get_action_history_sync(conn, heavy_user, 1, 0)[0]
+    db._sync_watermark = "2026-01-01 23:00:00"
+    db._sync_data_version = None
+
+    calls = {
+        "leaderboard_page": lambda: db._get_leaderboard_sync(conn, 100, deep_offset),
+        "leaderboard_keyset": lambda: db._get_leaderboard_sync(conn, 100, 0, (middle["spentStars"], middle["userId"])),
+        "leaderboard_rank": lambda: db._get_leaderboard_rank_sync(conn, middle["userId"], 2),
+        "history_page": lambda: db._get_action_history_sync(conn, heavy_user, 50, 0),
+        "history_keyset": lambda: db._get_action_history_sync(conn, heavy_user, 50, 0, (newest["occurredAt"], newest["id"])),
+        "leaderboard_sync_poll": lambda: db._poll_leaderboard_changes_sync(conn),
+        "gift_deliveries_due": lambda: db._has_due_gift_deliveries_sync(conn, 120, time.time()),
+        "claim_gift_deliveries": lambda: db._claim_gift_deliveries_sync(conn, 10, 120, time.time()),
+    }
+
+    plans: dict[str, list[str]] = {}
+    try:
+        for name, call in calls.items():
+            steps = []
+            for statement in _traced(conn, call):
+                steps.extend(row["detail"] for row in conn.execute(f"EXPLAIN QUERY PLAN {statement}"))
+            plans[name] = steps
+        conn.rollback()
+    finally:
+        conn.close()
+    return plans
+
+
+def check_plans(plans: dict[str, list[str]]) -> list[str]:
+    problems = []
+    for name, indexes in EXPECTED_PLANS.items():
+        plan = " | ".join(plans.get(name, []))
+        for index in indexes:
+            if index not in plan:
+                problems.append(f"{name}: expected {index}, got: {plan}")
+        for step in FORBIDDEN_PLAN_STEPS:
+            if step in plan and step not in ALLOWED_PLAN_STEPS.get(name, ()):
+                problems.append(f"{name}: unexpected '{step}' in: {plan}")
+    return problems
+
+
+def check_timings(results: dict[str, dict]) -> list[str]:
+    offset_ms = results["leaderboard_offset_deep"]["p50_ms"]
+    keyset_ms = results["leaderboard_keyset_deep"]["p50_ms"]
+    if keyset_ms * KEYSET_MIN_SPEEDUP > offset_ms:
+        return [f"leaderboard_keyset_deep: p50 {keyset_ms}ms is not {KEYSET_MIN_SPEEDUP}x faster than OFFSET ({offset_ms}ms)"]
+    return []
+
+
+async def run(args: argparse.Namespace, path: Path) -> dict:
+    db = Database(path, leaderboard_index=False, profile_cache_size=0)
+    await db.init()
+    has_data = bool(await db.get_leaderboard(limit=1))
+    if has_data and not args.reuse:
+        await db.close()
+        raise SystemExit(f"{path} already has data; pass --reuse to benchmark it as is")
+
+    if not has_data:
+        await db.close()
+        started_at = time.perf_counter()
+        generate(path, users=args.users, history=args.history, heavy_users=args.heavy_users, seed=args.seed)
+        generate_seconds = time.perf_counter() - started_at
+        db = Database(path, leaderboard_index=False, profile_cache_size=0)
+        started_at = time.perf_counter()
+        await db.init()
+        generate_seconds += time.perf_counter() - started_at
+    else:
+        generate_seconds = None
+
+    heavy_user = 100001
+    deep_offset = args.users // 2
+    results: dict[str, dict] = {}
+    try:
+        plans = await asyncio.to_thread(query_plans, db, heavy_user, deep_offset)
+        problems = check_plans(plans)
+
+        middle = (await db.get_leaderboard(limit=1, offset=deep_offset))[0]
+        newest = (await db.get_action_history(user_id=heavy_user, limit=1))[0]
+        iterations = args.iterations
+        results["leaderboard_offset_0"] = await _timed(lambda: db.get_leaderboard(limit=100), iterations)
+        results["leaderboard_offset_10k"] = await _timed(lambda: db.get_leaderboard(limit=100, offset=10000), iterations)
+        results["leaderboard_offset_deep"] = await _timed(
+            lambda: db.get_leaderboard(limit=100, offset=deep_offset), max(3, iterations // 10)
+        )
+        results["leaderboard_keyset_deep"] = await _timed(
+            lambda: db.get_leaderboard(limit=100, after=(middle["spentStars"], middle["userId"])), iterations
+        )
+        results["leaderboard_rank_deep"] = await _timed(
+            lambda: db.get_leaderboard_rank(middle["userId"]), max(3, iterations // 10)
+        )
+        results["history_heavy_first_page"] = await _timed(lambda: db.get_action_history(user_id=heavy_user, limit=50), iterations)
+        results["history_heavy_offset_1000"] = await _timed(
+            lambda: db.get_action_history(user_id=heavy_user, limit=50, offset=1000), iterations
+        )
+        results["history_heavy_keyset"] = await _timed(
+            lambda: db.get_action_history(user_id=heavy_user, limit=50, after=(newest["occurredAt"], newest["id"])), iterations
+        )
+
+        hot_users = [100001 + index for index in range(10)]
+        results["add_spent_stars_contended"] = await _throughput(
+            lambda: db.add_spent_stars(random.choice(hot_users), 25),
+            concurrency=args.concurrency,
+            operations=args.write_operations,
+        )
+
+        churn = iter(range(10**9))
+        results["upsert_user_churn"] = await _throughput(
+            lambda: db.upsert_user(
+                {"id": 100001 + random.randrange(args.users), "username": f"renamed_{next(churn)}", "first_name": "User"}
+            ),
+            concurrency=args.concurrency,
+            operations=args.write_operations,
+        )
+
+        index_db = Database(path, profile_cache_size=0)
+        started_at = time.perf_counter()
+        await index_db.init()
+        index_load_seconds = time.perf_counter() - started_at
+        try:
+            results["index_leaderboard_offset_0"] = await _timed(lambda: index_db.get_leaderboard(limit=100), iterations)
+            results["index_leaderboard_offset_deep"] = await _timed(
+                lambda: index_db.get_leaderboard(limit=100, offset=deep_offset), iterations
+            )
+            results["index_leaderboard_rank_deep"] = await _timed(
+                lambda: index_db.get_leaderboard_rank(middle["userId"]), iterations
+            )
+        finally:
+            await index_db.close()
+    finally:
+        await db.close()
+
+    timing_problems = check_timings(results)
+    warnings = []
+    if args.users >= KEYSET_SPEEDUP_MIN_USERS:
+        problems.extend(timing_problems)
+    else:
+        warnings.extend(f"{problem} (not enforced below {KEYSET_SPEEDUP_MIN_USERS} users)" for problem in timing_problems)
+
+    return {
+        "commit": _git_commit(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "sqlite_version": sqlite3.sqlite_version,
+        "scale": {"users": args.users, "history": args.history, "heavy_users": args.heavy_users},
+        "generate_seconds": round(generate_seconds, 2) if generate_seconds is not None else None,
+        "index_load_seconds": round(index_load_seconds, 3),
+        "results": results,
+        "plans": plans,
+        "problems": problems,
+        "warnings": warnings,
+    }
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=Path(__file__).resolve().parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: dict, previous: dict) -> list[str]:
+    lines = [f"{'benchmark':<32}{'before':>12}{'after':>12}{'change':>10}"]
+    for name, result in current["results"].items():
+        before = previous.get("results", {}).get(name)
+        if before is None:
+            continue
+        metric = "ops_per_second" if "ops_per_second" in result else "p50_ms"
+        change = (result[metric] - before[metric]) / before[metric] * 100 if before[metric] else 0.0
+        lines.append(f"{name + ' (' + metric + ')':<32}{before[metric]:>12}{result[metric]:>12}{change:>+9.1f}%")
+    return lines
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark bot/database.py query paths on synthetic data.")
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--history", type=int, default=10_000_000)
+    parser.add_argument("--heavy-users", type=int, default=10)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--write-operations", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--db", type=Path, help="database file to create or reuse (default: a temporary file)")
+    parser.add_argument("--reuse", action="store_true", help="skip generation when --db already has data")
+    parser.add_argument("--output", type=Path, help="write results as JSON to this file")
+    parser.add_argument("--compare", type=Path, help="previous JSON results to compare against")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        report = asyncio.run(run(args, args.db or Path(tmp_dir) / "bench.db"))
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        args.output.write_text(text + "\n", encoding="utf-8")
+    print(text)
+    if args.compare:
+        print("\n".join(compare(report, json.loads(args.compare.read_text(encoding="utf-8")))))
+
+    for warning in report["warnings"]:
+        print(f"CHECK WARNING: {warning}", file=sys.stderr)
+    for problem in report["problems"]:
+        print(f"CHECK FAILED: {problem}", file=sys.stderr)
+    return 1 if report["problems"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
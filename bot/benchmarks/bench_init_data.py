@@ -0,0 +1,59 @@
+import json
+import sys
+import time
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import security  # noqa: E402
+
+
+BOT_TOKEN = "123456:bench-token"
+ITERATIONS = 20000
+
+
+def build_init_data(bot_token: str, user_id: int) -> str:
+    data = {
+        "auth_date": str(int(time.time())),
+        "query_id": "AAHdF6IQAAAAAN0XohDhrOrc",
+        "user": json.dumps(
+            {
+                "id": user_id,
+                "first_name": "Bench",
+                "last_name": "User",
+                "username": f"bench_{user_id}",
+                "language_code": "ru",
+                "photo_url": f"https://t.me/i/userpic/320/bench_{user_id}.jpg",
+            }
+        ),
+    }
+    return security.sign_init_data(data, bot_token)
+
+
+def _verify_and_extract(init_data: str) -> None:
+    parsed = security.verify_telegram_init_data(init_data, BOT_TOKEN, 86400)
+    assert security.extract_user_from_init_data(parsed) is not None
+
+
+def _verify_and_extract_uncached(init_data: str) -> None:
+    security._verified_init_data.clear()
+    security._secret_key.cache_clear()
+    security._parse_user.cache_clear()
+    _verify_and_extract(init_data)
+
+
+def main() -> None:
+    init_data = build_init_data(BOT_TOKEN, 777)
+
+    uncached = timeit.timeit(lambda: _verify_and_extract_uncached(init_data), number=ITERATIONS)
+    cached = timeit.timeit(lambda: _verify_and_extract(init_data), number=ITERATIONS)
+
+    print(f"init_data bytes: {len(init_data)}")
+    print(f"uncached: {uncached / ITERATIONS * 1e6:.2f} us/call")
+    print(f"cached:   {cached / ITERATIONS * 1e6:.2f} us/call")
+    print(f"speedup:  {uncached / cached:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
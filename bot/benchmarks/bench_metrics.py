@@ -0,0 +1,44 @@
+import sys
+import time
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import metrics  # noqa: E402
+
+
+ITERATIONS = 200000
+
+
+def main() -> None:
+    registry = metrics.MetricsRegistry()
+    histogram = registry.histogram("bench_seconds", "Bench latency.", ("method", "route", "status"))
+    counter = registry.counter("bench_total", "Bench counter.", ("method", "error"))
+    gauge = registry.gauge("bench_pending", "Bench gauge.")
+
+    def _timed_noop() -> None:
+        started_at = time.perf_counter()
+        histogram.observe(time.perf_counter() - started_at, "GET", "/api/leaderboard", "200")
+
+    baseline = timeit.timeit(time.perf_counter, number=ITERATIONS)
+    observe = timeit.timeit(lambda: histogram.observe(0.003, "GET", "/api/leaderboard", "200"), number=ITERATIONS)
+    timed = timeit.timeit(_timed_noop, number=ITERATIONS)
+    inc = timeit.timeit(lambda: counter.inc("SendGift", "TelegramBadRequest"), number=ITERATIONS)
+    gauge_inc = timeit.timeit(gauge.inc, number=ITERATIONS)
+
+    for route in range(20):
+        for status in ("200", "304", "400", "401", "429"):
+            histogram.observe(0.01, "GET", f"/api/route-{route}", status)
+    render = timeit.timeit(registry.render, number=200)
+
+    print(f"perf_counter:             {baseline / ITERATIONS * 1e9:8.0f} ns/call")
+    print(f"histogram.observe:        {observe / ITERATIONS * 1e9:8.0f} ns/call")
+    print(f"timed span (2 clocks):    {timed / ITERATIONS * 1e9:8.0f} ns/call")
+    print(f"counter.inc:              {inc / ITERATIONS * 1e9:8.0f} ns/call")
+    print(f"gauge.inc (locked):       {gauge_inc / ITERATIONS * 1e9:8.0f} ns/call")
+    print(f"render 100 series:        {render / 200 * 1e6:8.0f} us/scrape")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import json
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import serialization  # noqa: E402
+
+
+ITERATIONS = 5000
+
+
+def leaderboard_payload(size: int = 100) -> dict:
+    return {
+        "leaderboard": [
+            {
+                "userId": 100000 + position,
+                "username": f"player_{position}",
+                "firstName": "Игрок",
+                "lastName": None,
+                "photoUrl": f"https://t.me/i/userpic/320/player_{position}.jpg",
+                "spentStars": 100000 - position * 25,
+            }
+            for position in range(size)
+        ],
+        "pagination": {"limit": size, "offset": 0, "next_cursor": "WzI1MDAsMTAwMDk5XQ", "nextCursor": "WzI1MDAsMTAwMDk5XQ"},
+    }
+
+
+def history_payload(size: int = 100) -> dict:
+    return {
+        "history": [
+            {
+                "id": 500000 - position,
+                "type": "won" if position % 2 else "received",
+                "occurredAt": "2026-10-16 12:00:00",
+                "giftId": "teddy-bear",
+                "giftName": "Teddy Bear",
+                "spinPrice": 50,
+            }
+            for position in range(size)
+        ],
+        "pagination": {"limit": size, "offset": 0, "next_cursor": None, "nextCursor": None},
+    }
+
+
+def _stdlib_dumps(obj) -> bytes:
+    return json.dumps(obj).encode()
+
+
+def _measure(label: str, dumps, loads, payload: dict) -> None:
+    encoded = dumps(payload)
+    encode_us = timeit.timeit(lambda: dumps(payload), number=ITERATIONS) / ITERATIONS * 1e6
+    decode_us = timeit.timeit(lambda: loads(encoded), number=ITERATIONS) / ITERATIONS * 1e6
+    print(f"{label:<28} encode {encode_us:8.2f} us  decode {decode_us:8.2f} us  size {len(encoded)} B")
+
+
+def main() -> None:
+    print(f"serialization backend: {serialization.BACKEND}")
+    for name, payload in (("leaderboard", leaderboard_payload()), ("history", history_payload())):
+        _measure(f"{name} / stdlib json", _stdlib_dumps, json.loads, payload)
+        _measure(f"{name} / {serialization.BACKEND}", serialization.dumps, serialization.loads, payload)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,7 @@ from aiogram.utils.keyboard import InlineKeyboardBuilder
 
 from config import ALLOWED_PRICES, MINI_APP_BUTTON, MINI_APP_URL
 from database import Database
+from invoice_cache import InvoiceLinkCache
 from payments import parse_invoice_payload, validate_payment_request
 
 
@@ -71,7 +72,11 @@ async def process_pre_checkout_query(pre_checkout_query: types.PreCheckoutQuery)
     await pre_checkout_query.answer(ok=True)
 
 
-async def process_successful_payment(message: types.Message, db: Database) -> None:
+async def process_successful_payment(
+    message: types.Message,
+    db: Database,
+    invoice_links: InvoiceLinkCache | None = None,
+) -> None:
     successful_payment = message.successful_payment
     if not successful_payment:
         return
@@ -110,8 +115,12 @@ async def process_successful_payment(message: types.Message, db: Database) -> No
     )
     await db.add_spent_stars(payload["user_id"], payload["amount"])
 
+    # Оплаченная ссылка больше не нужна: следующий счет пользователя создается заново.
+    if invoice_links is not None:
+        invoice_links.invalidate_user(payload["user_id"])
 
-def register_bot_handlers(dp: Dispatcher, db: Database) -> None:
+
+def register_bot_handlers(dp: Dispatcher, db: Database, invoice_links: InvoiceLinkCache | None = None) -> None:
     @dp.message(CommandStart())
     async def handle_start(message: types.Message) -> None:
         await db.upsert_user(
@@ -135,4 +144,4 @@ def register_bot_handlers(dp: Dispatcher, db: Database) -> None:
 
     @dp.message(lambda message: message.successful_payment is not None)
     async def handle_successful_payment(message: types.Message) -> None:
-        await process_successful_payment(message, db)
+        await process_successful_payment(message, db, invoice_links)
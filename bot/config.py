@@ -27,8 +27,58 @@ MINI_APP_URL = os.getenv("MINI_APP_URL") or WEB_APP_URL
 MINI_APP_BUTTON = os.getenv("MINI_APP_BUTTON", "Открыть мини-приложение")
 API_HOST = os.getenv("API_HOST", "0.0.0.0")
 API_PORT = int(os.getenv("API_PORT", "8080"))
+API_WORKERS = int(os.getenv("API_WORKERS", "1"))
+SHUTDOWN_TIMEOUT_SECONDS = float(os.getenv("SHUTDOWN_TIMEOUT_SECONDS", "15"))
 DB_PATH = Path(os.getenv("DB_PATH", Path(__file__).with_name("app.db")))
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+DB_READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", "4"))
+DB_WRITE_BATCH_WINDOW_MS = int(os.getenv("DB_WRITE_BATCH_WINDOW_MS", "2"))
+DB_WRITE_BATCH_MAX = int(os.getenv("DB_WRITE_BATCH_MAX", "64"))
+LEADERBOARD_INDEX_ENABLED = os.getenv("LEADERBOARD_INDEX_ENABLED", "1") != "0"
+LEADERBOARD_SYNC_INTERVAL_MS = int(os.getenv("LEADERBOARD_SYNC_INTERVAL_MS", "250"))
+LEADERBOARD_STREAM_FLUSH_MS = int(os.getenv("LEADERBOARD_STREAM_FLUSH_MS", "500"))
+LEADERBOARD_STREAM_QUEUE_SIZE = int(os.getenv("LEADERBOARD_STREAM_QUEUE_SIZE", "16"))
+LEADERBOARD_STREAM_KEEPALIVE_SECONDS = int(os.getenv("LEADERBOARD_STREAM_KEEPALIVE_SECONDS", "15"))
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "10000"))
+PROFILE_CACHE_TTL_SECONDS = int(os.getenv("PROFILE_CACHE_TTL_SECONDS", "3600"))
 INIT_DATA_MAX_AGE_SECONDS = int(os.getenv("INIT_DATA_MAX_AGE_SECONDS", "86400"))
+SESSION_TOKEN_TTL_SECONDS = int(os.getenv("SESSION_TOKEN_TTL_SECONDS", "3600"))
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+# Без токена /metrics открыт всем на порту API, поэтому по умолчанию включаем его только вместе с токеном.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1" if METRICS_TOKEN else "0") != "0"
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") != "0"
+RATE_LIMIT_DEFAULT_PER_MINUTE = float(os.getenv("RATE_LIMIT_DEFAULT_PER_MINUTE", "120"))
+RATE_LIMIT_ROULETTE_PER_MINUTE = float(os.getenv("RATE_LIMIT_ROULETTE_PER_MINUTE", "30"))
+RATE_LIMIT_INVOICE_PER_MINUTE = float(os.getenv("RATE_LIMIT_INVOICE_PER_MINUTE", "20"))
+LOAD_SHED_WRITE_QUEUE_DEPTH = int(os.getenv("LOAD_SHED_WRITE_QUEUE_DEPTH", "512"))
+BACKGROUND_TASKS_MAX_CONCURRENCY = int(os.getenv("BACKGROUND_TASKS_MAX_CONCURRENCY", "8"))
+BACKGROUND_TASKS_MAX_QUEUE = int(os.getenv("BACKGROUND_TASKS_MAX_QUEUE", "1000"))
+BACKGROUND_TASKS_POLICY = os.getenv("BACKGROUND_TASKS_POLICY", "coalesce")
+GIFT_DELIVERY_WORKERS = int(os.getenv("GIFT_DELIVERY_WORKERS", "4"))
+GIFT_DELIVERY_MAX_ATTEMPTS = int(os.getenv("GIFT_DELIVERY_MAX_ATTEMPTS", "5"))
+GIFT_DELIVERY_RETRY_BASE_SECONDS = float(os.getenv("GIFT_DELIVERY_RETRY_BASE_SECONDS", "2"))
+GIFT_DELIVERY_POLL_SECONDS = float(os.getenv("GIFT_DELIVERY_POLL_SECONDS", "1"))
+GIFT_DELIVERY_LEASE_SECONDS = float(os.getenv("GIFT_DELIVERY_LEASE_SECONDS", "120"))
+INVOICE_LINK_CACHE_TTL_SECONDS = int(os.getenv("INVOICE_LINK_CACHE_TTL_SECONDS", "600"))
+BOT_WEBHOOK_URL = os.getenv("BOT_WEBHOOK_URL")
+BOT_WEBHOOK_PATH = os.getenv("BOT_WEBHOOK_PATH", "/telegram/webhook")
+BOT_WEBHOOK_SECRET = os.getenv("BOT_WEBHOOK_SECRET")
+BOT_WEBHOOK_MAX_CONCURRENCY = int(os.getenv("BOT_WEBHOOK_MAX_CONCURRENCY", "32"))
+TELEGRAM_API_SERVER = os.getenv("TELEGRAM_API_SERVER")
+TELEGRAM_GLOBAL_RATE_PER_SECOND = float(os.getenv("TELEGRAM_GLOBAL_RATE_PER_SECOND", "30"))
+TELEGRAM_CHAT_RATE_PER_SECOND = float(os.getenv("TELEGRAM_CHAT_RATE_PER_SECOND", "1"))
+TELEGRAM_CHAT_BURST = float(os.getenv("TELEGRAM_CHAT_BURST", "3"))
+TELEGRAM_RETRY_AFTER_MAX_RETRIES = int(os.getenv("TELEGRAM_RETRY_AFTER_MAX_RETRIES", "3"))
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+PROFILING_SECRET = os.getenv("PROFILING_SECRET")
+PROFILING_MODE = os.getenv("PROFILING_MODE", "cprofile")
+PROFILING_SAMPLE_EVERY = int(os.getenv("PROFILING_SAMPLE_EVERY", "0"))
+PROFILING_DIR = Path(os.getenv("PROFILING_DIR", Path(__file__).with_name("profiles")))
+PROFILING_MAX_FILES = int(os.getenv("PROFILING_MAX_FILES", "200"))
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "get_leaderboard_result=0.01,invoice_request_received=0.1")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
 CORS_ALLOW_ORIGIN = os.getenv("CORS_ALLOW_ORIGIN")
 ALLOWED_PRICES = {25, 50, 100}
 
@@ -41,3 +91,17 @@ def validate_config() -> None:
         raise RuntimeError(
             "WEB_APP_URL is not set. Add WEB_APP_URL or MINI_APP_URL to .env so the bot can open your domain."
         )
+
+    rates = {
+        "TELEGRAM_GLOBAL_RATE_PER_SECOND": TELEGRAM_GLOBAL_RATE_PER_SECOND,
+        "TELEGRAM_CHAT_RATE_PER_SECOND": TELEGRAM_CHAT_RATE_PER_SECOND,
+    }
+    if RATE_LIMIT_ENABLED:
+        rates.update(
+            RATE_LIMIT_DEFAULT_PER_MINUTE=RATE_LIMIT_DEFAULT_PER_MINUTE,
+            RATE_LIMIT_ROULETTE_PER_MINUTE=RATE_LIMIT_ROULETTE_PER_MINUTE,
+            RATE_LIMIT_INVOICE_PER_MINUTE=RATE_LIMIT_INVOICE_PER_MINUTE,
+        )
+    for name, rate in rates.items():
+        if not rate > 0:
+            raise RuntimeError(f"{name} must be greater than 0, got {rate}.")
@@ -1,56 +1,341 @@
 import asyncio
 import logging
+import queue
 import sqlite3
 import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
 from pathlib import Path
+from typing import Any, Callable
+
+from leaderboard import PROFILE_FIELDS, LeaderboardIndex
+from logging_setup import should_log
+from metrics import DB_EXECUTE_SECONDS, DB_THREAD_POOL_PENDING, DB_WAIT_SECONDS
 
 
 logger = logging.getLogger(__name__)
 
+ACTION_TYPES = {"won", "received"}
+HISTORY_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def _operation_name(fn: Callable[..., Any]) -> str:
+    return getattr(fn, "__name__", type(fn).__name__).removeprefix("_").removesuffix("_sync")
+
+
+def _history_timestamp(value: str | datetime | None, index: int) -> str | None:
+    # occurred_at хранится строкой CURRENT_TIMESTAMP (UTC), и по ней же сравнивается курсор истории.
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc)
+        return value.strftime(HISTORY_TIMESTAMP_FORMAT)
+
+    try:
+        datetime.strptime(value, HISTORY_TIMESTAMP_FORMAT)
+    except (TypeError, ValueError):
+        raise ValueError(f"rows[{index}]: occurred_at must be 'YYYY-MM-DD HH:MM:SS' in UTC, got {value!r}") from None
+    return value
+
+
+def _leaderboard_entry(row: sqlite3.Row) -> dict:
+    return {
+        "userId": row["user_id"],
+        "username": row["username"],
+        "firstName": row["first_name"],
+        "lastName": row["last_name"],
+        "photoUrl": row["photo_url"],
+        "spentStars": row["spent_stars"],
+    }
+
+
+def _set_future(future: asyncio.Future, ok: bool, value: Any) -> None:
+    if future.done():
+        return
+    if ok:
+        future.set_result(value)
+    elif isinstance(value, StopIteration):
+        # Future не принимает StopIteration: без замены исключение теряется в колбэке, а запрос ждет вечно.
+        future.set_exception(RuntimeError(f"database call raised {value!r}"))
+    else:
+        future.set_exception(value)
+
+
+class _ConnectionThreads:
+    # Свои потоки вместо общего пула цикла событий: соединение создается в потоке и используется только им,
+    # поэтому check_same_thread остается включенным, а чужие задачи в default executor не задерживают базу.
+    def __init__(self, name: str, size: int, connect: Callable[[], sqlite3.Connection]) -> None:
+        self.name = name
+        self.size = max(1, size)
+        self.connections = 0
+        self._connect = connect
+        self._jobs: queue.SimpleQueue = queue.SimpleQueue()
+        self._threads: list[threading.Thread] = []
+        self._stats_lock = threading.Lock()
+
+    @property
+    def queue_depth(self) -> int:
+        return self._jobs.qsize()
+
+    def submit(self, fn: Callable[..., Any], *args: Any) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        if not self._threads:
+            for index in range(self.size):
+                thread = threading.Thread(target=self._run, name=f"{self.name}-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+        DB_THREAD_POOL_PENDING.inc(self.name)
+        self._jobs.put((loop, future, fn, args))
+        return future
+
+    def _run(self) -> None:
+        conn: sqlite3.Connection | None = None
+        while True:
+            loop, future, fn, args = self._jobs.get()
+            if fn is None:
+                break
+
+            DB_THREAD_POOL_PENDING.dec(self.name)
+            try:
+                if conn is None:
+                    conn = self._connect()
+                    with self._stats_lock:
+                        self.connections += 1
+                result = fn(conn, *args)
+            except Exception as exc:
+                ok, value = False, exc
+            else:
+                ok, value = True, result
+
+            try:
+                loop.call_soon_threadsafe(_set_future, future, ok, value)
+            except RuntimeError:
+                # Цикл событий уже закрыт: результат некому отдавать.
+                pass
 
-class Database:
-    def __init__(self, path: Path) -> None:
-        self.path = path
-        self._lock = asyncio.Lock()
-        self._conn: sqlite3.Connection | None = None
-        self._conn_init_lock = threading.Lock()
+        if conn is not None:
+            conn.close()
+            with self._stats_lock:
+                self.connections -= 1
+        loop.call_soon_threadsafe(_set_future, future, True, None)
 
-    def _connect(self) -> sqlite3.Connection:
-        if self._conn is not None:
-            return self._conn
+    async def stop(self) -> None:
+        threads, self._threads = self._threads, []
+        if not threads:
+            return
 
-        with self._conn_init_lock:
-            if self._conn is not None:
-                return self._conn
+        # Стоп-сигналы встают в очередь после уже принятых задач: потоки доделывают их и закрывают соединения сами.
+        loop = asyncio.get_running_loop()
+        stopped = [loop.create_future() for _ in threads]
+        for future in stopped:
+            self._jobs.put((loop, future, None, ()))
+        await asyncio.gather(*stopped)
+        for thread in threads:
+            thread.join()
 
-            conn = sqlite3.connect(self.path, check_same_thread=False)
-            conn.row_factory = sqlite3.Row
-            conn.execute("PRAGMA journal_mode=WAL")
-            conn.execute("PRAGMA synchronous=NORMAL")
-            conn.execute("PRAGMA temp_store=MEMORY")
-            self._conn = conn
 
-        return self._conn
+class Database:
+    def __init__(
+        self,
+        path: Path,
+        *,
+        read_pool_size: int = 4,
+        write_batch_window: float = 0.002,
+        write_batch_max: int = 64,
+        leaderboard_index: bool = True,
+        profile_cache_size: int = 10000,
+        profile_cache_ttl: float = 3600.0,
+        busy_timeout: float = 5.0,
+        leaderboard_sync_interval: float | None = None,
+    ) -> None:
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self.read_pool_size = max(1, read_pool_size)
+        self.write_batch_window = max(0.0, write_batch_window)
+        self.write_batch_max = max(1, write_batch_max)
+        self._lock = asyncio.Lock()
+        self._writer = _ConnectionThreads("db-writer", 1, self._connect_writer)
+        self._readers = _ConnectionThreads("db-reader", self.read_pool_size, self._connect_reader)
+        self._write_queue: deque[tuple[Callable[..., Any], tuple, asyncio.Future, float]] = deque()
+        self._write_pending = asyncio.Event()
+        self._write_batch_full = asyncio.Event()
+        self._writer_task: asyncio.Task | None = None
+        self._closing = False
+        self.leaderboard = LeaderboardIndex() if leaderboard_index else None
+        self.profile_cache_size = max(0, profile_cache_size)
+        self.profile_cache_ttl = profile_cache_ttl
+        self.profile_cache_hits = 0
+        self.profile_cache_misses = 0
+        self._profile_cache: OrderedDict[int, tuple[int, float]] = OrderedDict()
+        self.leaderboard_sync_interval = leaderboard_sync_interval
+        self._sync_reader: _ConnectionThreads | None = None
+        self._sync_data_version: int | None = None
+        self._sync_watermark: str | None = None
+        self._sync_task: asyncio.Task | None = None
+        self._user_change_listeners: list[Callable[[int], None]] = []
+
+    def _connect_writer(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        return conn
+
+    def _connect_reader(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(f"{self.path.resolve().as_uri()}?mode=ro", uri=True, timeout=self.busy_timeout)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA temp_store=MEMORY")
+        return conn
+
+    def _run_read_sync(self, conn: sqlite3.Connection, fn: Callable[..., Any], submitted_at: float, *args: Any) -> Any:
+        started_at = time.perf_counter()
+        operation = _operation_name(fn)
+        DB_WAIT_SECONDS.observe(started_at - submitted_at, "read", operation, "thread")
+        try:
+            return fn(conn, *args)
+        finally:
+            DB_EXECUTE_SECONDS.observe(time.perf_counter() - started_at, "read", operation)
+
+    async def _read(self, fn: Callable[..., Any], *args: Any) -> Any:
+        return await self._readers.submit(self._run_read_sync, fn, time.perf_counter(), *args)
+
+    @property
+    def write_queue_depth(self) -> int:
+        return len(self._write_queue)
+
+    @property
+    def read_queue_depth(self) -> int:
+        return self._readers.queue_depth
+
+    async def _write(self, fn: Callable[..., Any], *args: Any) -> Any:
+        future = asyncio.get_running_loop().create_future()
+        self._write_queue.append((fn, args, future, time.perf_counter()))
+        self._write_pending.set()
+        if len(self._write_queue) >= self.write_batch_max:
+            self._write_batch_full.set()
+
+        if self._writer_task is None or self._writer_task.done():
+            self._closing = False
+            self._writer_task = asyncio.create_task(self._run_writer())
+
+        return await future
+
+    async def _run_writer(self) -> None:
+        while True:
+            await self._write_pending.wait()
+            if not self._write_queue:
+                self._write_pending.clear()
+                if self._closing:
+                    return
+                continue
+
+            if not self._closing and self.write_batch_window > 0 and len(self._write_queue) < self.write_batch_max:
+                try:
+                    await asyncio.wait_for(self._write_batch_full.wait(), self.write_batch_window)
+                except asyncio.TimeoutError:
+                    pass
+
+            batch = [self._write_queue.popleft() for _ in range(min(len(self._write_queue), self.write_batch_max))]
+            if len(self._write_queue) < self.write_batch_max:
+                self._write_batch_full.clear()
+
+            try:
+                async with self._lock:
+                    # Для записи ожидание блокировки — это время в очереди до начала своей пачки.
+                    submitted_at = time.perf_counter()
+                    for fn, _, _, enqueued_at in batch:
+                        DB_WAIT_SECONDS.observe(submitted_at - enqueued_at, "write", _operation_name(fn), "lock")
+                    results = await self._writer.submit(
+                        self._commit_batch_sync,
+                        [(fn, args) for fn, args, _, _ in batch],
+                        submitted_at,
+                    )
+            except Exception as exc:
+                logger.exception("write_batch_failed", extra={"batch_size": len(batch)})
+                results = [(False, exc)] * len(batch)
+
+            for (_, _, future, _), (ok, value) in zip(batch, results):
+                try:
+                    _set_future(future, ok, value)
+                except Exception:
+                    # Ошибка при выдаче одного результата не должна останавливать писателя и подвешивать остальных.
+                    logger.exception("write_result_failed")
+                    if not future.done():
+                        future.set_exception(RuntimeError(f"database write result could not be delivered: {value!r}"))
+
+    def _commit_batch_sync(
+        self,
+        conn: sqlite3.Connection,
+        batch: list[tuple[Callable[..., Any], tuple]],
+        submitted_at: float,
+    ) -> list[tuple[bool, Any]]:
+        started_at = time.perf_counter()
+        for fn, _ in batch:
+            DB_WAIT_SECONDS.observe(started_at - submitted_at, "write", _operation_name(fn), "thread")
+
+        results: list[tuple[bool, Any]] = []
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for fn, args in batch:
+                conn.execute("SAVEPOINT batch_write")
+                operation_started_at = time.perf_counter()
+                try:
+                    value = fn(conn, *args)
+                except Exception as exc:
+                    conn.execute("ROLLBACK TO batch_write")
+                    conn.execute("RELEASE batch_write")
+                    results.append((False, exc))
+                else:
+                    conn.execute("RELEASE batch_write")
+                    results.append((True, value))
+                DB_EXECUTE_SECONDS.observe(time.perf_counter() - operation_started_at, "write", _operation_name(fn))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
 
-    def _commit(self) -> None:
-        self._connect().commit()
+        return results
 
     async def close(self) -> None:
-        async with self._lock:
-            await asyncio.to_thread(self._close_sync)
+        sync_task = self._sync_task
+        if sync_task is not None:
+            sync_task.cancel()
+            await asyncio.gather(sync_task, return_exceptions=True)
+            self._sync_task = None
+
+        writer_task = self._writer_task
+        if writer_task is not None and not writer_task.done():
+            self._closing = True
+            self._write_pending.set()
+            await writer_task
+        self._writer_task = None
 
-    def _close_sync(self) -> None:
-        conn = self._conn
-        if conn is not None:
-            conn.close()
-            self._conn = None
+        async with self._lock:
+            await self._readers.stop()
+            if self._sync_reader is not None:
+                await self._sync_reader.stop()
+                self._sync_reader = None
+            await self._writer.stop()
 
     async def init(self) -> None:
-        await asyncio.to_thread(self._init_sync)
-
-    def _init_sync(self) -> None:
         self.path.parent.mkdir(parents=True, exist_ok=True)
-        conn = self._connect()
+        await self._writer.submit(self._init_sync)
+        # Опрос нужен и без индекса: по нему кэши процесса узнают об изменениях пользователей из других процессов.
+        if self.leaderboard_sync_interval:
+            # data_version считается на уровне соединения, поэтому опрос всегда идет через одно и то же.
+            self._sync_reader = _ConnectionThreads("db-sync", 1, self._connect_reader)
+            await self._sync_reader.submit(self._start_leaderboard_sync)
+        if self.leaderboard is not None:
+            await self._writer.submit(self._load_leaderboard_sync)
+        if self._sync_reader is not None:
+            self._sync_task = asyncio.create_task(self._run_leaderboard_sync())
+
+    def _init_sync(self, conn: sqlite3.Connection) -> None:
         conn.execute(
             """
             CREATE TABLE IF NOT EXISTS users (
@@ -70,6 +355,12 @@ class Database:
             ON users (spent_stars DESC, user_id ASC)
             """
         )
+        conn.execute(
+            """
+            CREATE INDEX IF NOT EXISTS idx_users_updated_at
+            ON users (updated_at)
+            """
+        )
 
         conn.execute(
             """
@@ -90,17 +381,115 @@ class Database:
             ON action_history (user_id, occurred_at DESC, id DESC)
             """
         )
-        self._commit()
+
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS gift_deliveries (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                gift_key TEXT NOT NULL,
+                gift_id TEXT NOT NULL,
+                gift_name TEXT NOT NULL,
+                spin_price INTEGER,
+                status TEXT NOT NULL DEFAULT 'pending'
+                    CHECK(status IN ('pending', 'sending', 'delivered', 'failed')),
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL,
+                claimed_at REAL,
+                last_error TEXT,
+                created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+            """
+        )
+        conn.execute(
+            """
+            CREATE INDEX IF NOT EXISTS idx_gift_deliveries_due
+            ON gift_deliveries (status, next_attempt_at)
+            """
+        )
+        conn.commit()
+
+    def _start_leaderboard_sync(self, conn: sqlite3.Connection) -> None:
+        self._sync_data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        self._sync_watermark = conn.execute("SELECT MAX(updated_at) FROM users").fetchone()[0]
+
+    def _load_leaderboard_sync(self, conn: sqlite3.Connection) -> None:
+        self.leaderboard.load(
+            conn.execute("SELECT user_id, username, first_name, last_name, photo_url, spent_stars FROM users")
+        )
+
+    async def _run_leaderboard_sync(self) -> None:
+        while True:
+            await asyncio.sleep(self.leaderboard_sync_interval)
+            try:
+                await self.sync_leaderboard()
+            except Exception:
+                logger.exception("leaderboard_sync_failed")
+
+    async def sync_leaderboard(self) -> int:
+        # Другие процессы пишут в тот же файл; их изменения подтягиваются в локальный индекс.
+        if self._sync_reader is None:
+            return 0
+        rows = await self._sync_reader.submit(self._poll_leaderboard_changes_sync)
+        for row in rows:
+            if self.leaderboard is not None:
+                self.leaderboard.update_profile({"id": row["user_id"], **{field: row[field] for field in PROFILE_FIELDS}})
+                self.leaderboard.set_score(row["user_id"], row["spent_stars"])
+            for listener in self._user_change_listeners:
+                listener(row["user_id"])
+        return len(rows)
+
+    def add_user_change_listener(self, listener: Callable[[int], None]) -> None:
+        self._user_change_listeners.append(listener)
+
+    def _poll_leaderboard_changes_sync(self, conn: sqlite3.Connection) -> list[sqlite3.Row]:
+        # data_version меняется только после коммита из другого соединения, так что холостой опрос почти бесплатен.
+        data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self._sync_data_version:
+            return []
+        self._sync_data_version = data_version
+
+        # updated_at хранится с точностью до секунды, а запись могла закоммититься позже своей метки,
+        # поэтому перечитываем небольшое окно до последней увиденной отметки.
+        rows = conn.execute(
+            """
+            SELECT user_id, username, first_name, last_name, photo_url, spent_stars, updated_at
+            FROM users
+            WHERE updated_at >= datetime(COALESCE(?, '1970-01-01'), '-2 seconds')
+            ORDER BY updated_at
+            """,
+            (self._sync_watermark,),
+        ).fetchall()
+        if rows:
+            self._sync_watermark = max(self._sync_watermark or "", rows[-1]["updated_at"])
+        return rows
 
     async def upsert_user(self, user: dict) -> None:
         if not isinstance(user.get("id"), int):
             return
 
-        async with self._lock:
-            await asyncio.to_thread(self._upsert_user_sync, user)
+        user_id = user["id"]
+        fingerprint = hash(tuple(user.get(field) for field in PROFILE_FIELDS))
+        now = time.monotonic()
+        cached = self._profile_cache.get(user_id)
+        if cached is not None and cached[0] == fingerprint and now - cached[1] < self.profile_cache_ttl:
+            self._profile_cache.move_to_end(user_id)
+            self.profile_cache_hits += 1
+            return
 
-    def _upsert_user_sync(self, user: dict) -> None:
-        conn = self._connect()
+        self.profile_cache_misses += 1
+        await self._write(self._upsert_user_sync, user)
+        if self.leaderboard is not None:
+            self.leaderboard.update_profile(user)
+
+        if self.profile_cache_size:
+            self._profile_cache[user_id] = (fingerprint, now)
+            self._profile_cache.move_to_end(user_id)
+            while len(self._profile_cache) > self.profile_cache_size:
+                self._profile_cache.popitem(last=False)
+
+    def _upsert_user_sync(self, conn: sqlite3.Connection, user: dict) -> None:
         conn.execute(
             """
             INSERT INTO users (user_id, username, first_name, last_name, photo_url)
@@ -120,7 +509,6 @@ class Database:
                 user.get("photo_url"),
             ),
         )
-        self._commit()
 
     async def add_spent_stars(self, user_id: int, amount: int) -> None:
         if amount <= 0:
@@ -128,14 +516,25 @@ class Database:
             return
 
         try:
-            async with self._lock:
-                await asyncio.to_thread(self._add_spent_stars_sync, user_id, amount)
+            current_spent_stars = await self._write(self._add_spent_stars_sync, user_id, amount)
         except Exception:
             logger.exception("add_spent_stars_failed", extra={"user_id": user_id, "amount": amount})
             raise
 
-    def _add_spent_stars_sync(self, user_id: int, amount: int) -> None:
-        conn = self._connect()
+        if self.leaderboard is not None and current_spent_stars is not None:
+            self.leaderboard.set_score(user_id, current_spent_stars)
+
+        if should_log(logger, "add_spent_stars_succeeded"):
+            logger.info(
+                "add_spent_stars_succeeded",
+                extra={
+                    "user_id": user_id,
+                    "amount_added": amount,
+                    "current_spent_stars": current_spent_stars,
+                },
+            )
+
+    def _add_spent_stars_sync(self, conn: sqlite3.Connection, user_id: int, amount: int) -> int | None:
         cursor = conn.execute(
             """
             INSERT INTO users (user_id, spent_stars)
@@ -148,17 +547,7 @@ class Database:
             (user_id, amount),
         )
         row = cursor.fetchone()
-        self._commit()
-
-        logger.info(
-            "add_spent_stars_succeeded",
-            extra={
-                "user_id": user_id,
-                "amount_added": amount,
-                "current_spent_stars": row["spent_stars"] if row else None,
-            },
-        )
-
+        return row["spent_stars"] if row else None
 
     async def add_action_history(
         self,
@@ -169,60 +558,303 @@ class Database:
         gift_name: str,
         spin_price: int | None = None,
     ) -> None:
-        if action_type not in {"won", "received"}:
+        if action_type not in ACTION_TYPES:
             logger.warning("add_action_history_skipped", extra={"reason": "invalid_action_type", "action_type": action_type})
             return
 
-        async with self._lock:
-            await asyncio.to_thread(
-                self._add_action_history_sync,
-                user_id,
-                action_type,
-                gift_key,
-                gift_name,
-                spin_price,
+        await self.add_action_history_many(
+            [
+                {
+                    "user_id": user_id,
+                    "action_type": action_type,
+                    "gift_key": gift_key,
+                    "gift_name": gift_name,
+                    "spin_price": spin_price,
+                }
+            ]
+        )
+
+    async def add_action_history_many(self, rows: list[dict]) -> int:
+        # Пачка пишется целиком или никак, поэтому все строки проверяются до постановки в очередь записи.
+        params = []
+        for index, row in enumerate(rows):
+            if row.get("action_type") not in ACTION_TYPES:
+                raise ValueError(f"rows[{index}]: invalid action_type {row.get('action_type')!r}")
+
+            params.append(
+                (
+                    row["user_id"],
+                    row["action_type"],
+                    row["gift_key"],
+                    row["gift_name"],
+                    row.get("spin_price"),
+                    _history_timestamp(row.get("occurred_at"), index),
+                )
             )
 
-    def _add_action_history_sync(
+        if not params:
+            return 0
+
+        await self._write(self._add_action_history_many_sync, params)
+        return len(params)
+
+    def _add_action_history_many_sync(self, conn: sqlite3.Connection, params: list[tuple]) -> None:
+        conn.executemany(
+            """
+            INSERT INTO action_history (user_id, action_type, gift_key, gift_name, spin_price, occurred_at)
+            VALUES (?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+            """,
+            params,
+        )
+
+    async def create_gift_delivery(
         self,
+        *,
         user_id: int,
-        action_type: str,
         gift_key: str,
+        gift_id: str,
+        gift_name: str,
+        spin_price: int | None = None,
+    ) -> int:
+        return await self._write(
+            self._create_gift_delivery_sync,
+            user_id,
+            gift_key,
+            gift_id,
+            gift_name,
+            spin_price,
+            time.time(),
+        )
+
+    def _create_gift_delivery_sync(
+        self,
+        conn: sqlite3.Connection,
+        user_id: int,
+        gift_key: str,
+        gift_id: str,
         gift_name: str,
         spin_price: int | None,
-    ) -> None:
-        conn = self._connect()
-        conn.execute(
+        now: float,
+    ) -> int:
+        cursor = conn.execute(
             """
-            INSERT INTO action_history (user_id, action_type, gift_key, gift_name, spin_price)
-            VALUES (?, ?, ?, ?, ?)
+            INSERT INTO gift_deliveries (user_id, gift_key, gift_id, gift_name, spin_price, next_attempt_at)
+            VALUES (?, ?, ?, ?, ?, ?)
             """,
-            (user_id, action_type, gift_key, gift_name, spin_price),
+            (user_id, gift_key, gift_id, gift_name, spin_price, now),
         )
-        self._commit()
+        self._add_action_history_many_sync(conn, [(user_id, "won", gift_key, gift_name, spin_price, None)])
+        return cursor.lastrowid
 
-    async def get_action_history(self, *, user_id: int, limit: int = 100, offset: int = 0) -> list[dict]:
-        safe_limit = max(1, min(limit, 100))
-        safe_offset = max(0, offset)
+    async def has_due_gift_deliveries(self, *, lease_seconds: float) -> bool:
+        return await self._read(self._has_due_gift_deliveries_sync, lease_seconds, time.time())
 
-        async with self._lock:
-            return await asyncio.to_thread(self._get_action_history_sync, user_id, safe_limit, safe_offset)
+    def _has_due_gift_deliveries_sync(self, conn: sqlite3.Connection, lease_seconds: float, now: float) -> bool:
+        # Проверка на читателе: простаивающие воркеры не открывают пустую транзакцию записи на каждом опросе.
+        row = conn.execute(
+            """
+            SELECT 1
+            FROM gift_deliveries
+            WHERE (status = 'pending' AND next_attempt_at <= ?)
+                OR (status = 'sending' AND claimed_at < ?)
+            LIMIT 1
+            """,
+            (now, now - lease_seconds),
+        ).fetchone()
+        return row is not None
 
-    def _get_action_history_sync(self, user_id: int, limit: int, offset: int) -> list[dict]:
-        conn = self._connect()
+    async def claim_gift_deliveries(self, *, limit: int, lease_seconds: float) -> list[dict]:
+        return await self._write(self._claim_gift_deliveries_sync, limit, lease_seconds, time.time())
+
+    def _claim_gift_deliveries_sync(
+        self,
+        conn: sqlite3.Connection,
+        limit: int,
+        lease_seconds: float,
+        now: float,
+    ) -> list[dict]:
+        # Доставка в статусе sending с истекшей арендой осталась от упавшего процесса — забираем ее снова.
+        # claimed_at служит меткой аренды: все дальнейшие записи по доставке сверяются с ней.
         rows = conn.execute(
             """
-            SELECT action_type, occurred_at, gift_key, gift_name, spin_price
-            FROM action_history
-            WHERE user_id = ?
-            ORDER BY occurred_at DESC, id DESC
-            LIMIT ? OFFSET ?
+            UPDATE gift_deliveries
+            SET status = 'sending',
+                attempts = attempts + 1,
+                claimed_at = ?,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id IN (
+                SELECT id
+                FROM gift_deliveries
+                WHERE (status = 'pending' AND next_attempt_at <= ?)
+                    OR (status = 'sending' AND claimed_at < ?)
+                ORDER BY next_attempt_at
+                LIMIT ?
+            )
+            RETURNING id, user_id, gift_key, gift_id, gift_name, spin_price, attempts, claimed_at
             """,
-            (user_id, limit, offset),
+            (now, now, now - lease_seconds, limit),
         ).fetchall()
+        return [dict(row) for row in rows]
+
+    async def renew_gift_delivery_lease(self, delivery_id: int, *, claimed_at: float) -> float | None:
+        return await self._write(self._renew_gift_delivery_lease_sync, delivery_id, claimed_at, time.time())
+
+    def _renew_gift_delivery_lease_sync(
+        self,
+        conn: sqlite3.Connection,
+        delivery_id: int,
+        claimed_at: float,
+        now: float,
+    ) -> float | None:
+        # None — аренду уже забрал другой воркер.
+        row = conn.execute(
+            """
+            UPDATE gift_deliveries
+            SET claimed_at = ?
+            WHERE id = ? AND status = 'sending' AND claimed_at = ?
+            RETURNING claimed_at
+            """,
+            (now, delivery_id, claimed_at),
+        ).fetchone()
+        return None if row is None else row["claimed_at"]
+
+    async def complete_gift_delivery(self, delivery_id: int, *, claimed_at: float) -> bool:
+        return await self._write(self._complete_gift_delivery_sync, delivery_id, claimed_at)
+
+    def _complete_gift_delivery_sync(self, conn: sqlite3.Connection, delivery_id: int, claimed_at: float) -> bool:
+        row = conn.execute(
+            """
+            UPDATE gift_deliveries
+            SET status = 'delivered', last_error = NULL, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND status = 'sending' AND claimed_at = ?
+            RETURNING user_id, gift_key, gift_name, spin_price
+            """,
+            (delivery_id, claimed_at),
+        ).fetchone()
+        if row is None:
+            return False
+
+        self._add_action_history_many_sync(
+            conn,
+            [(row["user_id"], "received", row["gift_key"], row["gift_name"], row["spin_price"], None)],
+        )
+        return True
+
+    async def fail_gift_delivery(
+        self,
+        delivery_id: int,
+        *,
+        claimed_at: float,
+        error: str,
+        retry_in: float | None,
+    ) -> bool:
+        return await self._write(self._fail_gift_delivery_sync, delivery_id, claimed_at, error, retry_in, time.time())
+
+    def _fail_gift_delivery_sync(
+        self,
+        conn: sqlite3.Connection,
+        delivery_id: int,
+        claimed_at: float,
+        error: str,
+        retry_in: float | None,
+        now: float,
+    ) -> bool:
+        cursor = conn.execute(
+            """
+            UPDATE gift_deliveries
+            SET status = ?,
+                next_attempt_at = ?,
+                claimed_at = NULL,
+                last_error = ?,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND status = 'sending' AND claimed_at = ?
+            """,
+            (
+                "failed" if retry_in is None else "pending",
+                now if retry_in is None else now + retry_in,
+                error[:500],
+                delivery_id,
+                claimed_at,
+            ),
+        )
+        return cursor.rowcount > 0
+
+    async def get_gift_delivery(self, delivery_id: int, *, user_id: int) -> dict | None:
+        return await self._read(self._get_gift_delivery_sync, delivery_id, user_id)
+
+    def _get_gift_delivery_sync(self, conn: sqlite3.Connection, delivery_id: int, user_id: int) -> dict | None:
+        row = conn.execute(
+            """
+            SELECT id, status, attempts, gift_key, gift_name, spin_price, created_at, updated_at
+            FROM gift_deliveries
+            WHERE id = ? AND user_id = ?
+            """,
+            (delivery_id, user_id),
+        ).fetchone()
+        if row is None:
+            return None
+
+        return {
+            "id": row["id"],
+            "status": row["status"],
+            "attempts": row["attempts"],
+            "giftId": row["gift_key"],
+            "giftName": row["gift_name"],
+            "spinPrice": row["spin_price"],
+            "createdAt": row["created_at"],
+            "updatedAt": row["updated_at"],
+        }
+
+    async def get_action_history(
+        self,
+        *,
+        user_id: int,
+        limit: int = 100,
+        offset: int = 0,
+        after: tuple[str, int] | None = None,
+    ) -> list[dict]:
+        safe_limit = max(1, min(limit, 100))
+        safe_offset = max(0, offset)
+
+        return await self._read(self._get_action_history_sync, user_id, safe_limit, safe_offset, after)
+
+    def _get_action_history_sync(
+        self,
+        conn: sqlite3.Connection,
+        user_id: int,
+        limit: int,
+        offset: int,
+        after: tuple[str, int] | None = None,
+    ) -> list[dict]:
+        if after is None:
+            rows = conn.execute(
+                """
+                SELECT id, action_type, occurred_at, gift_key, gift_name, spin_price
+                FROM action_history
+                WHERE user_id = ?
+                ORDER BY occurred_at DESC, id DESC
+                LIMIT ? OFFSET ?
+                """,
+                (user_id, limit, offset),
+            ).fetchall()
+        else:
+            occurred_at, history_id = after
+            rows = conn.execute(
+                """
+                SELECT id, action_type, occurred_at, gift_key, gift_name, spin_price
+                FROM action_history
+                WHERE user_id = ?
+                    AND occurred_at <= ?
+                    AND (occurred_at < ? OR id < ?)
+                ORDER BY occurred_at DESC, id DESC
+                LIMIT ? OFFSET ?
+                """,
+                (user_id, occurred_at, occurred_at, history_id, limit, offset),
+            ).fetchall()
 
         return [
             {
+                "id": row["id"],
                 "type": row["action_type"],
                 "occurredAt": row["occurred_at"],
                 "giftId": row["gift_key"],
@@ -232,35 +864,110 @@ class Database:
             for row in rows
         ]
 
-    async def get_leaderboard(self, limit: int = 100, offset: int = 0) -> list[dict]:
+    async def get_leaderboard(
+        self,
+        limit: int = 100,
+        offset: int = 0,
+        after: tuple[int, int] | None = None,
+    ) -> list[dict]:
         safe_limit = max(1, min(limit, 100))
         safe_offset = max(0, offset)
 
-        async with self._lock:
-            return await asyncio.to_thread(self._get_leaderboard_sync, safe_limit, safe_offset)
+        if self.leaderboard is not None:
+            leaderboard = self.leaderboard.page(safe_limit, safe_offset, after)
+            if should_log(logger, "get_leaderboard_result"):
+                logger.info(
+                    "get_leaderboard_result",
+                    extra={"records_count": len(leaderboard), "limit": safe_limit, "offset": safe_offset},
+                )
+            return leaderboard
 
-    def _get_leaderboard_sync(self, limit: int, offset: int) -> list[dict]:
-        conn = self._connect()
-        rows = conn.execute(
-            """
-            SELECT user_id, username, first_name, last_name, photo_url, spent_stars
-            FROM users
-            ORDER BY spent_stars DESC, user_id ASC
-            LIMIT ? OFFSET ?
-            """,
-            (limit, offset),
-        ).fetchall()
+        return await self._read(self._get_leaderboard_sync, safe_limit, safe_offset, after)
 
-        logger.info("get_leaderboard_result", extra={"records_count": len(rows), "limit": limit, "offset": offset})
-
-        return [
-            {
-                "userId": row["user_id"],
-                "username": row["username"],
-                "firstName": row["first_name"],
-                "lastName": row["last_name"],
-                "photoUrl": row["photo_url"],
-                "spentStars": row["spent_stars"],
-            }
-            for row in rows
-        ]
+    def _get_leaderboard_sync(
+        self,
+        conn: sqlite3.Connection,
+        limit: int,
+        offset: int,
+        after: tuple[int, int] | None = None,
+    ) -> list[dict]:
+        if after is None:
+            rows = conn.execute(
+                """
+                SELECT user_id, username, first_name, last_name, photo_url, spent_stars
+                FROM users
+                ORDER BY spent_stars DESC, user_id ASC
+                LIMIT ? OFFSET ?
+                """,
+                (limit, offset),
+            ).fetchall()
+        else:
+            spent_stars, user_id = after
+            # Хвост группы с тем же spent_stars и следующие группы выбираются отдельно: так поиск по индексу идет
+            # по обоим столбцам, а не просматривает всех пользователей с равным счетом (обычно это 0).
+            # ORDER BY у составного запроса SQLite выполняет слиянием без сортировки.
+            rows = conn.execute(
+                """
+                SELECT user_id, username, first_name, last_name, photo_url, spent_stars
+                FROM users
+                WHERE spent_stars = ? AND user_id > ?
+                UNION ALL
+                SELECT user_id, username, first_name, last_name, photo_url, spent_stars
+                FROM users
+                WHERE spent_stars < ?
+                ORDER BY spent_stars DESC, user_id ASC
+                LIMIT ? OFFSET ?
+                """,
+                (spent_stars, user_id, spent_stars, limit, offset),
+            ).fetchall()
+
+        if should_log(logger, "get_leaderboard_result"):
+            logger.info("get_leaderboard_result", extra={"records_count": len(rows), "limit": limit, "offset": offset})
+
+        return [_leaderboard_entry(row) for row in rows]
+
+    async def get_leaderboard_rank(self, user_id: int, radius: int = 2) -> dict | None:
+        safe_radius = max(0, min(radius, 50))
+
+        if self.leaderboard is not None:
+            return self.leaderboard.around(user_id, safe_radius)
+
+        return await self._read(self._get_leaderboard_rank_sync, user_id, safe_radius)
+
+    def _get_leaderboard_rank_sync(self, conn: sqlite3.Connection, user_id: int, radius: int) -> dict | None:
+        # Все чтения в одной транзакции: иначе запись между ними может сдвинуть пользователя за пределы окна.
+        conn.execute("BEGIN")
+        try:
+            row = conn.execute(
+                "SELECT user_id, username, first_name, last_name, photo_url, spent_stars FROM users WHERE user_id = ?",
+                (user_id,),
+            ).fetchone()
+            if row is None:
+                return None
+
+            spent_stars = row["spent_stars"]
+            rank = conn.execute(
+                """
+                SELECT COUNT(*) + 1
+                FROM users
+                WHERE spent_stars > ? OR (spent_stars = ? AND user_id < ?)
+                """,
+                (spent_stars, spent_stars, user_id),
+            ).fetchone()[0]
+            total = conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+            start = max(0, rank - 1 - radius)
+            neighbours = [
+                {**entry, "rank": start + position + 1}
+                for position, entry in enumerate(self._get_leaderboard_sync(conn, rank + radius - start, start))
+            ]
+        finally:
+            conn.commit()
+
+        entry = next((neighbour for neighbour in neighbours if neighbour["userId"] == user_id), None)
+        return {
+            "rank": rank,
+            "total": total,
+            "entry": _leaderboard_entry(row) if entry is None else {key: value for key, value in entry.items() if key != "rank"},
+            "neighbours": neighbours,
+        }
@@ -0,0 +1,178 @@
+import asyncio
+import logging
+import random
+from typing import Awaitable, Callable
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+
+from database import Database
+
+
+logger = logging.getLogger(__name__)
+
+# Эти ошибки не исчезнут от повтора (нет такого подарка, пользователь заблокировал бота и т.п.).
+PERMANENT_ERRORS = (TelegramBadRequest, TelegramForbiddenError)
+
+
+class GiftDeliveryWorkers:
+    def __init__(
+        self,
+        bot,
+        db: Database,
+        *,
+        workers: int = 4,
+        max_attempts: int = 5,
+        retry_base_seconds: float = 2.0,
+        retry_max_seconds: float = 300.0,
+        poll_interval: float = 1.0,
+        lease_seconds: float = 120.0,
+    ) -> None:
+        self.bot = bot
+        self.db = db
+        self.workers = max(1, workers)
+        self.max_attempts = max(1, max_attempts)
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.delivered = 0
+        self.retried = 0
+        self.failed = 0
+        self._wakeup = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+        self._stopping = False
+
+    def wake(self) -> None:
+        self._wakeup.set()
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+
+        self._stopping = False
+        self._tasks = [asyncio.create_task(self._run_worker()) for _ in range(self.workers)]
+        logger.info("gift_delivery_workers_started", extra={"workers": self.workers})
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        self._stopping = True
+        self._wakeup.set()
+        if not self._tasks:
+            return
+
+        # Даем текущим отправкам завершиться; незавершенные доставки заберет другой процесс после истечения аренды.
+        _, pending = await asyncio.wait(self._tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        self._tasks = []
+
+    async def _run_worker(self) -> None:
+        while not self._stopping:
+            try:
+                if await self.db.has_due_gift_deliveries(lease_seconds=self.lease_seconds):
+                    deliveries = await self.db.claim_gift_deliveries(limit=1, lease_seconds=self.lease_seconds)
+                else:
+                    deliveries = []
+            except Exception:
+                logger.exception("gift_delivery_claim_failed")
+                deliveries = []
+
+            if not deliveries:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            for delivery in deliveries:
+                try:
+                    await self._deliver(delivery)
+                except Exception:
+                    logger.exception("gift_delivery_crashed", extra={"delivery_id": delivery["id"]})
+
+    @property
+    def _renew_interval(self) -> float:
+        return self.lease_seconds / 3
+
+    def _retry_delay(self, attempts: int, error: Exception) -> float:
+        retry_after = getattr(error, "retry_after", None)
+        if isinstance(retry_after, (int, float)) and retry_after > 0:
+            return float(retry_after)
+
+        delay = min(self.retry_max_seconds, self.retry_base_seconds * 2 ** (attempts - 1))
+        return delay * random.uniform(0.8, 1.2)
+
+    async def _renew_lease(self, delivery: dict) -> None:
+        try:
+            claimed_at = await self.db.renew_gift_delivery_lease(delivery["id"], claimed_at=delivery["claimed_at"])
+        except Exception:
+            logger.exception("gift_delivery_lease_renew_failed", extra={"delivery_id": delivery["id"]})
+            return
+
+        if claimed_at is None:
+            logger.warning("gift_delivery_lease_lost", extra={"delivery_id": delivery["id"]})
+            return
+        delivery["claimed_at"] = claimed_at
+
+    async def _send(self, delivery: dict) -> None:
+        # Пока отправка идет (в том числе в ожидании retry_after планировщика), аренда продлевается,
+        # чтобы другой воркер не забрал доставку и не отправил подарок второй раз.
+        send = asyncio.ensure_future(self.bot.send_gift(user_id=delivery["user_id"], gift_id=delivery["gift_id"]))
+        try:
+            while not send.done():
+                await asyncio.wait({send}, timeout=self._renew_interval)
+                if not send.done():
+                    await self._renew_lease(delivery)
+        finally:
+            if not send.done():
+                send.cancel()
+        send.result()
+
+    async def _record(self, delivery: dict, write: Callable[..., Awaitable[bool]], **kwargs) -> None:
+        # Повторная отправка после принятого Telegram подарка недопустима, поэтому статус пишется до успеха,
+        # а аренда продлевается между попытками.
+        failures = 0
+        while True:
+            try:
+                recorded = await write(delivery["id"], claimed_at=delivery["claimed_at"], **kwargs)
+            except Exception:
+                failures += 1
+                logger.exception(
+                    "gift_delivery_status_write_failed",
+                    extra={"delivery_id": delivery["id"], "failures": failures},
+                )
+                await asyncio.sleep(min(self._renew_interval, self.retry_base_seconds * 2 ** (failures - 1)))
+                await self._renew_lease(delivery)
+                continue
+
+            if not recorded:
+                logger.warning("gift_delivery_lease_lost", extra={"delivery_id": delivery["id"]})
+            return
+
+    async def _deliver(self, delivery: dict) -> None:
+        log_extra = {
+            "delivery_id": delivery["id"],
+            "user_id": delivery["user_id"],
+            "gift_key": delivery["gift_key"],
+            "attempts": delivery["attempts"],
+        }
+
+        try:
+            await self._send(delivery)
+        except Exception as exc:
+            if isinstance(exc, PERMANENT_ERRORS) or delivery["attempts"] >= self.max_attempts:
+                self.failed += 1
+                logger.exception("gift_delivery_failed", extra=log_extra)
+                await self._record(delivery, self.db.fail_gift_delivery, error=repr(exc), retry_in=None)
+                return
+
+            retry_in = self._retry_delay(delivery["attempts"], exc)
+            self.retried += 1
+            logger.warning("gift_delivery_retry_scheduled", extra={**log_extra, "retry_in": retry_in, "error": repr(exc)})
+            await self._record(delivery, self.db.fail_gift_delivery, error=repr(exc), retry_in=retry_in)
+            return
+
+        self.delivered += 1
+        logger.info("gift_sent", extra={**log_extra, "gift_id": delivery["gift_id"]})
+        await self._record(delivery, self.db.complete_gift_delivery)
@@ -0,0 +1,71 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+
+class InvoiceLinkCache:
+    # Payload счета детерминирован по (amount, user_id), поэтому ссылку можно переиспользовать до оплаты.
+    def __init__(self, *, ttl: float = 600.0, max_users: int = 10000) -> None:
+        self.ttl = ttl
+        self.max_users = max_users
+        self.hits = 0
+        self.misses = 0
+        self._links: OrderedDict[int, dict[int, tuple[str, float]]] = OrderedDict()
+        self._inflight: dict[tuple[int, int], asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        return sum(len(links) for links in self._links.values())
+
+    def get(self, amount: int, user_id: int) -> str | None:
+        links = self._links.get(user_id)
+        cached = links.get(amount) if links is not None else None
+        if cached is None:
+            return None
+
+        link, created_at = cached
+        if time.monotonic() - created_at >= self.ttl:
+            del links[amount]
+            return None
+
+        self._links.move_to_end(user_id)
+        return link
+
+    async def get_or_create(self, amount: int, user_id: int, factory: Callable[[], Awaitable[str]]) -> str:
+        link = self.get(amount, user_id)
+        if link is not None:
+            self.hits += 1
+            return link
+
+        key = (amount, user_id)
+        task = self._inflight.get(key)
+        if task is None:
+            self.misses += 1
+            task = asyncio.create_task(self._create(key, factory))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done_task: self._forget_inflight(key, done_task))
+        else:
+            self.hits += 1
+
+        # shield: отмена одного из ожидающих запросов не должна обрывать общий вызов Telegram.
+        return await asyncio.shield(task)
+
+    def _forget_inflight(self, key: tuple[int, int], task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+
+    async def _create(self, key: tuple[int, int], factory: Callable[[], Awaitable[str]]) -> str:
+        link = await factory()
+        # Если пользователь успел оплатить, пока ссылка создавалась, вызов уже снят с учета и в кэш не попадет.
+        if self._inflight.get(key) is asyncio.current_task():
+            amount, user_id = key
+            self._links.setdefault(user_id, {})[amount] = (link, time.monotonic())
+            self._links.move_to_end(user_id)
+            while len(self._links) > self.max_users:
+                self._links.popitem(last=False)
+        return link
+
+    def invalidate_user(self, user_id: int) -> None:
+        self._links.pop(user_id, None)
+        for key in [key for key in self._inflight if key[1] == user_id]:
+            del self._inflight[key]
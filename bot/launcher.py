@@ -0,0 +1,48 @@
+import logging
+import multiprocessing
+import multiprocessing.connection
+import signal
+import time
+from typing import Callable
+
+
+logger = logging.getLogger(__name__)
+
+
+def run_processes(targets: list[tuple[str, Callable[..., None], tuple]], *, shutdown_timeout: float) -> int:
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=target, args=args, name=name) for name, target, args in targets]
+    stop_requested = False
+
+    def _request_stop(signum, frame) -> None:
+        nonlocal stop_requested
+        stop_requested = True
+
+    signal.signal(signal.SIGTERM, _request_stop)
+    signal.signal(signal.SIGINT, _request_stop)
+
+    for process in processes:
+        process.start()
+        logger.info("process_started", extra={"process_name": process.name, "pid": process.pid})
+
+    # Если один из процессов упал, останавливаем остальные: перезапуск целиком — задача systemd/docker.
+    while not stop_requested and all(process.is_alive() for process in processes):
+        multiprocessing.connection.wait([process.sentinel for process in processes], timeout=0.5)
+
+    for process in processes:
+        if not process.is_alive():
+            logger.warning("process_exited", extra={"process_name": process.name, "exitcode": process.exitcode})
+        else:
+            process.terminate()
+
+    deadline = time.monotonic() + shutdown_timeout
+    for process in processes:
+        process.join(max(0.0, deadline - time.monotonic()))
+
+    for process in processes:
+        if process.is_alive():
+            logger.warning("process_killed", extra={"process_name": process.name, "pid": process.pid})
+            process.kill()
+            process.join()
+
+    return 0 if stop_requested else 1
@@ -0,0 +1,188 @@
+import bisect
+import hashlib
+import math
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Hashable, Iterable
+
+
+PROFILE_FIELDS = ("username", "first_name", "last_name", "photo_url")
+
+
+class LeaderboardIndex:
+    # Отсортированный массив ключей (-spent_stars, user_id) повторяет порядок idx_users_leaderboard,
+    # поэтому позиция пользователя ищется через bisect за O(log n).
+    def __init__(self) -> None:
+        self._keys: list[tuple[int, int]] = []
+        self._scores: dict[int, int] = {}
+        self._profiles: dict[int, tuple[str | None, ...]] = {}
+        self._listeners: list[Callable[[int, float], None]] = []
+        self._score_listeners: list[Callable[[int], None]] = []
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._scores
+
+    def load(self, rows: Iterable) -> None:
+        scores: dict[int, int] = {}
+        profiles: dict[int, tuple[str | None, ...]] = {}
+        for row in rows:
+            scores[row["user_id"]] = row["spent_stars"]
+            profiles[row["user_id"]] = tuple(row[field] for field in PROFILE_FIELDS)
+
+        self._scores = scores
+        self._profiles = profiles
+        self._keys = sorted((-spent_stars, user_id) for user_id, spent_stars in scores.items())
+        self._notify(0, math.inf)
+
+    def add_listener(self, listener: Callable[[int, float], None]) -> None:
+        self._listeners.append(listener)
+
+    def add_score_listener(self, listener: Callable[[int], None]) -> None:
+        self._score_listeners.append(listener)
+
+    def _notify(self, first_position: int, last_position: float) -> None:
+        for listener in self._listeners:
+            listener(first_position, last_position)
+
+    def set_score(self, user_id: int, spent_stars: int) -> None:
+        previous = self._scores.get(user_id)
+        if previous == spent_stars:
+            return
+
+        old_position = None
+        if previous is not None:
+            old_position = bisect.bisect_left(self._keys, (-previous, user_id))
+            del self._keys[old_position]
+        else:
+            self._profiles.setdefault(user_id, (None,) * len(PROFILE_FIELDS))
+
+        self._scores[user_id] = spent_stars
+        new_position = bisect.bisect_left(self._keys, (-spent_stars, user_id))
+        self._keys.insert(new_position, (-spent_stars, user_id))
+
+        # Сдвигаются только позиции между старым и новым местом; новый пользователь сдвигает весь хвост.
+        if old_position is None:
+            self._notify(new_position, len(self._keys) - 1)
+        else:
+            self._notify(min(old_position, new_position), max(old_position, new_position))
+
+        for listener in self._score_listeners:
+            listener(user_id)
+
+    def update_profile(self, user: dict) -> None:
+        user_id = user["id"]
+        current = self._profiles.get(user_id, (None,) * len(PROFILE_FIELDS))
+        # Как и COALESCE в upsert_user: пустые поля не затирают сохраненные значения.
+        profile = tuple(
+            user.get(field) if user.get(field) is not None else current[position]
+            for position, field in enumerate(PROFILE_FIELDS)
+        )
+        self._profiles[user_id] = profile
+        if user_id not in self._scores:
+            self.set_score(user_id, 0)
+        elif profile != current:
+            position = self.rank(user_id) - 1
+            self._notify(position, position)
+
+    def rank(self, user_id: int) -> int | None:
+        spent_stars = self._scores.get(user_id)
+        if spent_stars is None:
+            return None
+        return bisect.bisect_left(self._keys, (-spent_stars, user_id)) + 1
+
+    def entry(self, user_id: int) -> dict:
+        username, first_name, last_name, photo_url = self._profiles[user_id]
+        return {
+            "userId": user_id,
+            "username": username,
+            "firstName": first_name,
+            "lastName": last_name,
+            "photoUrl": photo_url,
+            "spentStars": self._scores[user_id],
+        }
+
+    def page(self, limit: int, offset: int, after: tuple[int, int] | None = None) -> list[dict]:
+        if after is not None:
+            spent_stars, user_id = after
+            offset += bisect.bisect_right(self._keys, (-spent_stars, user_id))
+        return [self.entry(user_id) for _, user_id in self._keys[offset:offset + limit]]
+
+    def around(self, user_id: int, radius: int) -> dict | None:
+        rank = self.rank(user_id)
+        if rank is None:
+            return None
+
+        start = max(0, rank - 1 - radius)
+        neighbours = [
+            {**self.entry(neighbour_id), "rank": start + position + 1}
+            for position, (_, neighbour_id) in enumerate(self._keys[start:rank + radius])
+        ]
+        return {
+            "rank": rank,
+            "total": len(self._keys),
+            "entry": self.entry(user_id),
+            "neighbours": neighbours,
+        }
+
+
+@dataclass(frozen=True)
+class CachedPage:
+    body: bytes
+    etag: str
+    first_position: int
+    last_position: float
+
+
+class LeaderboardPageCache:
+    # Готовые JSON-байты страниц лидерборда; запись удаляется, как только индекс меняет позиции внутри страницы.
+    def __init__(self, max_entries: int = 256) -> None:
+        self.max_entries = max_entries
+        self.generation = 0
+        self._pages: OrderedDict[Hashable, CachedPage] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._pages)
+
+    def get(self, key: Hashable) -> CachedPage | None:
+        page = self._pages.get(key)
+        if page is not None:
+            self._pages.move_to_end(key)
+        return page
+
+    def put(
+        self,
+        key: Hashable,
+        body: bytes,
+        *,
+        first_position: int,
+        last_position: float,
+        generation: int,
+    ) -> CachedPage:
+        page = CachedPage(
+            body=body,
+            etag=f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"',
+            first_position=first_position,
+            last_position=last_position,
+        )
+        # Если индекс изменился, пока страница строилась, она уже может быть устаревшей.
+        if generation != self.generation:
+            return page
+
+        self._pages[key] = page
+        self._pages.move_to_end(key)
+        while len(self._pages) > self.max_entries:
+            self._pages.popitem(last=False)
+        return page
+
+    def invalidate(self, first_position: int, last_position: float) -> None:
+        self.generation += 1
+        stale_keys = [
+            key
+            for key, page in self._pages.items()
+            if page.first_position <= last_position and first_position <= page.last_position
+        ]
+        for key in stale_keys:
+            del self._pages[key]
@@ -0,0 +1,118 @@
+import asyncio
+import logging
+
+from leaderboard import LeaderboardIndex
+from serialization import dumps
+
+
+logger = logging.getLogger(__name__)
+
+RESYNC_EVENT = b"event: resync\ndata: {}\n\n"
+
+
+class LeaderboardSubscription:
+    def __init__(self, broadcaster: "LeaderboardBroadcaster", queue_size: int) -> None:
+        self._broadcaster = broadcaster
+        self._queue: asyncio.Queue[bytes | None] = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+
+    def __enter__(self) -> "LeaderboardSubscription":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._broadcaster.unsubscribe(self)
+
+    def offer(self, message: bytes | None) -> None:
+        try:
+            self._queue.put_nowait(message)
+            return
+        except asyncio.QueueFull:
+            pass
+
+        # Медленный клиент не тормозит рассылку: выбрасываем его очередь и просим перечитать лидерборд целиком.
+        self.dropped += self._queue.qsize()
+        while not self._queue.empty():
+            self._queue.get_nowait()
+        self._queue.put_nowait(RESYNC_EVENT if message is not None else None)
+
+    async def get(self) -> bytes | None:
+        return await self._queue.get()
+
+
+class LeaderboardBroadcaster:
+    def __init__(self, index: LeaderboardIndex, *, flush_interval: float = 0.5, queue_size: int = 16) -> None:
+        self._index = index
+        self.flush_interval = flush_interval
+        self.queue_size = queue_size
+        self._changed_users: set[int] = set()
+        self._changed = asyncio.Event()
+        self._subscribers: set[LeaderboardSubscription] = set()
+        self._task: asyncio.Task | None = None
+        self.events_sent = 0
+        index.add_score_listener(self.notify_score)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def notify_score(self, user_id: int) -> None:
+        self._changed_users.add(user_id)
+        self._changed.set()
+
+    def subscribe(self) -> LeaderboardSubscription:
+        subscription = LeaderboardSubscription(self, self.queue_size)
+        self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: LeaderboardSubscription) -> None:
+        self._subscribers.discard(subscription)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        for subscription in list(self._subscribers):
+            subscription.offer(None)
+
+    def build_event(self, user_ids: set[int]) -> bytes | None:
+        entries = []
+        for user_id in user_ids:
+            rank = self._index.rank(user_id)
+            if rank is not None:
+                entries.append({**self._index.entry(user_id), "rank": rank})
+
+        if not entries:
+            return None
+
+        entries.sort(key=lambda entry: entry["rank"])
+        return b"event: leaderboard\ndata: " + dumps({"entries": entries, "total": len(self._index)}) + b"\n\n"
+
+    async def _run(self) -> None:
+        while True:
+            await self._changed.wait()
+            # Копим изменения за интервал, чтобы серия оплат превратилась в одно событие.
+            await asyncio.sleep(self.flush_interval)
+            self._changed.clear()
+            user_ids, self._changed_users = self._changed_users, set()
+
+            try:
+                message = self.build_event(user_ids)
+            except Exception:
+                logger.exception("leaderboard_stream_event_failed", extra={"users_count": len(user_ids)})
+                continue
+
+            if message is None:
+                continue
+
+            self.events_sent += 1
+            for subscription in list(self._subscribers):
+                subscription.offer(message)
@@ -0,0 +1,133 @@
+import argparse
+import asyncio
+import itertools
+import random
+from collections import Counter
+
+from aiohttp import web
+
+
+# Методы, которые бот вызывает сам для себя: на них не навешиваем ни задержку, ни ошибки.
+SERVICE_METHODS = {"getme", "getupdates", "deletewebhook", "setwebhook", "close", "logout"}
+
+
+class FakeBotApi:
+    # Подменяет api.telegram.org: отвечает как Bot API, с настраиваемыми задержкой, ошибками и 429.
+    def __init__(
+        self,
+        *,
+        latency: float = 0.05,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        retry_after_rate: float = 0.0,
+        retry_after: int = 1,
+        poll_hold: float = 1.0,
+        seed: int | None = None,
+    ) -> None:
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.retry_after_rate = retry_after_rate
+        self.retry_after = retry_after
+        self.poll_hold = poll_hold
+        self.calls: Counter[str] = Counter()
+        self.errors: Counter[str] = Counter()
+        self.retry_afters: Counter[str] = Counter()
+        self._random = random.Random(seed)
+        self._invoice_ids = itertools.count(1)
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        app.router.add_get("/bot{token}/{method}", self.handle)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> tuple[web.AppRunner, int]:
+        runner = web.AppRunner(self.make_app(), access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, host, port)
+        await site.start()
+        return runner, runner.addresses[0][1]
+
+    async def _params(self, request: web.Request) -> dict:
+        if request.content_type == "application/json":
+            return await request.json()
+        return dict(await request.post())
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        key = method.lower()
+        params = await self._params(request)
+        self.calls[method] += 1
+
+        if key == "getupdates":
+            # Long polling: держим соединение, как настоящий сервер, но не дольше poll_hold.
+            timeout = float(params.get("timeout") or 0)
+            await asyncio.sleep(min(timeout, self.poll_hold))
+            return web.json_response({"ok": True, "result": []})
+
+        if key not in SERVICE_METHODS:
+            await asyncio.sleep(max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter)))
+            roll = self._random.random()
+            if roll < self.retry_after_rate:
+                self.retry_afters[method] += 1
+                return web.json_response(
+                    {
+                        "ok": False,
+                        "error_code": 429,
+                        "description": f"Too Many Requests: retry after {self.retry_after}",
+                        "parameters": {"retry_after": self.retry_after},
+                    },
+                    status=429,
+                )
+            if roll < self.retry_after_rate + self.error_rate:
+                self.errors[method] += 1
+                return web.json_response(
+                    {"ok": False, "error_code": 500, "description": "Internal Server Error: injected"},
+                    status=500,
+                )
+
+        return web.json_response({"ok": True, "result": self._result(key, request.match_info["token"])})
+
+    def _result(self, method: str, token: str):
+        if method == "getme":
+            bot_id = int(token.split(":", 1)[0]) if token.split(":", 1)[0].isdigit() else 1
+            return {"id": bot_id, "is_bot": True, "first_name": "Load Test Bot", "username": "loadtest_bot"}
+        if method == "createinvoicelink":
+            return f"https://t.me/$loadtest-invoice-{next(self._invoice_ids)}"
+        return True
+
+
+async def _serve(args: argparse.Namespace) -> None:
+    api = FakeBotApi(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        retry_after_rate=args.retry_after_rate,
+        retry_after=args.retry_after,
+    )
+    runner, port = await api.start(args.host, args.port)
+    print(f"fake Bot API listening on http://{args.host}:{port} (TELEGRAM_API_SERVER=http://{args.host}:{port})")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+def add_fake_api_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds added to every Bot API call")
+    parser.add_argument("--jitter", type=float, default=0.02, help="+/- seconds of random latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of calls answered with 500")
+    parser.add_argument("--retry-after-rate", type=float, default=0.0, help="share of calls answered with 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="retry_after seconds in injected 429s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stand-in Telegram Bot API server for load tests.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    add_fake_api_arguments(parser)
+    try:
+        asyncio.run(_serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
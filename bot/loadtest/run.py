@@ -0,0 +1,202 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import socket
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+import aiohttp
+
+BOT_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BOT_DIR))
+
+import security  # noqa: E402
+from fake_bot_api import FakeBotApi, add_fake_api_arguments  # noqa: E402
+from gifts import TELEGRAM_GIFTS  # noqa: E402
+
+
+BOT_TOKEN = "123456:loadtest-token"
+PRICES = (25, 50, 100)
+ROUTES = ("invoice", "roulette", "leaderboard", "history")
+
+
+def parse_mix(value: str) -> dict[str, float]:
+    mix: dict[str, float] = {}
+    for item in value.split(","):
+        route, _, weight = item.partition("=")
+        if route.strip() not in ROUTES:
+            raise argparse.ArgumentTypeError(f"unknown route in mix: {route}")
+        mix[route.strip()] = float(weight or 1)
+    return mix
+
+
+def percentile(sorted_values: list[float], share: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(share * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _init_data(user_id: int) -> str:
+    user = {"id": user_id, "first_name": "Load", "username": f"load_{user_id}"}
+    return security.sign_init_data({"auth_date": str(int(time.time())), "user": json.dumps(user)}, BOT_TOKEN)
+
+
+class LoadRun:
+    def __init__(self, base_url: str, *, users: int, mix: dict[str, float], seed: int | None) -> None:
+        self.base_url = base_url
+        self.users = [(100000 + index, _init_data(100000 + index)) for index in range(users)]
+        self.routes = list(mix)
+        self.weights = [mix[route] for route in self.routes]
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.statuses: dict[str, Counter[int]] = defaultdict(Counter)
+        self._random = random.Random(seed)
+        self._gift_keys = sorted(TELEGRAM_GIFTS)
+
+    async def _request(self, session: aiohttp.ClientSession, route: str) -> None:
+        user_id, init_data = self._random.choice(self.users)
+        headers = {"X-Telegram-Init-Data": init_data}
+        if route == "invoice":
+            request = session.get(f"{self.base_url}/api/invoice", params={"amount": self._random.choice(PRICES)}, headers=headers)
+        elif route == "roulette":
+            payload = {"gift_key": self._random.choice(self._gift_keys), "spin_price": self._random.choice(PRICES)}
+            request = session.post(f"{self.base_url}/api/roulette/win", json=payload, headers=headers)
+        elif route == "leaderboard":
+            request = session.get(f"{self.base_url}/api/leaderboard", params={"limit": 50}, headers=headers)
+        else:
+            request = session.get(f"{self.base_url}/api/history", params={"limit": 20}, headers=headers)
+
+        started_at = time.perf_counter()
+        try:
+            async with request as response:
+                await response.read()
+                status = response.status
+        except aiohttp.ClientError:
+            status = 0
+        self.latencies[route].append(time.perf_counter() - started_at)
+        self.statuses[route][status] += 1
+
+    async def _worker(self, session: aiohttp.ClientSession, deadline: float) -> None:
+        while time.monotonic() < deadline:
+            route = self._random.choices(self.routes, self.weights)[0]
+            await self._request(session, route)
+
+    async def run(self, *, concurrency: int, duration: float) -> float:
+        connector = aiohttp.TCPConnector(limit=concurrency)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            started_at = time.monotonic()
+            deadline = started_at + duration
+            await asyncio.gather(*(self._worker(session, deadline) for _ in range(concurrency)))
+            return time.monotonic() - started_at
+
+    def report(self, elapsed: float) -> str:
+        lines = [f"{'route':<12}{'requests':>10}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}  statuses"]
+        for route in self.routes:
+            values = sorted(self.latencies[route])
+            statuses = ", ".join(f"{status}: {count}" for status, count in sorted(self.statuses[route].items()))
+            lines.append(
+                f"{route:<12}{len(values):>10}{len(values) / elapsed:>10.1f}"
+                f"{percentile(values, 0.50) * 1000:>10.1f}{percentile(values, 0.95) * 1000:>10.1f}"
+                f"{percentile(values, 0.99) * 1000:>10.1f}  {statuses}"
+            )
+        total = sum(len(values) for values in self.latencies.values())
+        lines.append(f"{'total':<12}{total:>10}{total / elapsed:>10.1f}")
+        return "\n".join(lines)
+
+
+async def _wait_until_ready(base_url: str, process: asyncio.subprocess.Process, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            if process.returncode is not None:
+                raise RuntimeError(f"bot/main.py exited with code {process.returncode}")
+            try:
+                async with session.get(f"{base_url}/api/leaderboard") as response:
+                    # 401 без initData значит, что API поднялся и middleware работают.
+                    if response.status == 401:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"API did not start within {timeout:.0f}s")
+
+
+async def main(args: argparse.Namespace) -> None:
+    fake_api = FakeBotApi(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        retry_after_rate=args.retry_after_rate,
+        retry_after=args.retry_after,
+        seed=args.seed,
+    )
+    fake_runner, fake_port = await fake_api.start()
+    api_port = _free_port()
+    base_url = f"http://127.0.0.1:{api_port}"
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        env = {
+            **os.environ,
+            "BOT_TOKEN": BOT_TOKEN,
+            "WEB_APP_URL": "https://loadtest.invalid",
+            "TELEGRAM_API_SERVER": f"http://127.0.0.1:{fake_port}",
+            "API_HOST": "127.0.0.1",
+            "API_PORT": str(api_port),
+            "API_WORKERS": str(args.api_workers),
+            "DB_PATH": str(Path(tmp_dir) / "loadtest.db"),
+            "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING"),
+        }
+        if not args.keep_rate_limits:
+            # Синтетические пользователи бьют чаще живых, лимиты на пользователя исказили бы замер.
+            env["RATE_LIMIT_ENABLED"] = "0"
+
+        process = await asyncio.create_subprocess_exec(sys.executable, str(BOT_DIR / "main.py"), env=env)
+        try:
+            await _wait_until_ready(base_url, process, args.startup_timeout)
+            run = LoadRun(base_url, users=args.users, mix=args.mix, seed=args.seed)
+            elapsed = await run.run(concurrency=args.concurrency, duration=args.duration)
+        finally:
+            if process.returncode is None:
+                process.send_signal(signal.SIGTERM)
+                try:
+                    await asyncio.wait_for(process.wait(), 30)
+                except asyncio.TimeoutError:
+                    process.kill()
+                    await process.wait()
+            await fake_runner.cleanup()
+
+    print(
+        f"\n{args.users} users, concurrency {args.concurrency}, {elapsed:.1f}s, "
+        f"Bot API latency {args.latency * 1000:.0f}ms, errors {args.error_rate:.0%}, 429 {args.retry_after_rate:.0%}\n"
+    )
+    print(run.report(elapsed))
+    calls = ", ".join(f"{method}: {count}" for method, count in sorted(fake_api.calls.items()))
+    print(f"\nBot API calls: {calls}")
+    if fake_api.errors or fake_api.retry_afters:
+        print(f"injected 500: {dict(fake_api.errors)}, injected 429: {dict(fake_api.retry_afters)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Drive mixed API traffic at bot/main.py backed by a fake Bot API.")
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("invoice=3,roulette=1,leaderboard=4,history=2"))
+    parser.add_argument("--api-workers", type=int, default=1)
+    parser.add_argument("--keep-rate-limits", action="store_true", help="leave per-user rate limits enabled")
+    parser.add_argument("--startup-timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=None)
+    add_fake_api_arguments(parser)
+    asyncio.run(main(parser.parse_args()))
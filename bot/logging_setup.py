@@ -0,0 +1,116 @@
+import copy
+import json
+import logging
+import queue
+import random
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import TextIO
+
+from serialization import dumps
+
+
+# Поля, которые есть у любой записи; все остальное в __dict__ пришло из extra.
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "taskName"}
+
+_sample_rates: dict[str, float] = {}
+
+
+def parse_sample_rates(value: str | None) -> dict[str, float]:
+    rates: dict[str, float] = {}
+    for item in (value or "").split(","):
+        event, separator, rate = item.partition("=")
+        if not separator or not event.strip():
+            continue
+        rates[event.strip()] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+
+def should_log(logger: logging.Logger, event: str, level: int = logging.INFO) -> bool:
+    # Проверяется до сборки extra: отброшенная запись на горячем пути не стоит ничего, кроме этого вызова.
+    if not logger.isEnabledFor(level):
+        return False
+    rate = _sample_rates.get(event)
+    if rate is None:
+        return True
+    return rate > 0 and (rate >= 1 or random.random() < rate)
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "event": record.getMessage(),
+            "process": record.process,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and key not in payload:
+                payload[key] = value
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            payload["exc"] = record.exc_text
+        if record.stack_info:
+            payload["stack"] = self.formatStack(record.stack_info)
+
+        try:
+            return dumps(payload).decode()
+        except TypeError:
+            return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class DroppingQueueHandler(QueueHandler):
+    # Если поток записи не успевает, теряем записи, а не блокируем цикл событий.
+    def __init__(self, log_queue: queue.Queue) -> None:
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Исключение форматируется здесь, пока traceback еще жив; extra остается в записи для JSON.
+        record = copy.copy(record)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure_logging(
+    *,
+    level: str | int = logging.INFO,
+    json_format: bool = True,
+    sample_rates: dict[str, float] | None = None,
+    queue_size: int = 10000,
+    stream: TextIO | None = None,
+) -> QueueListener:
+    _sample_rates.clear()
+    _sample_rates.update(sample_rates or {})
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    if json_format:
+        output.setFormatter(JsonFormatter())
+    else:
+        formatter = logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s")
+        formatter.converter = time.gmtime
+        output.setFormatter(formatter)
+
+    log_queue: queue.Queue = queue.Queue(maxsize=max(1, queue_size))
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(DroppingQueueHandler(log_queue))
+    root.setLevel(level)
+
+    listener = QueueListener(log_queue, output, respect_handler_level=True)
+    listener.start()
+    return listener
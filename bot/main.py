@@ -1,32 +1,259 @@
 from __future__ import annotations
 
 import asyncio
+import signal
+import sys
+from logging.handlers import QueueListener
 
 from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 
 from api import run_api_server
 from bot_handlers import register_bot_handlers
-from config import API_HOST, API_PORT, BOT_TOKEN, DB_PATH, validate_config
+from config import (
+    API_HOST,
+    API_PORT,
+    API_WORKERS,
+    BOT_TOKEN,
+    BOT_WEBHOOK_MAX_CONCURRENCY,
+    BOT_WEBHOOK_PATH,
+    BOT_WEBHOOK_SECRET,
+    BOT_WEBHOOK_URL,
+    DB_BUSY_TIMEOUT_MS,
+    DB_PATH,
+    DB_READ_POOL_SIZE,
+    DB_WRITE_BATCH_MAX,
+    DB_WRITE_BATCH_WINDOW_MS,
+    INVOICE_LINK_CACHE_TTL_SECONDS,
+    LEADERBOARD_INDEX_ENABLED,
+    LEADERBOARD_SYNC_INTERVAL_MS,
+    LOG_FORMAT,
+    LOG_LEVEL,
+    LOG_QUEUE_SIZE,
+    LOG_SAMPLE_RATES,
+    PROFILE_CACHE_SIZE,
+    PROFILE_CACHE_TTL_SECONDS,
+    SHUTDOWN_TIMEOUT_SECONDS,
+    TELEGRAM_API_SERVER,
+    TELEGRAM_CHAT_BURST,
+    TELEGRAM_CHAT_RATE_PER_SECOND,
+    TELEGRAM_GLOBAL_RATE_PER_SECOND,
+    TELEGRAM_RETRY_AFTER_MAX_RETRIES,
+    validate_config,
+)
 from database import Database
+from invoice_cache import InvoiceLinkCache
+from launcher import run_processes
+from logging_setup import configure_logging, parse_sample_rates
+from security import webhook_secret_token
+from telegram_scheduler import TelegramCallScheduler
+from webhook import WebhookUpdates
 
 validate_config()
 
 
+def setup_logging() -> QueueListener:
+    return configure_logging(
+        level=LOG_LEVEL,
+        json_format=LOG_FORMAT == "json",
+        sample_rates=parse_sample_rates(LOG_SAMPLE_RATES),
+        queue_size=LOG_QUEUE_SIZE,
+    )
+
+
+def create_bot(*, processes: int = 1) -> tuple[Bot, TelegramCallScheduler]:
+    if TELEGRAM_API_SERVER:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_SERVER))
+    else:
+        session = AiohttpSession()
+
+    # Глобальный лимит Telegram общий на токен, поэтому процессы делят его поровну.
+    scheduler = TelegramCallScheduler(
+        global_rate=TELEGRAM_GLOBAL_RATE_PER_SECOND / processes,
+        chat_rate=TELEGRAM_CHAT_RATE_PER_SECOND,
+        chat_burst=TELEGRAM_CHAT_BURST,
+        max_retries=TELEGRAM_RETRY_AFTER_MAX_RETRIES,
+    )
+    session.middleware(scheduler)
+    return Bot(BOT_TOKEN, session=session), scheduler
+
+
+def create_database(*, leaderboard_index: bool = LEADERBOARD_INDEX_ENABLED, leaderboard_sync: bool = False) -> Database:
+    return Database(
+        DB_PATH,
+        read_pool_size=DB_READ_POOL_SIZE,
+        write_batch_window=DB_WRITE_BATCH_WINDOW_MS / 1000,
+        write_batch_max=DB_WRITE_BATCH_MAX,
+        leaderboard_index=leaderboard_index,
+        profile_cache_size=PROFILE_CACHE_SIZE,
+        profile_cache_ttl=PROFILE_CACHE_TTL_SECONDS,
+        busy_timeout=DB_BUSY_TIMEOUT_MS / 1000,
+        leaderboard_sync_interval=LEADERBOARD_SYNC_INTERVAL_MS / 1000 if leaderboard_sync else None,
+    )
+
+
+def create_webhook(dp: Dispatcher, bot: Bot) -> WebhookUpdates:
+    return WebhookUpdates(
+        dp,
+        bot,
+        secret_token=BOT_WEBHOOK_SECRET or webhook_secret_token(BOT_TOKEN),
+        max_concurrency=BOT_WEBHOOK_MAX_CONCURRENCY,
+    )
+
+
+async def set_webhook(bot: Bot, dp: Dispatcher, webhook: WebhookUpdates) -> None:
+    await bot.set_webhook(
+        url=BOT_WEBHOOK_URL.rstrip("/") + BOT_WEBHOOK_PATH,
+        secret_token=webhook.secret_token,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+
+
+async def wait_for_stop_signal() -> None:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stop.set)
+    await stop.wait()
+
+
 async def main() -> None:
-    bot = Bot(BOT_TOKEN)
+    bot, scheduler = create_bot()
     dp = Dispatcher()
-    db = Database(DB_PATH)
+    db = create_database()
+    await db.init()
+
+    invoice_links = InvoiceLinkCache(ttl=INVOICE_LINK_CACHE_TTL_SECONDS)
+    register_bot_handlers(dp, db, invoice_links)
+
+    if not BOT_WEBHOOK_URL:
+        runner = await run_api_server(
+            bot,
+            db,
+            API_HOST,
+            API_PORT,
+            invoice_links=invoice_links,
+            telegram_scheduler=scheduler,
+        )
+        try:
+            # Оставшийся от webhook-режима адрес не дает getUpdates работать.
+            await bot.delete_webhook()
+            # Сессию закрываем сами после остановки API: иначе идущие отправки подарков оборвутся.
+            await dp.start_polling(bot, close_bot_session=False)
+        finally:
+            await runner.cleanup()
+            await db.close()
+            await bot.session.close()
+        return
+
+    webhook = create_webhook(dp, bot)
+    runner = await run_api_server(
+        bot,
+        db,
+        API_HOST,
+        API_PORT,
+        invoice_links=invoice_links,
+        telegram_scheduler=scheduler,
+        webhook=webhook,
+        webhook_path=BOT_WEBHOOK_PATH,
+    )
+    await dp.emit_startup(bot=bot)
+    await set_webhook(bot, dp, webhook)
+    try:
+        await wait_for_stop_signal()
+    finally:
+        await dp.emit_shutdown(bot=bot)
+        await runner.cleanup()
+        await db.close()
+        await bot.session.close()
+
+
+async def serve_api(worker: int, processes: int) -> None:
+    bot, scheduler = create_bot(processes=processes)
+    db = create_database(leaderboard_sync=True)
     await db.init()
+    invoice_links = InvoiceLinkCache(ttl=INVOICE_LINK_CACHE_TTL_SECONDS)
 
-    api_task = asyncio.create_task(run_api_server(bot, db, API_HOST, API_PORT))
+    # В режиме webhook обновления принимает любой API-воркер, отдельный процесс бота не нужен.
+    dp = webhook = None
+    if BOT_WEBHOOK_URL:
+        dp = Dispatcher()
+        register_bot_handlers(dp, db, invoice_links)
+        webhook = create_webhook(dp, bot)
+
+    runner = await run_api_server(
+        bot,
+        db,
+        API_HOST,
+        API_PORT,
+        invoice_links=invoice_links,
+        telegram_scheduler=scheduler,
+        webhook=webhook,
+        webhook_path=BOT_WEBHOOK_PATH,
+        reuse_port=True,
+    )
+    if dp is not None:
+        await dp.emit_startup(bot=bot)
+        if worker == 0:
+            await set_webhook(bot, dp, webhook)
+
+    try:
+        await wait_for_stop_signal()
+    finally:
+        if dp is not None:
+            await dp.emit_shutdown(bot=bot)
+        await runner.cleanup()
+        await db.close()
+        await bot.session.close()
+
+
+async def serve_bot(processes: int) -> None:
+    bot, _ = create_bot(processes=processes)
+    dp = Dispatcher()
+    # Процессу обновлений индекс лидерборда не нужен: его читают только API-воркеры.
+    db = create_database(leaderboard_index=False)
+    await db.init()
 
     register_bot_handlers(dp, db)
 
     try:
+        await bot.delete_webhook()
         await dp.start_polling(bot)
     finally:
-        api_task.cancel()
+        await db.close()
+
+
+def run_api_worker(worker: int, processes: int) -> None:
+    # Дочерние процессы стартуют через spawn и настраивают логирование сами.
+    listener = setup_logging()
+    try:
+        asyncio.run(serve_api(worker, processes))
+    finally:
+        listener.stop()
+
+
+def run_bot_worker(processes: int) -> None:
+    listener = setup_logging()
+    try:
+        asyncio.run(serve_bot(processes))
+    finally:
+        listener.stop()
+
+
+def run_multiprocess(workers: int) -> int:
+    processes = workers if BOT_WEBHOOK_URL else workers + 1
+    targets = [(f"api-{worker}", run_api_worker, (worker, processes)) for worker in range(workers)]
+    if not BOT_WEBHOOK_URL:
+        targets.append(("bot", run_bot_worker, (processes,)))
+    return run_processes(targets, shutdown_timeout=SHUTDOWN_TIMEOUT_SECONDS)
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    listener = setup_logging()
+    try:
+        if API_WORKERS > 1:
+            sys.exit(run_multiprocess(API_WORKERS))
+        asyncio.run(main())
+    finally:
+        listener.stop()
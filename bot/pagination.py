@@ -0,0 +1,34 @@
+import base64
+import binascii
+
+from serialization import dumps, loads
+
+
+# Значения курсора уходят в SQL как есть; за пределами INTEGER sqlite3 бросает OverflowError.
+SQLITE_MIN_INTEGER = -(2**63)
+SQLITE_MAX_INTEGER = 2**63 - 1
+
+
+def encode_cursor(*values: int | str) -> str:
+    raw = dumps(list(values))
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str, types: tuple[type, ...]) -> tuple | None:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = loads(raw)
+    except (binascii.Error, ValueError):
+        return None
+
+    if not isinstance(values, list) or len(values) != len(types):
+        return None
+
+    # bool — подкласс int, поэтому сравниваем типы строго.
+    if any(type(value) is not expected for value, expected in zip(values, types)):
+        return None
+
+    if any(type(value) is int and not SQLITE_MIN_INTEGER <= value <= SQLITE_MAX_INTEGER for value in values):
+        return None
+
+    return tuple(values)
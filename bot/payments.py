@@ -1,6 +1,7 @@
-import json
 from dataclasses import dataclass
 
+from serialization import JSONDecodeError, dumps_str, loads
+
 
 @dataclass(frozen=True)
 class PaymentValidationResult:
@@ -9,13 +10,13 @@ class PaymentValidationResult:
 
 
 def build_invoice_payload(amount: int, user_id: int) -> str:
-    return json.dumps({"amount": amount, "user_id": user_id})
+    return dumps_str({"amount": amount, "user_id": user_id})
 
 
 def parse_invoice_payload(payload: str) -> dict | None:
     try:
-        data = json.loads(payload)
-    except json.JSONDecodeError:
+        data = loads(payload)
+    except JSONDecodeError:
         return None
 
     if not isinstance(data, dict):
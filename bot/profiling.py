@@ -0,0 +1,169 @@
+import asyncio
+import cProfile
+import itertools
+import logging
+import re
+import time
+import tracemalloc
+from collections import deque
+from pathlib import Path
+
+from aiohttp import web
+
+from security import secrets_match
+
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "X-Profile-Request"
+PROFILE_MODE_HEADER = "X-Profile-Mode"
+MODE_CPROFILE = "cprofile"
+MODE_TRACEMALLOC = "tracemalloc"
+MODES = (MODE_CPROFILE, MODE_TRACEMALLOC)
+
+
+def _slug(value: str) -> str:
+    return re.sub(r"[^A-Za-z0-9]+", "_", value).strip("_") or "root"
+
+
+class RequestProfiler:
+    # cProfile и tracemalloc глобальны для процесса, поэтому одновременно профилируется только один запрос.
+    # Остальные запросы цикла событий попадают в тот же профиль — это нужно учитывать при чтении.
+    # В режиме tracemalloc копирование трасс для снимка все равно держит GIL, а трассировка замедляет
+    # каждую аллокацию процесса, поэтому под боевой нагрузкой этот режим не включают.
+    def __init__(
+        self,
+        directory: Path,
+        *,
+        secret: str | None = None,
+        mode: str = MODE_CPROFILE,
+        sample_every: int = 0,
+        max_files: int = 200,
+        recent_requests: int = 1000,
+    ) -> None:
+        if mode not in MODES:
+            raise ValueError(f"unknown profiling mode: {mode}")
+
+        self.directory = directory
+        self.secret = secret
+        self.mode = mode
+        self.sample_every = max(0, sample_every)
+        self.max_files = max(1, max_files)
+        self.profiled = 0
+        self.skipped = 0
+        self._requests = itertools.count(1)
+        self._recent: deque[dict] = deque(maxlen=max(1, recent_requests))
+        self._active = False
+
+    def authorized(self, request: web.Request) -> bool:
+        return bool(self.secret) and secrets_match(self.secret, request.headers.get(PROFILE_HEADER, ""))
+
+    def _requested_mode(self, request: web.Request) -> str | None:
+        if self.authorized(request):
+            mode = request.headers.get(PROFILE_MODE_HEADER, self.mode)
+            return mode if mode in MODES else self.mode
+        if self.sample_every and next(self._requests) % self.sample_every == 0:
+            return self.mode
+        return None
+
+    @web.middleware
+    async def middleware(self, request: web.Request, handler):
+        mode = self._requested_mode(request)
+        if mode is not None and self._active:
+            self.skipped += 1
+            mode = None
+
+        profile = None
+        started_tracing = False
+        if mode == MODE_CPROFILE:
+            self._active = True
+            profile = cProfile.Profile()
+            profile.enable()
+        elif mode == MODE_TRACEMALLOC:
+            self._active = True
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(10)
+                started_tracing = True
+            # Снимки, сравнение и форматирование отчета идут в потоке, чтобы не останавливать остальные запросы.
+            try:
+                profile = await asyncio.to_thread(tracemalloc.take_snapshot)
+            except BaseException:
+                if started_tracing:
+                    tracemalloc.stop()
+                self._active = False
+                raise
+
+        started_at = time.perf_counter()
+        status = 500
+        try:
+            response = await handler(request)
+            status = response.status
+            return response
+        except web.HTTPException as exc:
+            status = exc.status
+            raise
+        finally:
+            duration = time.perf_counter() - started_at
+            try:
+                if mode == MODE_CPROFILE:
+                    profile.disable()
+                elif mode == MODE_TRACEMALLOC:
+                    profile = (await asyncio.to_thread(tracemalloc.take_snapshot), profile)
+            finally:
+                if started_tracing:
+                    tracemalloc.stop()
+                self._active = False
+
+            resource = request.match_info.route.resource
+            route = resource.canonical if resource is not None else "unmatched"
+            user = request.get("user") or {}
+            entry = {
+                "route": route,
+                "method": request.method,
+                "status": status,
+                "userId": user.get("id"),
+                "durationMs": round(duration * 1000, 3),
+                "startedAt": round(time.time() - duration, 3),
+                "profile": None,
+            }
+            self._recent.append(entry)
+
+            if mode is not None:
+                self.profiled += 1
+                entry["profile"] = await self._save(mode, profile, entry)
+
+    async def _save(self, mode: str, data, entry: dict) -> str | None:
+        name = "{}-{}-{}-u{}-{}ms.{}".format(
+            int(entry["startedAt"] * 1000),
+            entry["method"].lower(),
+            _slug(entry["route"]),
+            entry["userId"] if entry["userId"] is not None else "anon",
+            int(entry["durationMs"]),
+            "prof" if mode == MODE_CPROFILE else "txt",
+        )
+        try:
+            await asyncio.to_thread(self._write_sync, self.directory / name, mode, data)
+        except OSError:
+            logger.exception("request_profile_write_failed", extra={"route": entry["route"]})
+            return None
+
+        logger.info("request_profiled", extra={"route": entry["route"], "mode": mode, "file": name})
+        return name
+
+    def _write_sync(self, path: Path, mode: str, data) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        if mode == MODE_CPROFILE:
+            data.dump_stats(path)
+        else:
+            snapshot, baseline = data
+            report = snapshot.compare_to(baseline, "lineno")
+            path.write_text("\n".join(str(stat) for stat in report[:50]) + "\n", encoding="utf-8")
+
+        # Каталог ротируется по количеству файлов: в имени первым идет время, так что старые сортируются первыми.
+        files = sorted(file for file in self.directory.iterdir() if file.suffix in (".prof", ".txt"))
+        for stale in files[: max(0, len(files) - self.max_files)]:
+            stale.unlink(missing_ok=True)
+
+    def slowest(self, limit: int = 20) -> list[dict]:
+        return sorted(self._recent, key=lambda entry: entry["durationMs"], reverse=True)[:limit]
+
@@ -0,0 +1,98 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Callable
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float, *, clock: Callable[[], float] = time.monotonic) -> None:
+        if not rate > 0:
+            raise ValueError(f"rate must be greater than 0, got {rate}")
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._tokens = capacity
+        self._updated_at = clock()
+        self._blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    @property
+    def idle(self) -> bool:
+        now = self._clock()
+        self._refill(now)
+        return self._tokens >= self.capacity and now >= self._blocked_until
+
+    def try_acquire(self, tokens: float = 1.0) -> float:
+        # Возвращает 0, если токены списаны, иначе сколько секунд подождать до следующей попытки.
+        now = self._clock()
+        if now < self._blocked_until:
+            return self._blocked_until - now
+
+        self._refill(now)
+        if self._tokens >= tokens:
+            self._tokens -= tokens
+            return 0.0
+        return (tokens - self._tokens) / self.rate
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        while (delay := self.try_acquire(tokens)) > 0:
+            await asyncio.sleep(delay)
+
+    def block(self, seconds: float) -> None:
+        now = self._clock()
+        self._blocked_until = max(self._blocked_until, now + seconds)
+        self._refill(now)
+        self._tokens = 0.0
+
+
+class AdmissionControl:
+    # Бюджеты задаются как (запросов в минуту, размер всплеска) и считаются отдельно для каждой пары (маршрут, пользователь).
+    def __init__(
+        self,
+        *,
+        budgets: dict[str, tuple[float, float]],
+        default_budget: tuple[float, float],
+        shed_queue_depth: int = 0,
+        max_keys: int = 100000,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        # Корзины создаются при первом запросе, поэтому нулевой бюджет проверяем сразу, а не ответом 500.
+        for route, (per_minute, _) in {**budgets, "default": default_budget}.items():
+            if not per_minute > 0:
+                raise ValueError(f"rate limit for {route} must be greater than 0, got {per_minute}")
+        self.budgets = budgets
+        self.default_budget = default_budget
+        self.shed_queue_depth = shed_queue_depth
+        self.max_keys = max_keys
+        self.rate_limited = 0
+        self.shed = 0
+        self._clock = clock
+        self._buckets: OrderedDict[tuple[str, int], TokenBucket] = OrderedDict()
+
+    def should_shed(self, queue_depth: int) -> bool:
+        if not self.shed_queue_depth or queue_depth < self.shed_queue_depth:
+            return False
+        self.shed += 1
+        return True
+
+    def admit(self, route: str, user_id: int) -> float:
+        key = (route, user_id)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            per_minute, burst = self.budgets.get(route, self.default_budget)
+            bucket = TokenBucket(per_minute / 60, burst, clock=self._clock)
+            self._buckets[key] = bucket
+            # Выбрасываем самую давнюю корзину даже если она не полна: лимит для ее владельца лишь ненадолго
+            # станет мягче, зато память ограничена при любом числе пользователей.
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+
+        delay = bucket.try_acquire()
+        if delay > 0:
+            self.rate_limited += 1
+        return delay
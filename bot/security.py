@@ -1,11 +1,57 @@
+import base64
+import binascii
+import functools
 import hashlib
 import hmac
-import json
 import time
-from urllib.parse import parse_qsl
+from collections import OrderedDict
+from urllib.parse import parse_qsl, urlencode
 
+from serialization import JSONDecodeError, dumps, loads
 
-def verify_telegram_init_data(init_data: str, bot_token: str, max_age_seconds: int) -> dict | None:
+
+VERIFIED_INIT_DATA_CACHE_SIZE = 10000
+VERIFIED_INIT_DATA_CACHE_TTL_SECONDS = 600
+SESSION_TOKEN_USER_FIELDS = ("id", "username", "first_name", "last_name", "photo_url")
+
+# Ключ — keyed-дайджест сырой initData, значение — (разобранные данные, auth_date, время проверки).
+_verified_init_data: OrderedDict[bytes, tuple[dict, int, float]] = OrderedDict()
+
+
+@functools.lru_cache(maxsize=8)
+def _secret_key(bot_token: str) -> bytes:
+    return hmac.new(b"WebAppData", bot_token.encode(), hashlib.sha256).digest()
+
+
+@functools.lru_cache(maxsize=8)
+def _session_secret_key(bot_token: str) -> bytes:
+    return hmac.new(b"SessionToken", bot_token.encode(), hashlib.sha256).digest()
+
+
+def webhook_secret_token(bot_token: str) -> str:
+    return hmac.new(b"WebhookSecret", bot_token.encode(), hashlib.sha256).hexdigest()
+
+
+def secrets_match(expected: str, received: str) -> bool:
+    # compare_digest на str принимает только ASCII, а received приходит от клиента как есть.
+    return received.isascii() and hmac.compare_digest(expected.encode(), received.encode())
+
+
+def _is_fresh(auth_date: int, max_age_seconds: int) -> bool:
+    now = int(time.time())
+    return now - max_age_seconds <= auth_date <= now + 30
+
+
+def _data_check_string(data: dict) -> str:
+    return "\n".join(f"{key}={value}" for key, value in sorted(data.items()))
+
+
+def sign_init_data(data: dict, bot_token: str) -> str:
+    received_hash = hmac.new(_secret_key(bot_token), _data_check_string(data).encode(), hashlib.sha256).hexdigest()
+    return urlencode({**data, "hash": received_hash})
+
+
+def _verify_signature(init_data: str, secret_key: bytes) -> tuple[dict, int] | None:
     data = dict(parse_qsl(init_data, keep_blank_values=True))
     received_hash = data.pop("hash", None)
     if not received_hash:
@@ -20,17 +66,60 @@ def verify_telegram_init_data(init_data: str, bot_token: str, max_age_seconds: i
     except ValueError:
         return None
 
-    now = int(time.time())
-    if auth_date < now - max_age_seconds or auth_date > now + 30:
+    try:
+        data_check_string = _data_check_string(data).encode()
+    except UnicodeEncodeError:
+        return None
+
+    calculated_hash = hmac.new(secret_key, data_check_string, hashlib.sha256).hexdigest()
+    if not secrets_match(calculated_hash, received_hash):
+        return None
+
+    return data, auth_date
+
+
+def verify_telegram_init_data(init_data: str, bot_token: str, max_age_seconds: int) -> dict | None:
+    secret_key = _secret_key(bot_token)
+    # aiohttp превращает байты не в UTF-8 в суррогаты; surrogatepass не дает ключу кэша упасть на них.
+    cache_key = hashlib.blake2b(init_data.encode("utf-8", "surrogatepass"), key=secret_key, digest_size=16).digest()
+    monotonic_now = time.monotonic()
+
+    cached = _verified_init_data.get(cache_key)
+    if cached is not None and monotonic_now - cached[2] < VERIFIED_INIT_DATA_CACHE_TTL_SECONDS:
+        data, auth_date, _ = cached
+        if not _is_fresh(auth_date, max_age_seconds):
+            _verified_init_data.pop(cache_key, None)
+            return None
+        _verified_init_data.move_to_end(cache_key)
+        return dict(data)
+
+    verified = _verify_signature(init_data, secret_key)
+    if verified is None:
+        return None
+
+    data, auth_date = verified
+    if not _is_fresh(auth_date, max_age_seconds):
+        return None
+
+    _verified_init_data[cache_key] = (data, auth_date, monotonic_now)
+    _verified_init_data.move_to_end(cache_key)
+    while len(_verified_init_data) > VERIFIED_INIT_DATA_CACHE_SIZE:
+        _verified_init_data.popitem(last=False)
+
+    return dict(data)
+
+
+@functools.lru_cache(maxsize=VERIFIED_INIT_DATA_CACHE_SIZE)
+def _parse_user(user_raw: str) -> dict | None:
+    try:
+        user = loads(user_raw)
+    except JSONDecodeError:
         return None
 
-    data_check_string = "\n".join(f"{key}={value}" for key, value in sorted(data.items()))
-    secret_key = hmac.new(b"WebAppData", bot_token.encode(), hashlib.sha256).digest()
-    calculated_hash = hmac.new(secret_key, data_check_string.encode(), hashlib.sha256).hexdigest()
-    if calculated_hash != received_hash:
+    if not isinstance(user, dict) or not isinstance(user.get("id"), int):
         return None
 
-    return data
+    return user
 
 
 def extract_user_from_init_data(parsed_init_data: dict) -> dict | None:
@@ -38,12 +127,49 @@ def extract_user_from_init_data(parsed_init_data: dict) -> dict | None:
     if not user_raw:
         return None
 
+    user = _parse_user(user_raw)
+    return dict(user) if user is not None else None
+
+
+def _session_mac(body: str, bot_token: str) -> str:
+    digest = hmac.new(_session_secret_key(bot_token), body.encode(), hashlib.sha256).digest()[:16]
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
+
+
+def issue_session_token(
+    user: dict,
+    bot_token: str,
+    ttl_seconds: int,
+    *,
+    not_after: int | None = None,
+) -> tuple[str, int]:
+    expires_at = int(time.time()) + ttl_seconds
+    if not_after is not None:
+        expires_at = min(expires_at, not_after)
+    claims = [expires_at, *(user.get(field) for field in SESSION_TOKEN_USER_FIELDS)]
+    body = base64.urlsafe_b64encode(dumps(claims)).rstrip(b"=").decode()
+    return f"{body}.{_session_mac(body, bot_token)}", expires_at
+
+
+def verify_session_token(token: str, bot_token: str) -> dict | None:
+    body, separator, mac = token.partition(".")
+    if not separator or not body.isascii() or not secrets_match(_session_mac(body, bot_token), mac):
+        return None
+
     try:
-        user = json.loads(user_raw)
-    except json.JSONDecodeError:
+        claims = loads(base64.urlsafe_b64decode(body + "=" * (-len(body) % 4)))
+    except (binascii.Error, ValueError):
         return None
 
-    if not isinstance(user, dict) or not isinstance(user.get("id"), int):
+    if not isinstance(claims, list) or len(claims) != len(SESSION_TOKEN_USER_FIELDS) + 1:
+        return None
+
+    expires_at, *values = claims
+    if not isinstance(expires_at, int) or expires_at < time.time():
+        return None
+
+    user = dict(zip(SESSION_TOKEN_USER_FIELDS, values))
+    if not isinstance(user["id"], int):
         return None
 
     return user
@@ -0,0 +1,37 @@
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+
+# orjson.JSONDecodeError наследуется от json.JSONDecodeError, поэтому одного типа хватает для обоих бэкендов.
+# Стандартный json на байтах не в UTF-8 бросает UnicodeDecodeError, его приводим к тому же типу ниже.
+JSONDecodeError = json.JSONDecodeError
+
+if orjson is not None:
+    BACKEND = "orjson"
+
+    def dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj)
+
+    def loads(data: bytes | str) -> Any:
+        return orjson.loads(data)
+
+else:
+    BACKEND = "json"
+
+    def dumps(obj: Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode()
+
+    def loads(data: bytes | str) -> Any:
+        try:
+            return json.loads(data)
+        except UnicodeDecodeError as exc:
+            raise JSONDecodeError(str(exc), "", 0) from exc
+
+
+def dumps_str(obj: Any) -> str:
+    return dumps(obj).decode()
@@ -0,0 +1,130 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Coroutine, Hashable
+
+
+logger = logging.getLogger(__name__)
+
+POLICY_DROP = "drop"
+POLICY_COALESCE = "coalesce"
+POLICY_BLOCK = "block"
+POLICIES = (POLICY_DROP, POLICY_COALESCE, POLICY_BLOCK)
+
+
+class BackgroundTaskSupervisor:
+    # Фоновая работа идет через ограниченную очередь и фиксированное число воркеров,
+    # чтобы всплеск запросов не превращался в тысячи висящих задач.
+    def __init__(self, *, max_concurrency: int = 8, max_queue: int = 1000, policy: str = POLICY_COALESCE) -> None:
+        if policy not in POLICIES:
+            raise ValueError(f"unknown background task policy: {policy}")
+
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(1, max_queue)
+        self.policy = policy
+        self.submitted = 0
+        self.completed = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.failed = 0
+        self.running = 0
+        self._queue: OrderedDict[Hashable, tuple[str, Coroutine]] = OrderedDict()
+        self._workers: set[asyncio.Task] = set()
+        self._space_available = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._closing = False
+
+    @property
+    def queued(self) -> int:
+        return len(self._queue)
+
+    def _drop(self, coro: Coroutine, label: str, reason: str) -> bool:
+        coro.close()
+        self.dropped += 1
+        logger.warning("background_task_dropped", extra={"label": label, "reason": reason})
+        return False
+
+    async def submit(self, coro: Coroutine, *, label: str, key: Hashable | None = None) -> bool:
+        if self._closing:
+            return self._drop(coro, label, "closing")
+
+        coalesce = self.policy == POLICY_COALESCE and key is not None
+        while True:
+            # Для одного ключа важен только последний вызов (например, свежий профиль пользователя).
+            if coalesce and key in self._queue:
+                _, superseded = self._queue[key]
+                superseded.close()
+                self._queue[key] = (label, coro)
+                self.coalesced += 1
+                return True
+
+            if len(self._queue) < self.max_queue:
+                break
+            if self.policy != POLICY_BLOCK:
+                return self._drop(coro, label, "queue_full")
+
+            self._space_available.clear()
+            await self._space_available.wait()
+            if self._closing:
+                return self._drop(coro, label, "closing")
+
+        self._queue[key if coalesce else object()] = (label, coro)
+        self.submitted += 1
+        self._idle.clear()
+        self._ensure_workers()
+        return True
+
+    def _ensure_workers(self) -> None:
+        while len(self._workers) < min(self.max_concurrency, len(self._queue) + self.running):
+            worker = asyncio.create_task(self._run_worker())
+            self._workers.add(worker)
+            worker.add_done_callback(self._on_worker_done)
+
+    def _on_worker_done(self, worker: asyncio.Task) -> None:
+        self._workers.discard(worker)
+        # Задача могла попасть в очередь, пока воркер уже выходил из цикла.
+        if self._queue and not worker.cancelled():
+            self._ensure_workers()
+        elif not self._workers and not self._queue:
+            self._idle.set()
+
+    async def _run_worker(self) -> None:
+        while self._queue:
+            _, (label, coro) = self._queue.popitem(last=False)
+            self._space_available.set()
+            self.running += 1
+            try:
+                await coro
+            except Exception:
+                self.failed += 1
+                logger.exception("background_task_failed", extra={"label": label})
+            else:
+                self.completed += 1
+            finally:
+                self.running -= 1
+
+    async def join(self) -> None:
+        await self._idle.wait()
+
+    async def close(self, timeout: float = 10.0) -> None:
+        self._closing = True
+        self._space_available.set()
+        try:
+            await asyncio.wait_for(self.join(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+        if not self._workers:
+            return
+
+        abandoned = len(self._queue) + self.running
+        for worker in list(self._workers):
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        for _, coro in self._queue.values():
+            coro.close()
+        self._queue.clear()
+        self._idle.set()
+        self.dropped += abandoned
+        logger.warning("background_tasks_abandoned", extra={"count": abandoned})
@@ -0,0 +1,174 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import OrderedDict
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import (
+    AnswerPreCheckoutQuery,
+    CreateInvoiceLink,
+    GetUpdates,
+    RefundStarPayment,
+    Response,
+    SendGift,
+    TelegramMethod,
+)
+
+from metrics import TELEGRAM_ERRORS, TELEGRAM_REQUEST_SECONDS, TELEGRAM_WAIT_SECONDS
+from rate_limit import TokenBucket
+
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_PAYMENTS = 0
+PRIORITY_GIFTS = 1
+PRIORITY_CHAT = 2
+PRIORITY_NAMES = {PRIORITY_PAYMENTS: "payments", PRIORITY_GIFTS: "gifts", PRIORITY_CHAT: "chat"}
+
+PAYMENT_METHODS = (AnswerPreCheckoutQuery, CreateInvoiceLink, RefundStarPayment)
+GIFT_METHODS = (SendGift,)
+# Long polling не отправляет ничего пользователям и не расходует лимиты.
+EXEMPT_METHODS = (GetUpdates,)
+
+
+def method_priority(method: TelegramMethod) -> int | None:
+    if isinstance(method, EXEMPT_METHODS):
+        return None
+    if isinstance(method, PAYMENT_METHODS):
+        return PRIORITY_PAYMENTS
+    if isinstance(method, GIFT_METHODS):
+        return PRIORITY_GIFTS
+    return PRIORITY_CHAT
+
+
+def method_chat_id(method: TelegramMethod) -> int | str | None:
+    chat_id = getattr(method, "chat_id", None)
+    if chat_id is None and isinstance(method, SendGift):
+        chat_id = method.user_id
+    return chat_id
+
+
+class TelegramCallScheduler(BaseRequestMiddleware):
+    # Общий лимит Bot API раздается по приоритету: платежи, затем подарки, затем ответы в чат.
+    def __init__(
+        self,
+        *,
+        global_rate: float = 30.0,
+        chat_rate: float = 1.0,
+        chat_burst: float = 3.0,
+        max_retries: int = 3,
+        max_chats: int = 10000,
+    ) -> None:
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.max_chats = max_chats
+        self.calls = 0
+        self.retries = 0
+        self._chat_buckets: OrderedDict[int | str, TokenBucket] = OrderedDict()
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._pump_task: asyncio.Task | None = None
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    def queue_depths(self) -> dict[str, int]:
+        depths = dict.fromkeys(PRIORITY_NAMES.values(), 0)
+        for priority, _, future in self._waiters:
+            if not future.done():
+                depths[PRIORITY_NAMES[priority]] += 1
+        return depths
+
+    def _chat_bucket(self, chat_id: int | str) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self._chat_buckets[chat_id] = bucket
+            # Вытесняем только полностью восстановившиеся корзины, чтобы не сбросить чужой лимит.
+            while len(self._chat_buckets) > self.max_chats:
+                oldest_id, oldest = next(iter(self._chat_buckets.items()))
+                if not oldest.idle:
+                    break
+                del self._chat_buckets[oldest_id]
+        else:
+            self._chat_buckets.move_to_end(chat_id)
+        return bucket
+
+    async def _acquire_global(self, priority: int) -> None:
+        if not self._waiters and self.global_bucket.try_acquire() == 0:
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        if self._pump_task is None or self._pump_task.done():
+            self._pump_task = asyncio.create_task(self._pump())
+        await future
+
+    async def _pump(self) -> None:
+        while self._waiters:
+            future = self._waiters[0][2]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+
+            delay = self.global_bucket.try_acquire()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+
+            heapq.heappop(self._waiters)
+            future.set_result(None)
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType,
+        bot,
+        method: TelegramMethod,
+    ) -> Response:
+        priority = method_priority(method)
+        if priority is None:
+            return await make_request(bot, method)
+
+        method_name = type(method).__name__
+        chat_id = method_chat_id(method)
+        attempt = 0
+        while True:
+            waiting_since = time.perf_counter()
+            if chat_id is not None:
+                await self._chat_bucket(chat_id).acquire()
+            await self._acquire_global(priority)
+            started_at = time.perf_counter()
+            TELEGRAM_WAIT_SECONDS.observe(started_at - waiting_since, method_name)
+
+            self.calls += 1
+            try:
+                response = await make_request(bot, method)
+            except Exception as exc:
+                TELEGRAM_REQUEST_SECONDS.observe(time.perf_counter() - started_at, method_name, "error")
+                TELEGRAM_ERRORS.inc(method_name, type(exc).__name__)
+                if not isinstance(exc, TelegramRetryAfter) or attempt >= self.max_retries:
+                    raise
+
+                attempt += 1
+                self.retries += 1
+                logger.warning(
+                    "telegram_retry_after",
+                    extra={
+                        "method": method_name,
+                        "chat_id": chat_id,
+                        "retry_after": exc.retry_after,
+                        "attempt": attempt,
+                    },
+                )
+                # Флуд-контроль с chat_id относится к одному чату, остальные вызовы продолжают идти.
+                bucket = self._chat_bucket(chat_id) if chat_id is not None else self.global_bucket
+                bucket.block(exc.retry_after)
+            else:
+                TELEGRAM_REQUEST_SECONDS.observe(time.perf_counter() - started_at, method_name, "ok")
+                return response
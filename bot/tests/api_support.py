@@ -0,0 +1,56 @@
+import json
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import AsyncMock, patch
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from bot.api import create_app
+from bot.database import Database
+from bot.security import sign_init_data
+
+
+BOT_TOKEN = "123456:test-token"
+
+
+def sign_test_init_data(user_id: int) -> str:
+    return sign_init_data(
+        {"auth_date": str(int(time.time())), "user": json.dumps({"id": user_id, "username": f"user_{user_id}"})},
+        BOT_TOKEN,
+    )
+
+
+class ApiTestCase(unittest.IsolatedAsyncioTestCase):
+    # Приложение на временной базе с подписанной initData пользователя 777. Наборы тестов добавляют свои
+    # патчи настроек через app_patches и собирают приложение по-своему через build_app.
+    async def asyncSetUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.tmp_path = Path(self._tmp_dir.name)
+        self.db = Database(self.tmp_path / "app.db")
+        await self.db.init()
+        self.bot = AsyncMock()
+        self._patches = [patch("bot.api.BOT_TOKEN", BOT_TOKEN), *self.app_patches()]
+        for active_patch in self._patches:
+            active_patch.start()
+        self.client = TestClient(TestServer(self.build_app()))
+        await self.client.start_server()
+        self.headers = {"X-Telegram-Init-Data": self._init_data(777)}
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        for active_patch in self._patches:
+            active_patch.stop()
+        await self.db.close()
+        self._tmp_dir.cleanup()
+
+    def app_patches(self) -> list:
+        return []
+
+    def build_app(self) -> web.Application:
+        return create_app(self.bot, self.db)
+
+    def _init_data(self, user_id: int) -> str:
+        return sign_test_init_data(user_id)
@@ -0,0 +1,163 @@
+import asyncio
+import base64
+import json
+import unittest
+from unittest.mock import patch
+
+from bot.database import Database
+from bot.tests.api_support import ApiTestCase
+
+
+class ApiTest(ApiTestCase):
+    async def test_leaderboard_answers_not_modified_until_page_changes(self):
+        await self.db.add_spent_stars(1, 50)
+
+        response = await self.client.get("/api/leaderboard", headers=self.headers)
+        etag = response.headers["ETag"]
+        self.assertEqual((await response.json())["leaderboard"][0]["userId"], 1)
+
+        response = await self.client.get("/api/leaderboard", headers={**self.headers, "If-None-Match": etag})
+        self.assertEqual(response.status, 304)
+
+        await self.db.add_spent_stars(2, 100)
+        response = await self.client.get("/api/leaderboard", headers={**self.headers, "If-None-Match": etag})
+        self.assertEqual(response.status, 200)
+        self.assertNotEqual(response.headers["ETag"], etag)
+        self.assertEqual((await response.json())["leaderboard"][0]["userId"], 2)
+
+    async def test_leaderboard_stream_pushes_spend_updates(self):
+        with patch("bot.api.LEADERBOARD_STREAM_KEEPALIVE_SECONDS", 5):
+            response = await self.client.get("/api/leaderboard/stream", headers=self.headers)
+            self.assertEqual(response.headers["Content-Type"], "text/event-stream")
+            self.assertEqual(await response.content.readuntil(b"\n\n"), b"retry: 3000\n\n")
+
+            await self.db.add_spent_stars(777, 100)
+            event = await asyncio.wait_for(response.content.readuntil(b"\n\n"), timeout=5)
+            response.close()
+
+        self.assertTrue(event.startswith(b"event: leaderboard\n"))
+        entries = json.loads(event.split(b"data: ", 1)[1])["entries"]
+        self.assertEqual(entries[0]["userId"], 777)
+        self.assertEqual(entries[0]["spentStars"], 100)
+
+    async def test_batch_returns_all_start_screen_queries_in_one_response(self):
+        await self.db.add_spent_stars(1, 50)
+        await self.db.add_action_history(user_id=777, action_type="won", gift_key="rose", gift_name="Rose")
+
+        response = await self.client.post(
+            "/api/batch",
+            headers=self.headers,
+            json={
+                "queries": [
+                    {"type": "leaderboard", "limit": 10},
+                    {"type": "history"},
+                    {"type": "me", "radius": 1},
+                    {"type": "gifts"},
+                    {"type": "history", "limit": 0},
+                    {"type": "unknown"},
+                ]
+            },
+        )
+
+        results = (await response.json())["results"]
+        self.assertEqual(response.status, 200)
+        self.assertEqual([result["status"] for result in results], [200, 200, 200, 200, 400, 400])
+        self.assertEqual(results[1]["data"]["history"][0]["giftId"], "rose")
+        self.assertEqual(results[2]["data"]["rank"], 2)
+        self.assertIn({"giftId": "rose", "giftName": "Rose"}, results[3]["data"]["gifts"])
+        self.assertEqual(results[4]["error"], "invalid_pagination")
+
+    async def test_batch_rejects_missing_or_oversized_query_list(self):
+        for payload in ({}, {"queries": []}, {"queries": [{"type": "gifts"}] * 50}):
+            response = await self.client.post("/api/batch", headers=self.headers, json=payload)
+            self.assertEqual(response.status, 400)
+
+    async def test_init_data_header_with_invalid_utf8_is_unauthorized(self):
+        # Клиент aiohttp не отправит такой заголовок, поэтому пишем запрос в сокет сами.
+        reader, writer = await asyncio.open_connection(self.client.host, self.client.port)
+        writer.write(
+            b"GET /api/history HTTP/1.1\r\n"
+            b"Host: localhost\r\n"
+            b"X-Telegram-Init-Data: auth_date=1&hash=ab\xff\r\n"
+            b"Connection: close\r\n\r\n"
+        )
+        await writer.drain()
+        status_line = await asyncio.wait_for(reader.readline(), 5)
+        writer.close()
+        await writer.wait_closed()
+
+        self.assertEqual(status_line.split()[1], b"401")
+
+    async def test_gift_delivery_ids_outside_sqlite_range_are_not_found(self):
+        for delivery_id in ("0", "-1", str(2**63), "1" * 40, "abc"):
+            response = await self.client.get(f"/api/gifts/deliveries/{delivery_id}", headers=self.headers)
+            self.assertEqual(response.status, 404, delivery_id)
+
+    async def test_cursors_outside_sqlite_range_are_rejected(self):
+        # encode_cursor на orjson такие числа не кодирует, поэтому курсоры собираем вручную.
+        leaderboard_cursor, history_cursor = (
+            base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+            for values in ([2**63, 1], ["2026-01-01 00:00:00", -(2**63) - 1])
+        )
+
+        for path, cursor in (("/api/leaderboard", leaderboard_cursor), ("/api/history", history_cursor)):
+            response = await self.client.get(path, headers=self.headers, params={"cursor": cursor})
+            self.assertEqual(response.status, 400, path)
+            self.assertEqual((await response.json())["error"], "invalid_cursor")
+
+        response = await self.client.get("/api/history", headers=self.headers, params={"offset": str(2**63)})
+        self.assertEqual(response.status, 400)
+
+        response = await self.client.post(
+            "/api/batch",
+            headers=self.headers,
+            json={
+                "queries": [
+                    {"type": "leaderboard", "cursor": leaderboard_cursor},
+                    {"type": "history", "cursor": history_cursor},
+                    {"type": "gifts"},
+                ]
+            },
+        )
+        results = (await response.json())["results"]
+        self.assertEqual(response.status, 200)
+        self.assertEqual([result["status"] for result in results], [400, 400, 200])
+        self.assertEqual({result.get("error") for result in results[:2]}, {"invalid_cursor"})
+
+    async def test_rate_limit_answers_429_with_retry_after_per_user(self):
+        admission = self.client.app["admission"]
+        admission.budgets["/api/leaderboard"] = (60, 2)
+
+        statuses = []
+        for _ in range(3):
+            response = await self.client.get("/api/leaderboard", headers=self.headers)
+            statuses.append(response.status)
+        other_user = await self.client.get("/api/leaderboard", headers={"X-Telegram-Init-Data": self._init_data(888)})
+
+        self.assertEqual(statuses, [200, 200, 429])
+        self.assertEqual(response.headers["Retry-After"], "1")
+        self.assertEqual((await response.json())["error"], "rate_limited")
+        self.assertEqual(other_user.status, 200)
+
+    async def test_sheddable_routes_answer_503_when_write_queue_is_deep(self):
+        self.client.app["admission"].shed_queue_depth = 1
+        with patch.object(Database, "write_queue_depth", 5):
+            shed = await self.client.get("/api/leaderboard", headers=self.headers)
+            invoice = await self.client.get("/api/invoice", headers=self.headers)
+
+        self.assertEqual(shed.status, 503)
+        self.assertEqual(shed.headers["Retry-After"], "1")
+        self.assertEqual((await shed.json())["error"], "overloaded")
+        self.assertNotEqual(invoice.status, 503)
+
+    async def test_deferred_background_writes_count_towards_load_shedding(self):
+        self.client.app["admission"].shed_queue_depth = 5
+        tasks = type(self.client.app["background_tasks"])
+        with patch.object(Database, "write_queue_depth", 2), patch.object(tasks, "queued", 3):
+            shed = await self.client.get("/api/history", headers=self.headers)
+
+        self.assertEqual(shed.status, 503)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,308 @@
+import asyncio
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from unittest.mock import Mock, patch
+
+from bot.database import Database
+
+
+class DatabaseTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.db = Database(Path(self._tmp_dir.name) / "app.db", read_pool_size=2)
+        await self.db.init()
+
+    async def asyncTearDown(self):
+        await self.db.close()
+        self._tmp_dir.cleanup()
+
+    async def test_leaderboard_orders_by_spent_stars_then_user_id(self):
+        await self.db.upsert_user({"id": 3, "username": "c"})
+        await self.db.add_spent_stars(1, 50)
+        await self.db.add_spent_stars(2, 100)
+        await self.db.add_spent_stars(3, 50)
+
+        leaderboard = await self.db.get_leaderboard(limit=10)
+
+        self.assertEqual([row["userId"] for row in leaderboard], [2, 1, 3])
+        self.assertEqual(leaderboard[2]["username"], "c")
+
+    async def test_reads_do_not_wait_for_writer_lock(self):
+        await self.db.add_spent_stars(1, 25)
+
+        async with self.db._lock:
+            leaderboard, history = await asyncio.wait_for(
+                asyncio.gather(
+                    self.db.get_leaderboard(limit=10),
+                    self.db.get_action_history(user_id=1),
+                ),
+                timeout=5,
+            )
+
+        self.assertEqual(leaderboard[0]["spentStars"], 25)
+        self.assertEqual(history, [])
+
+    async def test_concurrent_writes_are_group_committed(self):
+        commit_batch_sync = self.db._commit_batch_sync
+        batch_sizes = []
+
+        def _recording_commit_batch_sync(conn, batch, submitted_at):
+            batch_sizes.append(len(batch))
+            return commit_batch_sync(conn, batch, submitted_at)
+
+        self.db._commit_batch_sync = _recording_commit_batch_sync
+        await asyncio.gather(*(self.db.upsert_user({"id": user_id}) for user_id in range(1, 21)))
+
+        self.assertEqual(sum(batch_sizes), 20)
+        self.assertLess(len(batch_sizes), 20)
+        self.assertEqual(len(await self.db.get_leaderboard(limit=100)), 20)
+
+    async def test_failed_write_does_not_roll_back_rest_of_batch(self):
+        results = await asyncio.gather(
+            self.db._write(self.db._add_action_history_many_sync, [(1, "won", "rose", "Rose", None, None)]),
+            self.db._write(self.db._add_action_history_many_sync, [(1, "bogus", "rose", "Rose", None, None)]),
+            self.db.add_spent_stars(1, 50),
+            return_exceptions=True,
+        )
+
+        self.assertIsInstance(results[1], Exception)
+        self.assertEqual(len(await self.db.get_action_history(user_id=1)), 1)
+        self.assertEqual((await self.db.get_leaderboard(limit=1))[0]["spentStars"], 50)
+
+    async def test_add_action_history_many_is_atomic(self):
+        rows = [
+            {"user_id": 1, "action_type": "won", "gift_key": "rose", "gift_name": "Rose", "spin_price": 25},
+            {"user_id": 1, "action_type": "received", "gift_key": "rose", "gift_name": "Rose", "spin_price": 25},
+        ]
+
+        self.assertEqual(await self.db.add_action_history_many(rows), 2)
+        with self.assertRaises(Exception):
+            await self.db.add_action_history_many([{**rows[0], "gift_name": None}, rows[1]])
+
+        history = await self.db.get_action_history(user_id=1)
+        self.assertEqual([entry["type"] for entry in history], ["received", "won"])
+
+    async def test_add_action_history_many_rejects_the_whole_batch_before_writing(self):
+        rows = [
+            {"user_id": 1, "action_type": "won", "gift_key": "rose", "gift_name": "Rose"},
+            {"user_id": 1, "action_type": "bogus", "gift_key": "rose", "gift_name": "Rose"},
+        ]
+
+        with self.assertRaisesRegex(ValueError, r"rows\[1\]"):
+            await self.db.add_action_history_many(rows)
+        with self.assertRaisesRegex(ValueError, "occurred_at"):
+            await self.db.add_action_history_many([{**rows[0], "occurred_at": "yesterday"}])
+
+        self.assertEqual(self.db.write_queue_depth, 0)
+        self.assertEqual(await self.db.get_action_history(user_id=1), [])
+
+    async def test_add_action_history_many_keeps_backfilled_timestamps(self):
+        row = {"user_id": 1, "action_type": "won", "gift_key": "rose", "gift_name": "Rose"}
+
+        await self.db.add_action_history_many(
+            [
+                {**row, "occurred_at": "2024-03-01 12:00:00"},
+                {**row, "occurred_at": datetime(2024, 3, 2, 15, 0, tzinfo=timezone(timedelta(hours=3)))},
+                row,
+            ]
+        )
+
+        history = await self.db.get_action_history(user_id=1)
+        self.assertEqual(
+            [entry["occurredAt"] for entry in history[1:]],
+            ["2024-03-02 12:00:00", "2024-03-01 12:00:00"],
+        )
+        self.assertGreater(history[0]["occurredAt"], "2025-01-01")
+
+    async def test_leaderboard_rank_matches_between_index_and_sql(self):
+        await self.db.add_spent_stars(1, 50)
+        await self.db.add_spent_stars(2, 100)
+        await self.db.upsert_user({"id": 3, "username": "c"})
+
+        sql_db = Database(self.db.path, leaderboard_index=False)
+        try:
+            for user_id in (1, 2, 3):
+                self.assertEqual(
+                    await self.db.get_leaderboard_rank(user_id, radius=1),
+                    await sql_db.get_leaderboard_rank(user_id, radius=1),
+                )
+            self.assertEqual(await self.db.get_leaderboard(limit=10), await sql_db.get_leaderboard(limit=10))
+        finally:
+            await sql_db.close()
+
+    async def test_sql_rank_reads_one_snapshot_under_concurrent_writes(self):
+        await self.db.add_spent_stars(1, 50)
+        await self.db.upsert_user({"id": 2, "username": "b"})
+
+        sql_db = Database(self.db.path, leaderboard_index=False)
+        reader = sql_db._connect_reader()
+        writer = sqlite3.connect(self.db.path)
+
+        def _overtake_after_rank(statement: str) -> None:
+            if "COUNT(*) + 1" in statement:
+                with writer:
+                    writer.execute("UPDATE users SET spent_stars = 100 WHERE user_id = 2")
+
+        reader.set_trace_callback(_overtake_after_rank)
+        try:
+            result = sql_db._get_leaderboard_rank_sync(reader, 1, 0)
+        finally:
+            reader.close()
+            writer.close()
+
+        self.assertEqual((result["rank"], result["entry"]["spentStars"]), (1, 50))
+        self.assertEqual([entry["userId"] for entry in result["neighbours"]], [1])
+
+    async def test_leaderboard_index_is_loaded_from_users_table(self):
+        await self.db.add_spent_stars(7, 25)
+        await self.db.close()
+
+        reopened = Database(self.db.path)
+        await reopened.init()
+        try:
+            self.assertEqual((await reopened.get_leaderboard_rank(7))["entry"]["spentStars"], 25)
+        finally:
+            await reopened.close()
+
+    async def test_keyset_pages_match_offset_pages(self):
+        for user_id in range(1, 8):
+            await self.db.add_spent_stars(user_id, 10 * (user_id % 3 + 1))
+            await self.db.add_action_history(user_id=1, action_type="won", gift_key="rose", gift_name="Rose")
+
+        sql_db = Database(self.db.path, leaderboard_index=False)
+        try:
+            for db in (self.db, sql_db):
+                first_page = await db.get_leaderboard(limit=3)
+                last = first_page[-1]
+                self.assertEqual(
+                    await db.get_leaderboard(limit=3, after=(last["spentStars"], last["userId"])),
+                    await db.get_leaderboard(limit=3, offset=3),
+                )
+
+            history = await self.db.get_action_history(user_id=1, limit=3)
+            self.assertEqual(
+                await self.db.get_action_history(user_id=1, limit=3, after=(history[-1]["occurredAt"], history[-1]["id"])),
+                await self.db.get_action_history(user_id=1, limit=3, offset=3),
+            )
+        finally:
+            await sql_db.close()
+
+    async def test_keyset_pages_through_large_tied_group(self):
+        await asyncio.gather(*(self.db.upsert_user({"id": user_id, "username": f"u{user_id}"}) for user_id in range(1, 61)))
+        for user_id in (5, 17, 42):
+            await self.db.add_spent_stars(user_id, 10)
+
+        sql_db = Database(self.db.path, leaderboard_index=False)
+        try:
+            for db in (self.db, sql_db):
+                expected = await db.get_leaderboard(limit=100)
+                pages = [await db.get_leaderboard(limit=7)]
+                while pages[-1]:
+                    last = pages[-1][-1]
+                    pages.append(await db.get_leaderboard(limit=7, after=(last["spentStars"], last["userId"])))
+
+                self.assertEqual([entry for page in pages for entry in page], expected)
+                self.assertEqual(len(expected), 60)
+        finally:
+            await sql_db.close()
+
+    async def test_unchanged_profile_skips_upsert_write(self):
+        self.db._upsert_user_sync = Mock(wraps=self.db._upsert_user_sync)
+
+        await self.db.upsert_user({"id": 1, "username": "a"})
+        await self.db.upsert_user({"id": 1, "username": "a"})
+        await self.db.upsert_user({"id": 1, "username": "b"})
+
+        self.assertEqual(self.db._upsert_user_sync.call_count, 2)
+        self.assertEqual((self.db.profile_cache_hits, self.db.profile_cache_misses), (1, 2))
+
+    async def test_profile_cache_expires_and_evicts(self):
+        self.db.profile_cache_size = 1
+        self.db.profile_cache_ttl = 0
+
+        await self.db.upsert_user({"id": 1, "username": "a"})
+        await self.db.upsert_user({"id": 1, "username": "a"})
+        await self.db.upsert_user({"id": 2, "username": "b"})
+
+        self.assertEqual(self.db.profile_cache_hits, 0)
+        self.assertEqual(list(self.db._profile_cache), [2])
+
+    async def test_read_pool_never_exceeds_configured_size(self):
+        await asyncio.gather(*(self.db.get_action_history(user_id=1) for _ in range(20)))
+
+        self.assertIn(self.db._readers.connections, (1, 2))
+        self.assertEqual([thread.name for thread in self.db._readers._threads], ["db-reader-0", "db-reader-1"])
+
+    async def test_database_calls_run_on_owned_threads(self):
+        with patch("asyncio.to_thread", side_effect=AssertionError("default executor used")):
+            await self.db.add_spent_stars(1, 10)
+            history = await self.db.get_action_history(user_id=1)
+
+        self.assertEqual(history, [])
+        self.assertEqual([thread.name for thread in self.db._writer._threads], ["db-writer-0"])
+        self.assertGreaterEqual(self.db._readers.connections, 1)
+        self.assertEqual(self.db.read_queue_depth, 0)
+
+        await self.db.close()
+        self.assertEqual((self.db._writer.connections, self.db._readers.connections), (0, 0))
+
+    async def test_sync_without_index_notifies_user_change_listeners(self):
+        follower = Database(self.db.path, leaderboard_index=False, leaderboard_sync_interval=60)
+        changed = []
+        follower.add_user_change_listener(changed.append)
+        await follower.init()
+        try:
+            await self.db.add_spent_stars(7, 25)
+            await follower.sync_leaderboard()
+        finally:
+            await follower.close()
+
+        self.assertEqual(changed, [7])
+
+    async def test_stop_iteration_from_a_database_call_is_raised_not_lost(self):
+        def _exhausted(conn):
+            return next(iter(()))
+
+        with self.assertRaises(RuntimeError):
+            await asyncio.wait_for(self.db._read(_exhausted), 5)
+
+    async def test_stop_iteration_from_a_write_keeps_the_writer_running(self):
+        def _exhausted(conn):
+            return next(iter(()))
+
+        failed, spent = await asyncio.wait_for(
+            asyncio.gather(self.db._write(_exhausted), self.db.add_spent_stars(1, 5), return_exceptions=True),
+            5,
+        )
+
+        self.assertIsInstance(failed, RuntimeError)
+        self.assertIsNone(spent)
+        await asyncio.wait_for(self.db.add_spent_stars(1, 5), 5)
+        self.assertEqual((await self.db.get_leaderboard(limit=1))[0]["spentStars"], 10)
+
+    async def test_leaderboard_sync_picks_up_writes_from_another_process(self):
+        await self.db.add_spent_stars(1, 10)
+        follower = Database(self.db.path, read_pool_size=1, leaderboard_sync_interval=60)
+        await follower.init()
+        try:
+            self.assertEqual(await follower.sync_leaderboard(), 0)
+
+            await self.db.upsert_user({"id": 2, "username": "late"})
+            await self.db.add_spent_stars(2, 30)
+            await follower.sync_leaderboard()
+
+            self.assertEqual(follower.leaderboard.rank(2), 1)
+            self.assertEqual(follower.leaderboard.entry(2)["username"], "late")
+            self.assertEqual(
+                await follower.get_leaderboard(limit=10),
+                await self.db.get_leaderboard(limit=10),
+            )
+        finally:
+            await follower.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.exceptions import TelegramRetryAfter, TelegramServerError
+from aiogram.types import LabeledPrice
+
+from bot.loadtest.fake_bot_api import FakeBotApi
+
+
+BOT_TOKEN = "123456:test-token"
+
+
+class FakeBotApiTest(unittest.IsolatedAsyncioTestCase):
+    async def _bot(self, fake_api: FakeBotApi) -> Bot:
+        runner, port = await fake_api.start()
+        self.addAsyncCleanup(runner.cleanup)
+        session = AiohttpSession(api=TelegramAPIServer.from_base(f"http://127.0.0.1:{port}"))
+        bot = Bot(BOT_TOKEN, session=session)
+        self.addAsyncCleanup(bot.session.close)
+        return bot
+
+    async def _create_invoice_link(self, bot: Bot) -> str:
+        return await bot.create_invoice_link(
+            title="Stars",
+            description="Stars",
+            payload="payload",
+            currency="XTR",
+            prices=[LabeledPrice(label="Stars", amount=25)],
+        )
+
+    async def test_answers_like_bot_api(self):
+        fake_api = FakeBotApi(latency=0)
+        bot = await self._bot(fake_api)
+
+        me = await bot.get_me()
+        link = await self._create_invoice_link(bot)
+        sent = await bot.send_gift(gift_id="5170145012310081615", user_id=777)
+        updates = await bot.get_updates(timeout=0)
+
+        self.assertEqual(me.id, 123456)
+        self.assertTrue(link.startswith("https://t.me/$loadtest-invoice-"))
+        self.assertTrue(sent)
+        self.assertEqual(updates, [])
+        self.assertEqual(fake_api.calls["createInvoiceLink"], 1)
+
+    async def test_injects_retry_after_and_server_errors(self):
+        bot = await self._bot(FakeBotApi(latency=0, retry_after_rate=1.0, retry_after=7))
+        with self.assertRaises(TelegramRetryAfter) as raised:
+            await self._create_invoice_link(bot)
+        self.assertEqual(raised.exception.retry_after, 7)
+
+        bot = await self._bot(FakeBotApi(latency=0, error_rate=1.0))
+        with self.assertRaises(TelegramServerError):
+            await bot.send_gift(gift_id="5170145012310081615", user_id=777)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,167 @@
+import asyncio
+import sqlite3
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import AsyncMock
+
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.methods import SendGift
+
+from bot.database import Database
+from bot.gift_delivery import GiftDeliveryWorkers
+
+
+class GiftDeliveryTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.db = Database(Path(self._tmp_dir.name) / "app.db", read_pool_size=2)
+        await self.db.init()
+        self.bot = AsyncMock()
+        self.workers = GiftDeliveryWorkers(
+            self.bot,
+            self.db,
+            workers=2,
+            max_attempts=3,
+            retry_base_seconds=0.01,
+            retry_max_seconds=0.05,
+            poll_interval=0.01,
+        )
+
+    async def asyncTearDown(self):
+        await self.workers.stop()
+        await self.db.close()
+        self._tmp_dir.cleanup()
+
+    async def _create_delivery(self, user_id: int = 7) -> int:
+        return await self.db.create_gift_delivery(
+            user_id=user_id,
+            gift_key="rose",
+            gift_id="gift_rose",
+            gift_name="Rose",
+            spin_price=25,
+        )
+
+    async def _wait_for_status(self, delivery_id: int, status: str, user_id: int = 7) -> dict:
+        for _ in range(200):
+            delivery = await self.db.get_gift_delivery(delivery_id, user_id=user_id)
+            if delivery["status"] == status:
+                return delivery
+            await asyncio.sleep(0.01)
+        self.fail(f"delivery {delivery_id} did not reach {status}: {delivery}")
+
+    async def test_delivered_gift_is_recorded_as_received(self):
+        delivery_id = await self._create_delivery()
+        self.workers.start()
+        self.workers.wake()
+
+        delivery = await self._wait_for_status(delivery_id, "delivered")
+
+        self.assertEqual(delivery["attempts"], 1)
+        self.bot.send_gift.assert_awaited_once_with(user_id=7, gift_id="gift_rose")
+        history = await self.db.get_action_history(user_id=7)
+        self.assertEqual(sorted(row["type"] for row in history), ["received", "won"])
+
+    async def test_transient_errors_are_retried_until_delivered(self):
+        self.bot.send_gift.side_effect = [
+            TelegramRetryAfter(SendGift(user_id=7, gift_id="gift_rose"), "Too Many Requests", retry_after=0),
+            ConnectionError("reset"),
+            True,
+        ]
+        delivery_id = await self._create_delivery()
+        self.workers.start()
+
+        delivery = await self._wait_for_status(delivery_id, "delivered")
+
+        self.assertEqual(delivery["attempts"], 3)
+        self.assertEqual(self.bot.send_gift.await_count, 3)
+
+    async def test_permanent_error_fails_delivery_without_retry(self):
+        self.bot.send_gift.side_effect = TelegramBadRequest(SendGift(user_id=7, gift_id="gift_rose"), "gift not found")
+        delivery_id = await self._create_delivery()
+        self.workers.start()
+
+        delivery = await self._wait_for_status(delivery_id, "failed")
+
+        self.assertEqual(delivery["attempts"], 1)
+        history = await self.db.get_action_history(user_id=7)
+        self.assertEqual([row["type"] for row in history], ["won"])
+
+    async def test_status_write_is_retried_without_sending_again(self):
+        self.workers.workers = 1
+        complete_gift_delivery = self.db.complete_gift_delivery
+
+        async def _locked_once(delivery_id, *, claimed_at):
+            if self.db.complete_gift_delivery.await_count == 1:
+                raise sqlite3.OperationalError("database is locked")
+            return await complete_gift_delivery(delivery_id, claimed_at=claimed_at)
+
+        self.db.complete_gift_delivery = AsyncMock(side_effect=_locked_once)
+        delivery_id = await self._create_delivery()
+        self.workers.start()
+
+        delivery = await self._wait_for_status(delivery_id, "delivered")
+
+        self.assertEqual(self.db.complete_gift_delivery.await_count, 2)
+        self.bot.send_gift.assert_awaited_once()
+        self.assertEqual(delivery["attempts"], 1)
+
+    async def test_slow_send_keeps_its_lease(self):
+        async def _slow_send(**kwargs):
+            await asyncio.sleep(0.3)
+            return True
+
+        self.bot.send_gift.side_effect = _slow_send
+        self.workers.lease_seconds = 0.1
+        delivery_id = await self._create_delivery()
+        self.workers.start()
+
+        delivery = await self._wait_for_status(delivery_id, "delivered")
+
+        self.bot.send_gift.assert_awaited_once()
+        self.assertEqual(delivery["attempts"], 1)
+
+    async def test_idle_workers_do_not_claim(self):
+        self.db.claim_gift_deliveries = AsyncMock(return_value=[])
+        self.workers.start()
+
+        await asyncio.sleep(0.05)
+
+        self.db.claim_gift_deliveries.assert_not_awaited()
+
+    async def test_expired_lease_is_claimed_again(self):
+        delivery_id = await self._create_delivery()
+
+        first = await self.db.claim_gift_deliveries(limit=10, lease_seconds=60)
+        self.assertEqual([row["id"] for row in first], [delivery_id])
+        self.assertEqual(await self.db.claim_gift_deliveries(limit=10, lease_seconds=60), [])
+
+        reclaimed = await self.db.claim_gift_deliveries(limit=10, lease_seconds=0)
+        self.assertEqual([(row["id"], row["attempts"]) for row in reclaimed], [(delivery_id, 2)])
+
+    async def test_stale_claim_cannot_write_status(self):
+        delivery_id = await self._create_delivery()
+        [stale] = await self.db.claim_gift_deliveries(limit=10, lease_seconds=60)
+        await asyncio.sleep(0.01)
+        [current] = await self.db.claim_gift_deliveries(limit=10, lease_seconds=0)
+
+        self.assertIsNone(await self.db.renew_gift_delivery_lease(delivery_id, claimed_at=stale["claimed_at"]))
+        self.assertFalse(await self.db.complete_gift_delivery(delivery_id, claimed_at=stale["claimed_at"]))
+        self.assertFalse(
+            await self.db.fail_gift_delivery(delivery_id, claimed_at=stale["claimed_at"], error="late", retry_in=0)
+        )
+        self.assertEqual((await self.db.get_gift_delivery(delivery_id, user_id=7))["status"], "sending")
+
+        self.assertTrue(await self.db.complete_gift_delivery(delivery_id, claimed_at=current["claimed_at"]))
+        history = await self.db.get_action_history(user_id=7)
+        self.assertEqual(sorted(row["type"] for row in history), ["received", "won"])
+
+    async def test_delivery_status_is_scoped_to_owner(self):
+        delivery_id = await self._create_delivery(user_id=7)
+
+        self.assertEqual((await self.db.get_gift_delivery(delivery_id, user_id=7))["status"], "pending")
+        self.assertIsNone(await self.db.get_gift_delivery(delivery_id, user_id=8))
+
+
+if __name__ == "__main__":
+    unittest.main()
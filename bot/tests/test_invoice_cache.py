@@ -0,0 +1,65 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from bot.invoice_cache import InvoiceLinkCache
+
+
+class InvoiceLinkCacheTest(unittest.IsolatedAsyncioTestCase):
+    async def test_concurrent_requests_share_one_telegram_call(self):
+        cache = InvoiceLinkCache(ttl=60)
+        release = asyncio.Event()
+
+        async def _create_link():
+            await release.wait()
+            return "https://t.me/invoice/shared"
+
+        factory = AsyncMock(side_effect=_create_link)
+        waiters = [asyncio.create_task(cache.get_or_create(50, 777, factory)) for _ in range(5)]
+        await asyncio.sleep(0)
+        release.set()
+
+        self.assertEqual(set(await asyncio.gather(*waiters)), {"https://t.me/invoice/shared"})
+        factory.assert_awaited_once()
+        self.assertEqual((cache.misses, cache.hits), (1, 4))
+
+    async def test_links_expire_after_ttl(self):
+        cache = InvoiceLinkCache(ttl=60)
+        factory = AsyncMock(side_effect=["https://t.me/invoice/1", "https://t.me/invoice/2"])
+
+        with patch("bot.invoice_cache.time.monotonic", return_value=100.0):
+            self.assertEqual(await cache.get_or_create(25, 1, factory), "https://t.me/invoice/1")
+        with patch("bot.invoice_cache.time.monotonic", return_value=159.0):
+            self.assertEqual(await cache.get_or_create(25, 1, factory), "https://t.me/invoice/1")
+        with patch("bot.invoice_cache.time.monotonic", return_value=160.0):
+            self.assertEqual(await cache.get_or_create(25, 1, factory), "https://t.me/invoice/2")
+
+    async def test_failures_are_not_cached(self):
+        cache = InvoiceLinkCache(ttl=60)
+        factory = AsyncMock(side_effect=[RuntimeError("telegram down"), "https://t.me/invoice/ok"])
+
+        with self.assertRaises(RuntimeError):
+            await cache.get_or_create(25, 1, factory)
+
+        self.assertEqual(await cache.get_or_create(25, 1, factory), "https://t.me/invoice/ok")
+
+    async def test_invalidation_during_creation_skips_caching(self):
+        cache = InvoiceLinkCache(ttl=60)
+        release = asyncio.Event()
+
+        async def _create_link():
+            await release.wait()
+            return "https://t.me/invoice/stale"
+
+        waiter = asyncio.create_task(cache.get_or_create(100, 9, _create_link))
+        await asyncio.sleep(0)
+        cache.invalidate_user(9)
+        release.set()
+
+        self.assertEqual(await waiter, "https://t.me/invoice/stale")
+        self.assertIsNone(cache.get(100, 9))
+        self.assertEqual(len(cache), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
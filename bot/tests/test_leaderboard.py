@@ -0,0 +1,134 @@
+import asyncio
+import json
+import unittest
+
+from bot.leaderboard import LeaderboardIndex, LeaderboardPageCache
+from bot.leaderboard_stream import RESYNC_EVENT, LeaderboardBroadcaster
+
+
+def _row(user_id: int, spent_stars: int, username: str | None = None) -> dict:
+    return {
+        "user_id": user_id,
+        "username": username,
+        "first_name": None,
+        "last_name": None,
+        "photo_url": None,
+        "spent_stars": spent_stars,
+    }
+
+
+class LeaderboardIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = LeaderboardIndex()
+        self.index.load([_row(1, 50), _row(2, 100), _row(3, 50, "c"), _row(4, 0)])
+
+    def test_page_matches_sql_order(self):
+        self.assertEqual([entry["userId"] for entry in self.index.page(10, 0)], [2, 1, 3, 4])
+        self.assertEqual([entry["userId"] for entry in self.index.page(2, 1)], [1, 3])
+
+    def test_set_score_moves_user_and_updates_rank(self):
+        self.index.set_score(4, 75)
+
+        self.assertEqual(self.index.rank(4), 2)
+        self.assertEqual(self.index.rank(1), 3)
+        self.assertEqual(len(self.index), 4)
+
+    def test_update_profile_keeps_existing_fields_and_adds_new_users(self):
+        self.index.update_profile({"id": 3, "username": None, "first_name": "Cat"})
+        self.index.update_profile({"id": 5, "username": "new"})
+
+        self.assertEqual(self.index.entry(3)["username"], "c")
+        self.assertEqual(self.index.entry(3)["firstName"], "Cat")
+        self.assertEqual(self.index.rank(5), 5)
+
+    def test_around_returns_rank_and_neighbours(self):
+        result = self.index.around(1, radius=1)
+
+        self.assertEqual(result["rank"], 2)
+        self.assertEqual(result["total"], 4)
+        self.assertEqual([(entry["userId"], entry["rank"]) for entry in result["neighbours"]], [(2, 1), (1, 2), (3, 3)])
+        self.assertIsNone(self.index.around(42, radius=1))
+
+
+class LeaderboardPageCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.index = LeaderboardIndex()
+        self.index.load([_row(user_id, 100 - user_id) for user_id in range(1, 11)])
+        self.cache = LeaderboardPageCache()
+        self.index.add_listener(self.cache.invalidate)
+        for offset in (0, 5):
+            self.cache.put((5, offset), b"page", first_position=offset, last_position=offset + 4, generation=0)
+
+    def test_score_change_only_drops_pages_whose_positions_shift(self):
+        self.index.set_score(9, 92)
+
+        self.assertIsNone(self.cache.get((5, 5)))
+        self.assertIsNotNone(self.cache.get((5, 0)))
+
+    def test_new_user_drops_pages_from_insert_position(self):
+        self.index.set_score(42, 95)
+
+        self.assertIsNotNone(self.cache.get((5, 0)))
+        self.assertIsNone(self.cache.get((5, 5)))
+
+    def test_profile_change_drops_page_with_that_user(self):
+        self.index.update_profile({"id": 1, "username": None})
+        self.assertEqual(len(self.cache), 2)
+
+        self.index.update_profile({"id": 1, "username": "renamed"})
+        self.assertIsNone(self.cache.get((5, 0)))
+        self.assertIsNotNone(self.cache.get((5, 5)))
+
+    def test_page_built_during_a_change_is_not_stored(self):
+        generation = self.cache.generation
+        self.index.set_score(1, 1000)
+
+        page = self.cache.put((5, 10), b"stale", first_position=10, last_position=14, generation=generation)
+
+        self.assertEqual(page.body, b"stale")
+        self.assertIsNone(self.cache.get((5, 10)))
+
+
+class LeaderboardBroadcasterTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.index = LeaderboardIndex()
+        self.index.load([_row(1, 50), _row(2, 100)])
+        self.broadcaster = LeaderboardBroadcaster(self.index, flush_interval=0.01, queue_size=2)
+        self.broadcaster.start()
+
+    async def asyncTearDown(self):
+        await self.broadcaster.close()
+
+    async def test_score_changes_are_coalesced_into_one_event_for_every_subscriber(self):
+        first = self.broadcaster.subscribe()
+        second = self.broadcaster.subscribe()
+
+        self.index.set_score(1, 150)
+        self.index.set_score(2, 120)
+        messages = await asyncio.wait_for(asyncio.gather(first.get(), second.get()), timeout=1)
+
+        self.assertEqual(messages[0], messages[1])
+        payload = json.loads(messages[0].split(b"data: ", 1)[1])
+        self.assertEqual([(entry["userId"], entry["rank"]) for entry in payload["entries"]], [(1, 1), (2, 2)])
+        self.assertEqual(self.broadcaster.events_sent, 1)
+
+    async def test_slow_subscriber_is_told_to_resync_instead_of_blocking(self):
+        slow = self.broadcaster.subscribe()
+        for spent_stars in range(200, 205):
+            self.index.set_score(1, spent_stars)
+            await asyncio.sleep(0.03)
+
+        self.assertEqual(await slow.get(), RESYNC_EVENT)
+        self.assertGreater(slow.dropped, 0)
+        self.assertEqual(self.broadcaster.events_sent, 5)
+
+    async def test_close_ends_subscriptions(self):
+        with self.broadcaster.subscribe() as subscription:
+            await self.broadcaster.close()
+            self.assertIsNone(await subscription.get())
+
+        self.assertEqual(self.broadcaster.subscriber_count, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import io
+import json
+import logging
+import queue
+import unittest
+
+from bot import logging_setup
+from bot.logging_setup import DroppingQueueHandler, configure_logging, parse_sample_rates, should_log
+
+
+class LoggingSetupTest(unittest.TestCase):
+    def setUp(self):
+        root = logging.getLogger()
+        self._root_state = (list(root.handlers), root.level)
+        self.logger = logging.getLogger("test_logging_setup")
+
+    def tearDown(self):
+        root = logging.getLogger()
+        handlers, level = self._root_state
+        root.handlers[:] = handlers
+        root.setLevel(level)
+        logging_setup._sample_rates.clear()
+
+    def test_records_are_written_as_json_lines_by_listener_thread(self):
+        stream = io.StringIO()
+        listener = configure_logging(stream=stream)
+        self.logger.info("invoice_request_received", extra={"amount": 50, "user_id": 777})
+        try:
+            raise RuntimeError("boom")
+        except RuntimeError:
+            self.logger.exception("invoice_create_failed", extra={"amount": 50})
+        listener.stop()
+
+        first, second = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual(
+            (first["event"], first["level"], first["amount"], first["user_id"]),
+            ("invoice_request_received", "INFO", 50, 777),
+        )
+        self.assertEqual((second["event"], second["level"]), ("invoice_create_failed", "ERROR"))
+        self.assertIn("RuntimeError: boom", second["exc"])
+
+    def test_sampling_and_level_gate_hot_events(self):
+        configure_logging(level="WARNING", sample_rates={"get_leaderboard_result": 0.0}).stop()
+        self.assertFalse(should_log(self.logger, "add_spent_stars_succeeded"))
+        self.assertTrue(should_log(self.logger, "add_spent_stars_succeeded", logging.WARNING))
+
+        configure_logging(sample_rates=parse_sample_rates("get_leaderboard_result=0, invoice_request_received=1")).stop()
+        self.assertFalse(should_log(self.logger, "get_leaderboard_result"))
+        self.assertTrue(should_log(self.logger, "invoice_request_received"))
+        self.assertTrue(should_log(self.logger, "add_spent_stars_succeeded"))
+
+    def test_full_queue_drops_records_instead_of_blocking(self):
+        handler = DroppingQueueHandler(queue.Queue(maxsize=1))
+        for index in range(3):
+            handler.handle(logging.LogRecord("test", logging.INFO, __file__, 1, "event_%s", (index,), None))
+
+        self.assertEqual(handler.dropped, 2)
+        self.assertEqual(handler.queue.get_nowait().msg, "event_0")
+
+
+if __name__ == "__main__":
+    unittest.main()
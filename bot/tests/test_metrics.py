@@ -0,0 +1,84 @@
+import unittest
+from unittest.mock import patch
+
+from aiohttp import web
+
+from bot.api import create_app
+from bot.metrics import MetricsRegistry
+from bot.telegram_scheduler import TelegramCallScheduler
+from bot.tests.api_support import ApiTestCase
+
+
+class MetricsRegistryTest(unittest.TestCase):
+    def test_histogram_renders_cumulative_buckets(self):
+        registry = MetricsRegistry()
+        histogram = registry.histogram("test_seconds", "Test latency.", ("route",), buckets=(0.1, 1.0))
+        counter = registry.counter("test_total", "Test counter.", ("route",))
+        for value in (0.05, 0.5, 5.0):
+            histogram.observe(value, "/a")
+        counter.inc('/b"')
+
+        lines = registry.render().splitlines()
+
+        self.assertIn("# TYPE test_seconds histogram", lines)
+        self.assertIn('test_seconds_bucket{route="/a",le="0.1"} 1', lines)
+        self.assertIn('test_seconds_bucket{route="/a",le="1"} 2', lines)
+        self.assertIn('test_seconds_bucket{route="/a",le="+Inf"} 3', lines)
+        self.assertIn('test_seconds_sum{route="/a"} 5.55', lines)
+        self.assertIn('test_seconds_count{route="/a"} 3', lines)
+        self.assertIn('test_total{route="/b\\""} 1', lines)
+
+    def test_duplicate_metric_names_are_rejected(self):
+        registry = MetricsRegistry()
+        registry.counter("test_total", "Test counter.")
+        with self.assertRaises(ValueError):
+            registry.gauge("test_total", "Test gauge.")
+
+
+class MetricsEndpointTest(ApiTestCase):
+    def app_patches(self) -> list:
+        return [patch("bot.api.METRICS_ENABLED", True)]
+
+    def build_app(self) -> web.Application:
+        self.scheduler = TelegramCallScheduler()
+        return create_app(self.bot, self.db, telegram_scheduler=self.scheduler)
+
+    async def test_metrics_expose_route_db_and_component_series(self):
+        await self.db.add_spent_stars(777, 10)
+        await self.client.get("/api/history", headers=self.headers)
+        await self.client.get("/wp-login.php")
+
+        response = await self.client.get("/metrics")
+        body = await response.text()
+
+        self.assertEqual(response.status, 200)
+        self.assertTrue(response.headers["Content-Type"].startswith("text/plain; version=0.0.4"))
+        self.assertIn('stargifter_http_request_duration_seconds_count{method="GET",route="/api/history",status="200"}', body)
+        self.assertIn('route="unmatched",status="404"', body)
+        self.assertIn('stargifter_db_execute_seconds_count{kind="read",operation="get_action_history"}', body)
+        self.assertIn('stargifter_db_wait_seconds_count{kind="write",operation="add_spent_stars",stage="lock"}', body)
+        self.assertIn('stargifter_background_tasks{state="queued"} 0', body)
+        self.assertIn("stargifter_db_write_queue_depth 0", body)
+        self.assertIn("stargifter_db_read_queue_depth 0", body)
+
+    async def test_metrics_expose_telegram_scheduler_queues(self):
+        self.scheduler.calls, self.scheduler.retries = 5, 2
+
+        body = await (await self.client.get("/metrics")).text()
+
+        self.assertIn('stargifter_telegram_queue_depth{priority="payments"} 0', body)
+        self.assertIn('stargifter_telegram_queue_depth{priority="gifts"} 0', body)
+        self.assertIn("stargifter_telegram_calls_total 5", body)
+        self.assertIn("stargifter_telegram_retries_total 2", body)
+
+    async def test_metrics_token_is_required_when_configured(self):
+        with patch("bot.api.METRICS_TOKEN", "scrape-secret"):
+            denied = await self.client.get("/metrics")
+            garbled = await self.client.get("/metrics", headers={"Authorization": "Bearer é"})
+            allowed = await self.client.get("/metrics", headers={"Authorization": "Bearer scrape-secret"})
+
+        self.assertEqual((denied.status, garbled.status, allowed.status), (401, 401, 200))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,11 +1,33 @@
 import json
+import time
 import unittest
 from types import SimpleNamespace
-from unittest.mock import AsyncMock, call, patch
-
-from bot.api import _create_invoice_response, handle_action_history, handle_invoice_get, handle_roulette_win
+from unittest.mock import AsyncMock, patch
+
+from bot.api import (
+    _create_invoice_response,
+    auth_middleware,
+    handle_action_history,
+    handle_invoice_get,
+    handle_roulette_win,
+    handle_session,
+)
 from bot.bot_handlers import process_pre_checkout_query, process_successful_payment
+from bot.invoice_cache import InvoiceLinkCache
 from bot.payments import build_invoice_payload
+from bot.security import issue_session_token
+from bot.tasks import BackgroundTaskSupervisor
+
+
+class _FakeRequest(dict):
+    def __init__(self, *, app, method="GET", path="/api/test", query=None, headers=None, json_body=None):
+        super().__init__()
+        self.app = app
+        self.method = method
+        self.path = path
+        self.query = query or {}
+        self.headers = headers or {}
+        self.read = AsyncMock(return_value=json.dumps(json_body or {}).encode())
 
 
 class _FakePreCheckoutQuery:
@@ -18,30 +40,90 @@ class _FakePreCheckoutQuery:
         self.answer = AsyncMock()
 
 
+def _verified_init_data(auth_date: int | None = None) -> dict:
+    return {"auth_date": str(int(time.time()) if auth_date is None else auth_date), "user": '{"id": 777}'}
+
+
 class PaymentContractsTest(unittest.IsolatedAsyncioTestCase):
     async def asyncSetUp(self):
         self.bot = AsyncMock()
         self.bot.create_invoice_link = AsyncMock(return_value="https://t.me/invoice/test-link")
         self.db = AsyncMock()
-        self.app = {"bot": self.bot, "db": self.db}
+        self.app = {"bot": self.bot, "db": self.db, "background_tasks": BackgroundTaskSupervisor()}
 
     async def test_invoice_endpoint_returns_invoice_link_for_valid_init_data_and_amount(self):
+        request = _FakeRequest(
+            app=self.app,
+            query={"amount": "50", "init_data": "valid_init_data"},
+        )
+
         with (
-            patch("bot.api.verify_telegram_init_data", return_value={"user": '{"id": 777}'}),
+            patch("bot.api.verify_telegram_init_data", return_value=_verified_init_data()),
             patch("bot.api.extract_user_from_init_data", return_value={"id": 777}),
         ):
-            response = await _create_invoice_response(
-                app=self.app,
-                amount=50,
-                init_data="valid_init_data",
-                x_telegram_init_data=None,
-            )
+            response = await auth_middleware(request, handle_invoice_get)
 
         self.assertEqual(response.status, 200)
         self.assertEqual(json.loads(response.text)["invoice_link"], "https://t.me/invoice/test-link")
         self.bot.create_invoice_link.assert_awaited_once()
         self.db.upsert_user.assert_called_once_with({"id": 777})
 
+    async def test_invoice_response_rejects_amount_outside_allowed_prices(self):
+        response = await _create_invoice_response(app=self.app, amount=42, user={"id": 777})
+
+        self.assertEqual(response.status, 400)
+        self.bot.create_invoice_link.assert_not_called()
+
+    async def test_authenticated_endpoint_rejects_missing_init_data(self):
+        request = _FakeRequest(app=self.app, query={"amount": "50"})
+
+        response = await auth_middleware(request, handle_invoice_get)
+
+        self.assertEqual(response.status, 401)
+        self.assertEqual(json.loads(response.text), {"error": "invalid_init_data"})
+        self.bot.create_invoice_link.assert_not_called()
+
+    async def test_session_token_authenticates_later_requests(self):
+        request = _FakeRequest(app=self.app, method="POST", headers={"X-Telegram-Init-Data": "valid"})
+        with (
+            patch("bot.api.BOT_TOKEN", "123456:token"),
+            patch("bot.api.verify_telegram_init_data", return_value=_verified_init_data()),
+            patch("bot.api.extract_user_from_init_data", return_value={"id": 777, "username": "tester"}),
+        ):
+            session_response = await auth_middleware(request, handle_session)
+            token = json.loads(session_response.text)["token"]
+
+            self.db.get_action_history = AsyncMock(return_value=[])
+            request = _FakeRequest(app=self.app, headers={"Authorization": f"Bearer {token}"})
+            response = await auth_middleware(request, handle_action_history)
+
+        self.assertEqual(response.status, 200)
+        self.assertEqual(request["user"]["username"], "tester")
+        self.db.get_action_history.assert_awaited_once_with(user_id=777, limit=100, offset=0, after=None)
+
+    async def test_session_token_does_not_outlive_its_init_data(self):
+        auth_date = int(time.time()) - 86400 + 60
+        request = _FakeRequest(app=self.app, method="POST", headers={"X-Telegram-Init-Data": "valid"})
+        with (
+            patch("bot.api.BOT_TOKEN", "123456:token"),
+            patch("bot.api.INIT_DATA_MAX_AGE_SECONDS", 86400),
+            patch("bot.api.SESSION_TOKEN_TTL_SECONDS", 3600),
+            patch("bot.api.verify_telegram_init_data", return_value=_verified_init_data(auth_date)),
+            patch("bot.api.extract_user_from_init_data", return_value={"id": 777}),
+        ):
+            response = await auth_middleware(request, handle_session)
+
+        self.assertEqual(json.loads(response.text)["expiresAt"], auth_date + 86400)
+
+    async def test_session_token_cannot_be_refreshed_with_itself(self):
+        token, _ = issue_session_token({"id": 777}, "123456:token", 3600)
+        request = _FakeRequest(app=self.app, method="POST", headers={"Authorization": f"Bearer {token}"})
+
+        with patch("bot.api.BOT_TOKEN", "123456:token"):
+            response = await auth_middleware(request, handle_session)
+
+        self.assertEqual(response.status, 401)
+
     async def test_invoice_get_endpoint_rejects_invalid_amount_type(self):
         request = SimpleNamespace(
             query={"amount": "not-a-number"},
@@ -97,6 +179,29 @@ class PaymentContractsTest(unittest.IsolatedAsyncioTestCase):
         )
         db.add_spent_stars.assert_awaited_once_with(777, 50)
 
+    async def test_invoice_links_are_reused_until_payment_succeeds(self):
+        self.app["invoice_links"] = InvoiceLinkCache(ttl=60)
+        self.bot.create_invoice_link = AsyncMock(side_effect=["https://t.me/invoice/first", "https://t.me/invoice/second"])
+
+        first = await _create_invoice_response(app=self.app, amount=50, user={"id": 777})
+        repeated = await _create_invoice_response(app=self.app, amount=50, user={"id": 777})
+        self.assertEqual(json.loads(first.text)["invoice_link"], "https://t.me/invoice/first")
+        self.assertEqual(json.loads(repeated.text)["invoice_link"], "https://t.me/invoice/first")
+        self.bot.create_invoice_link.assert_awaited_once()
+
+        message = SimpleNamespace(
+            message_id=123,
+            from_user=SimpleNamespace(id=777, username=None, first_name=None, last_name=None),
+            successful_payment=SimpleNamespace(
+                invoice_payload=build_invoice_payload(50, 777),
+                telegram_payment_charge_id="charge-1",
+            ),
+        )
+        await process_successful_payment(message, AsyncMock(), self.app["invoice_links"])
+
+        after_payment = await _create_invoice_response(app=self.app, amount=50, user={"id": 777})
+        self.assertEqual(json.loads(after_payment.text)["invoice_link"], "https://t.me/invoice/second")
+
     async def test_successful_payment_ignores_invalid_payload(self):
         db = AsyncMock()
         message = SimpleNamespace(
@@ -118,74 +223,65 @@ class PaymentContractsTest(unittest.IsolatedAsyncioTestCase):
         db.upsert_user.assert_not_awaited()
         db.add_spent_stars.assert_not_awaited()
 
-    async def test_roulette_win_sends_telegram_gift_for_verified_user(self):
-        request = SimpleNamespace(
-            json=AsyncMock(return_value={"gift_key": "rose"}),
-            headers={"X-Telegram-Init-Data": "valid"},
+    async def test_roulette_win_queues_gift_delivery_for_verified_user(self):
+        self.db.create_gift_delivery = AsyncMock(return_value=41)
+        request = _FakeRequest(
             app=self.app,
+            method="POST",
+            json_body={"gift_key": "rose", "init_data": "valid"},
         )
 
         with (
-            patch("bot.api.verify_telegram_init_data", return_value={"user": '{"id": 777}'}),
+            patch("bot.api.verify_telegram_init_data", return_value=_verified_init_data()),
             patch("bot.api.extract_user_from_init_data", return_value={"id": 777}),
             patch("bot.api.TELEGRAM_GIFTS", {"rose": {"name": "Rose", "gift_id": "gift_rose"}}),
         ):
-            response = await handle_roulette_win(request)
-
-        self.assertEqual(response.status, 200)
-        self.bot.send_gift.assert_awaited_once_with(user_id=777, gift_id="gift_rose")
-        self.db.add_action_history.assert_has_awaits(
-            [
-                call(
-                    user_id=777,
-                    action_type="won",
-                    gift_key="rose",
-                    gift_name="Rose",
-                    spin_price=None,
-                ),
-                call(
-                    user_id=777,
-                    action_type="received",
-                    gift_key="rose",
-                    gift_name="Rose",
-                    spin_price=None,
-                ),
-            ]
+            response = await auth_middleware(request, handle_roulette_win)
+
+        self.assertEqual(response.status, 202)
+        self.assertEqual(json.loads(response.text), {"ok": True, "delivery_id": 41, "deliveryId": 41})
+        self.bot.send_gift.assert_not_awaited()
+        self.db.create_gift_delivery.assert_awaited_once_with(
+            user_id=777,
+            gift_key="rose",
+            gift_id="gift_rose",
+            gift_name="Rose",
+            spin_price=None,
         )
 
     async def test_roulette_win_rejects_unknown_gift_key(self):
-        request = SimpleNamespace(
-            json=AsyncMock(return_value={"gift_key": "rose"}),
-            headers={"X-Telegram-Init-Data": "valid"},
+        request = _FakeRequest(
             app=self.app,
+            method="POST",
+            headers={"X-Telegram-Init-Data": "valid"},
+            json_body={"gift_key": "rose"},
         )
 
         with (
-            patch("bot.api.verify_telegram_init_data", return_value={"user": '{"id": 777}'}),
+            patch("bot.api.verify_telegram_init_data", return_value=_verified_init_data()),
             patch("bot.api.extract_user_from_init_data", return_value={"id": 777}),
             patch("bot.api.TELEGRAM_GIFTS", {}),
         ):
-            response = await handle_roulette_win(request)
+            response = await auth_middleware(request, handle_roulette_win)
 
         self.assertEqual(response.status, 400)
         self.bot.send_gift.assert_not_called()
 
     async def test_action_history_returns_history_for_verified_user(self):
         self.db.get_action_history = AsyncMock(return_value=[{"type": "won"}])
-        request = SimpleNamespace(
-            query={},
-            headers={"X-Telegram-Init-Data": "valid"},
+        request = _FakeRequest(
             app=self.app,
+            headers={"X-Telegram-Init-Data": "valid"},
         )
 
         with (
-            patch("bot.api.verify_telegram_init_data", return_value={"user": '{"id": 777}'}),
+            patch("bot.api.verify_telegram_init_data", return_value=_verified_init_data()),
             patch("bot.api.extract_user_from_init_data", return_value={"id": 777}),
         ):
-            response = await handle_action_history(request)
+            response = await auth_middleware(request, handle_action_history)
 
         self.assertEqual(response.status, 200)
-        self.db.get_action_history.assert_awaited_once_with(user_id=777, limit=100, offset=0)
+        self.db.get_action_history.assert_awaited_once_with(user_id=777, limit=100, offset=0, after=None)
 
 
 
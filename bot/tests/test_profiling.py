@@ -0,0 +1,77 @@
+import pstats
+import threading
+import tracemalloc
+import unittest
+from unittest.mock import patch
+
+from bot.profiling import PROFILE_HEADER, PROFILE_MODE_HEADER
+from bot.tests.api_support import ApiTestCase
+
+
+SECRET = "profile-secret"
+
+
+class RequestProfilingTest(ApiTestCase):
+    def app_patches(self) -> list:
+        self.profile_dir = self.tmp_path / "profiles"
+        return [
+            patch("bot.api.PROFILING_ENABLED", True),
+            patch("bot.api.PROFILING_SECRET", SECRET),
+            patch("bot.api.PROFILING_DIR", self.profile_dir),
+            patch("bot.api.PROFILING_MAX_FILES", 2),
+        ]
+
+    async def test_secret_header_writes_tagged_profiles_with_rotation(self):
+        await self.client.get("/api/history", headers=self.headers)
+        self.assertFalse(self.profile_dir.exists())
+
+        for mode in ("cprofile", "tracemalloc", "cprofile"):
+            response = await self.client.get(
+                "/api/history",
+                headers={**self.headers, PROFILE_HEADER: SECRET, PROFILE_MODE_HEADER: mode},
+            )
+            self.assertEqual(response.status, 200)
+
+        files = sorted(self.profile_dir.iterdir())
+        self.assertEqual([file.suffix for file in files], [".txt", ".prof"])
+        self.assertIn("-get-api_history-u777-", files[1].name)
+        self.assertGreater(pstats.Stats(str(files[1])).total_calls, 0)
+
+    async def test_tracemalloc_snapshots_are_taken_off_the_event_loop(self):
+        take_snapshot = tracemalloc.take_snapshot
+        threads = []
+
+        def _recording_take_snapshot():
+            threads.append(threading.current_thread())
+            return take_snapshot()
+
+        with patch("tracemalloc.take_snapshot", _recording_take_snapshot):
+            response = await self.client.get(
+                "/api/history",
+                headers={**self.headers, PROFILE_HEADER: SECRET, PROFILE_MODE_HEADER: "tracemalloc"},
+            )
+
+        self.assertEqual(response.status, 200)
+        self.assertEqual(len(threads), 2)
+        self.assertNotIn(threading.current_thread(), threads)
+        self.assertFalse(tracemalloc.is_tracing())
+        self.assertEqual([file.suffix for file in self.profile_dir.iterdir()], [".txt"])
+
+    async def test_slow_requests_endpoint_requires_secret_and_sorts_by_duration(self):
+        await self.client.get("/api/history", headers=self.headers)
+        await self.client.get("/api/leaderboard", headers=self.headers)
+
+        denied = await self.client.get("/api/debug/slow-requests")
+        garbled = await self.client.get("/api/leaderboard", headers={**self.headers, PROFILE_HEADER: "é"})
+        response = await self.client.get("/api/debug/slow-requests?limit=5", headers={PROFILE_HEADER: SECRET})
+        requests = (await response.json())["requests"]
+
+        self.assertEqual((denied.status, garbled.status, response.status), (403, 200, 200))
+        self.assertLessEqual({"/api/history", "/api/leaderboard"}, {entry["route"] for entry in requests})
+        self.assertIn(777, [entry["userId"] for entry in requests])
+        durations = [entry["durationMs"] for entry in requests]
+        self.assertEqual(durations, sorted(durations, reverse=True))
+
+
+if __name__ == "__main__":
+    unittest.main()
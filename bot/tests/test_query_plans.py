@@ -0,0 +1,38 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from bot.benchmarks.bench_database import check_plans, check_timings, generate, query_plans
+from bot.database import Database
+
+
+class QueryPlanTest(unittest.IsolatedAsyncioTestCase):
+    async def test_queries_use_their_indexes_on_generated_data(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / "plans.db"
+            db = Database(path, leaderboard_index=False)
+            await db.init()
+            await db.close()
+
+            generate(path, users=2000, history=20000, heavy_users=5, seed=1)
+            db = Database(path, leaderboard_index=False)
+            await db.init()
+            try:
+                plans = query_plans(db, heavy_user=100001, deep_offset=1000)
+            finally:
+                await db.close()
+
+        self.assertEqual(check_plans(plans), [])
+
+    def test_single_column_keyset_seek_and_slow_keyset_pages_are_reported(self):
+        plans = {"leaderboard_keyset": ["SEARCH users USING INDEX idx_users_leaderboard (spent_stars<?)"]}
+        slow = {"leaderboard_offset_deep": {"p50_ms": 6.7}, "leaderboard_keyset_deep": {"p50_ms": 5.4}}
+        fast = {"leaderboard_offset_deep": {"p50_ms": 6.7}, "leaderboard_keyset_deep": {"p50_ms": 0.2}}
+
+        self.assertIn("spent_stars=? AND user_id>?", "\n".join(check_plans(plans)))
+        self.assertEqual(len(check_timings(slow)), 1)
+        self.assertEqual(check_timings(fast), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+
+from bot.rate_limit import AdmissionControl, TokenBucket
+
+
+class TokenBucketTest(unittest.TestCase):
+    def test_bucket_refills_at_rate_and_honours_block(self):
+        now = [0.0]
+        bucket = TokenBucket(2, 2, clock=lambda: now[0])
+
+        self.assertEqual(bucket.try_acquire(), 0)
+        self.assertEqual(bucket.try_acquire(), 0)
+        self.assertAlmostEqual(bucket.try_acquire(), 0.5)
+
+        now[0] = 0.5
+        self.assertEqual(bucket.try_acquire(), 0)
+
+        bucket.block(3)
+        now[0] = 2.0
+        self.assertAlmostEqual(bucket.try_acquire(), 1.5)
+        now[0] = 4.0
+        self.assertEqual(bucket.try_acquire(), 0)
+
+
+    def test_non_positive_rate_is_rejected(self):
+        for rate in (0, -1, float("nan")):
+            with self.assertRaises(ValueError):
+                TokenBucket(rate, 1)
+        with self.assertRaises(ValueError):
+            AdmissionControl(budgets={"/api/invoice": (0, 5)}, default_budget=(120, 20))
+
+
+class AdmissionControlTest(unittest.TestCase):
+    def test_budgets_are_per_route_and_user_and_idle_buckets_are_evicted(self):
+        now = [0.0]
+        admission = AdmissionControl(
+            budgets={"/api/roulette/win": (60, 1)},
+            default_budget=(120, 2),
+            shed_queue_depth=10,
+            max_keys=2,
+            clock=lambda: now[0],
+        )
+
+        self.assertEqual(admission.admit("/api/roulette/win", 1), 0)
+        self.assertAlmostEqual(admission.admit("/api/roulette/win", 1), 1.0)
+        self.assertEqual(admission.admit("/api/roulette/win", 2), 0)
+        self.assertEqual(admission.admit("/api/history", 1), 0)
+        self.assertEqual(admission.rate_limited, 1)
+
+        now[0] = 5.0
+        admission.admit("/api/history", 2)
+        self.assertEqual(len(admission._buckets), 2)
+
+        self.assertFalse(admission.should_shed(9))
+        self.assertTrue(admission.should_shed(10))
+        self.assertEqual(admission.shed, 1)
+
+    def test_key_count_stays_bounded_when_no_bucket_is_idle(self):
+        admission = AdmissionControl(budgets={}, default_budget=(60, 1), max_keys=3, clock=lambda: 0.0)
+
+        for user_id in range(10):
+            admission.admit("/api/history", user_id)
+
+        self.assertEqual(len(admission._buckets), 3)
+        self.assertEqual([user_id for _, user_id in admission._buckets], [7, 8, 9])
+
+
+if __name__ == "__main__":
+    unittest.main()
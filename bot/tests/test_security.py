@@ -0,0 +1,103 @@
+import time
+import unittest
+from unittest.mock import patch
+
+from bot import security
+
+
+BOT_TOKEN = "123456:test-token"
+
+
+def build_init_data(bot_token: str, user_id: int) -> str:
+    return security.sign_init_data(
+        {
+            "auth_date": str(int(time.time())),
+            "user": f'{{"id": {user_id}, "username": "tester_{user_id}"}}',
+        },
+        bot_token,
+    )
+
+
+class InitDataVerificationTest(unittest.TestCase):
+    def setUp(self):
+        security._verified_init_data.clear()
+
+    def test_valid_init_data_is_verified_and_cached(self):
+        init_data = build_init_data(BOT_TOKEN, 777)
+
+        first = security.verify_telegram_init_data(init_data, BOT_TOKEN, 86400)
+        with patch("bot.security._verify_signature") as verify_signature:
+            second = security.verify_telegram_init_data(init_data, BOT_TOKEN, 86400)
+
+        verify_signature.assert_not_called()
+        self.assertEqual(first, second)
+        self.assertEqual(security.extract_user_from_init_data(second)["id"], 777)
+
+    def test_tampered_init_data_is_rejected(self):
+        init_data = build_init_data(BOT_TOKEN, 777).replace("tester_777", "tester_778")
+
+        self.assertIsNone(security.verify_telegram_init_data(init_data, BOT_TOKEN, 86400))
+        self.assertIsNone(security.verify_telegram_init_data(build_init_data(BOT_TOKEN, 777), "other:token", 86400))
+
+    def test_non_ascii_hash_is_rejected(self):
+        init_data = f"auth_date={int(time.time())}&hash=%C3%A9"
+
+        self.assertIsNone(security.verify_telegram_init_data(init_data, BOT_TOKEN, 86400))
+
+    def test_undecodable_init_data_is_rejected(self):
+        # Так aiohttp передает байт 0xFF из заголовка или query.
+        auth_date = int(time.time())
+
+        self.assertIsNone(security.verify_telegram_init_data(f"auth_date={auth_date}&hash=ab\udcff", BOT_TOKEN, 86400))
+        self.assertIsNone(
+            security.verify_telegram_init_data(f"auth_date={auth_date}&user=\udcff&hash=ab", BOT_TOKEN, 86400)
+        )
+
+    def test_cached_init_data_still_expires_by_auth_date(self):
+        init_data = build_init_data(BOT_TOKEN, 777)
+        self.assertIsNotNone(security.verify_telegram_init_data(init_data, BOT_TOKEN, 60))
+
+        with patch("bot.security.time.time", return_value=time.time() + 120):
+            self.assertIsNone(security.verify_telegram_init_data(init_data, BOT_TOKEN, 60))
+
+    def test_extracted_user_is_a_copy(self):
+        parsed = {"user": '{"id": 777, "username": "tester"}'}
+
+        security.extract_user_from_init_data(parsed)["username"] = "changed"
+
+        self.assertEqual(security.extract_user_from_init_data(parsed)["username"], "tester")
+
+
+class SessionTokenTest(unittest.TestCase):
+    def test_session_token_round_trips_user_profile(self):
+        user = {"id": 777, "username": "tester", "first_name": "Test", "last_name": None, "photo_url": None}
+
+        token, _ = security.issue_session_token({**user, "language_code": "ru"}, BOT_TOKEN, 60)
+
+        self.assertEqual(security.verify_session_token(token, BOT_TOKEN), user)
+
+    def test_session_token_expiry_is_capped(self):
+        not_after = int(time.time()) + 10
+
+        token, expires_at = security.issue_session_token({"id": 777}, BOT_TOKEN, 60, not_after=not_after)
+
+        self.assertEqual(expires_at, not_after)
+        with patch("bot.security.time.time", return_value=not_after + 1):
+            self.assertIsNone(security.verify_session_token(token, BOT_TOKEN))
+
+    def test_tampered_or_expired_session_token_is_rejected(self):
+        token, _ = security.issue_session_token({"id": 777}, BOT_TOKEN, 60)
+        mac = token.partition(".")[2]
+        forged, _ = security.issue_session_token({"id": 1}, BOT_TOKEN, 60)
+
+        self.assertIsNone(security.verify_session_token(f"{forged.partition('.')[0]}.{mac}", BOT_TOKEN))
+        self.assertIsNone(security.verify_session_token(token, "other:token"))
+        with patch("bot.security.time.time", return_value=time.time() + 120):
+            self.assertIsNone(security.verify_session_token(token, BOT_TOKEN))
+
+        self.assertIsNone(security.verify_session_token("abc.éé", BOT_TOKEN))
+        self.assertIsNone(security.verify_session_token("\udcff.abc", BOT_TOKEN))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,30 @@
+import importlib
+import sys
+import unittest
+from unittest.mock import patch
+
+from bot import serialization
+
+
+class SerializationTest(unittest.TestCase):
+    def _assert_round_trip_and_decode_errors(self) -> None:
+        for data in (b"\xff{}", b"{", ""):
+            with self.assertRaises(serialization.JSONDecodeError):
+                serialization.loads(data)
+        self.assertEqual(serialization.loads(serialization.dumps({"name": "Роза"})), {"name": "Роза"})
+
+    @unittest.skipUnless(serialization.orjson is not None, "orjson is not installed")
+    def test_orjson_backend(self):
+        self._assert_round_trip_and_decode_errors()
+
+    def test_stdlib_fallback_backend(self):
+        self.addCleanup(importlib.reload, serialization)
+        with patch.dict(sys.modules, {"orjson": None}):
+            importlib.reload(serialization)
+
+        self.assertEqual(serialization.BACKEND, "json")
+        self._assert_round_trip_and_decode_errors()
+
+
+if __name__ == "__main__":
+    unittest.main()
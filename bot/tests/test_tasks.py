@@ -0,0 +1,103 @@
+import asyncio
+import unittest
+
+from bot.tasks import POLICY_BLOCK, POLICY_COALESCE, POLICY_DROP, BackgroundTaskSupervisor
+
+
+class BackgroundTaskSupervisorTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.release = asyncio.Event()
+        self.done: list[str] = []
+        self.peak_running = 0
+
+    async def _job(self, name: str, supervisor: BackgroundTaskSupervisor) -> None:
+        self.peak_running = max(self.peak_running, supervisor.running)
+        await self.release.wait()
+        self.done.append(name)
+
+    async def test_running_jobs_are_bounded_by_max_concurrency(self):
+        supervisor = BackgroundTaskSupervisor(max_concurrency=2, max_queue=10, policy=POLICY_DROP)
+        for index in range(6):
+            await supervisor.submit(self._job(f"job-{index}", supervisor), label="test")
+        await asyncio.sleep(0)
+
+        self.assertEqual((supervisor.running, supervisor.queued), (2, 4))
+        self.release.set()
+        await supervisor.join()
+
+        self.assertEqual(self.peak_running, 2)
+        self.assertEqual(sorted(self.done), [f"job-{index}" for index in range(6)])
+        self.assertEqual(supervisor.completed, 6)
+
+    async def test_drop_policy_rejects_jobs_when_queue_is_full(self):
+        supervisor = BackgroundTaskSupervisor(max_concurrency=1, max_queue=1, policy=POLICY_DROP)
+        await supervisor.submit(self._job("running", supervisor), label="test")
+        await asyncio.sleep(0)
+
+        self.assertTrue(await supervisor.submit(self._job("queued", supervisor), label="test"))
+        self.assertFalse(await supervisor.submit(self._job("dropped", supervisor), label="test"))
+
+        self.release.set()
+        await supervisor.join()
+        self.assertEqual(self.done, ["running", "queued"])
+        self.assertEqual(supervisor.dropped, 1)
+
+    async def test_coalesce_policy_keeps_latest_job_per_key(self):
+        supervisor = BackgroundTaskSupervisor(max_concurrency=1, max_queue=10, policy=POLICY_COALESCE)
+        await supervisor.submit(self._job("running", supervisor), label="test", key="user-1")
+        await asyncio.sleep(0)
+
+        for version in range(3):
+            await supervisor.submit(self._job(f"user-1-v{version}", supervisor), label="test", key="user-1")
+        await supervisor.submit(self._job("user-2", supervisor), label="test", key="user-2")
+
+        self.assertEqual((supervisor.queued, supervisor.coalesced), (2, 2))
+        self.release.set()
+        await supervisor.join()
+        self.assertEqual(self.done, ["running", "user-1-v2", "user-2"])
+
+    async def test_block_policy_waits_for_queue_space(self):
+        supervisor = BackgroundTaskSupervisor(max_concurrency=1, max_queue=1, policy=POLICY_BLOCK)
+        await supervisor.submit(self._job("running", supervisor), label="test")
+        await asyncio.sleep(0)
+        await supervisor.submit(self._job("queued", supervisor), label="test")
+
+        blocked = asyncio.create_task(supervisor.submit(self._job("blocked", supervisor), label="test"))
+        await asyncio.sleep(0.01)
+        self.assertFalse(blocked.done())
+
+        self.release.set()
+        self.assertTrue(await blocked)
+        await supervisor.join()
+        self.assertEqual(self.done, ["running", "queued", "blocked"])
+        self.assertEqual(supervisor.dropped, 0)
+
+    async def test_failures_are_counted_and_close_drains_queue(self):
+        supervisor = BackgroundTaskSupervisor(max_concurrency=1, max_queue=10)
+
+        async def _fail() -> None:
+            raise RuntimeError("boom")
+
+        await supervisor.submit(_fail(), label="failing")
+        await supervisor.submit(self._job("after-failure", supervisor), label="test")
+        self.release.set()
+        await supervisor.close()
+
+        self.assertEqual((supervisor.failed, supervisor.completed), (1, 1))
+        self.assertEqual(self.done, ["after-failure"])
+        self.assertFalse(await supervisor.submit(self._job("late", supervisor), label="test"))
+
+    async def test_close_cancels_jobs_that_outlive_timeout(self):
+        supervisor = BackgroundTaskSupervisor(max_concurrency=1, max_queue=10)
+        await supervisor.submit(self._job("stuck", supervisor), label="test")
+        await supervisor.submit(self._job("never-started", supervisor), label="test")
+        await asyncio.sleep(0)
+
+        await supervisor.close(timeout=0.01)
+
+        self.assertEqual(self.done, [])
+        self.assertEqual((supervisor.running, supervisor.queued, supervisor.dropped), (0, 0, 2))
+
+
+if __name__ == "__main__":
+    unittest.main()
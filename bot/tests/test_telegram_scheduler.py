@@ -0,0 +1,113 @@
+import asyncio
+import time
+import unittest
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.types import LabeledPrice
+
+from bot.rate_limit import TokenBucket
+from bot.telegram_scheduler import TelegramCallScheduler
+
+
+BOT_TOKEN = "123456:test-token"
+
+
+class _FakeBotApi:
+    def __init__(self) -> None:
+        self.calls: list[str] = []
+        self.flood_responses: dict[str, int] = {}
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls.append(method)
+        if self.flood_responses.get(method):
+            self.flood_responses[method] -= 1
+            return web.json_response(
+                {
+                    "ok": False,
+                    "error_code": 429,
+                    "description": "Too Many Requests: retry after 1",
+                    "parameters": {"retry_after": 1},
+                },
+                status=429,
+            )
+
+        result = "https://t.me/invoice/fake" if method == "createInvoiceLink" else True
+        return web.json_response({"ok": True, "result": result})
+
+
+class TelegramCallSchedulerTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.fake_api = _FakeBotApi()
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.fake_api.handle)
+        self.server = TestServer(app)
+        await self.server.start_server()
+
+        self.scheduler = TelegramCallScheduler(global_rate=20, chat_rate=20, chat_burst=1, max_retries=1)
+        session = AiohttpSession(api=TelegramAPIServer.from_base(str(self.server.make_url(""))))
+        session.middleware(self.scheduler)
+        self.bot = Bot(BOT_TOKEN, session=session)
+
+    async def asyncTearDown(self):
+        await self.bot.session.close()
+        await self.server.close()
+
+    async def _create_invoice_link(self) -> str:
+        return await self.bot.create_invoice_link(
+            title="Stars",
+            description="Stars",
+            payload="payload",
+            currency="XTR",
+            prices=[LabeledPrice(label="Stars", amount=25)],
+        )
+
+    async def test_payments_are_served_before_gifts_and_chat_replies(self):
+        self.scheduler.global_bucket = TokenBucket(20, 1)
+        await self.bot.send_chat_action(chat_id=1, action="typing")
+
+        chat_reply = asyncio.create_task(self.bot.send_chat_action(chat_id=2, action="typing"))
+        gift = asyncio.create_task(self.bot.send_gift(user_id=3, gift_id="gift_rose"))
+        invoice = asyncio.create_task(self._create_invoice_link())
+        while self.scheduler.queue_depth < 3:
+            await asyncio.sleep(0)
+
+        self.assertEqual(self.scheduler.queue_depths(), {"payments": 1, "gifts": 1, "chat": 1})
+        await asyncio.gather(chat_reply, gift, invoice)
+
+        self.assertEqual(self.fake_api.calls, ["sendChatAction", "createInvoiceLink", "sendGift", "sendChatAction"])
+        self.assertEqual(self.scheduler.queue_depth, 0)
+
+    async def test_per_chat_bucket_spaces_out_calls_to_one_chat(self):
+        started = time.monotonic()
+        await asyncio.gather(*(self.bot.send_chat_action(chat_id=7, action="typing") for _ in range(3)))
+
+        self.assertGreaterEqual(time.monotonic() - started, 0.09)
+        self.assertEqual(self.fake_api.calls, ["sendChatAction"] * 3)
+
+    async def test_retry_after_is_retried_transparently(self):
+        self.fake_api.flood_responses["sendGift"] = 1
+
+        started = time.monotonic()
+        self.assertTrue(await self.bot.send_gift(user_id=3, gift_id="gift_rose"))
+
+        self.assertGreaterEqual(time.monotonic() - started, 0.9)
+        self.assertEqual(self.fake_api.calls, ["sendGift", "sendGift"])
+        self.assertEqual(self.scheduler.retries, 1)
+
+    async def test_retry_after_is_raised_once_retries_are_exhausted(self):
+        self.fake_api.flood_responses["createInvoiceLink"] = 2
+
+        with self.assertRaises(TelegramRetryAfter):
+            await self._create_invoice_link()
+
+        self.assertEqual(self.fake_api.calls, ["createInvoiceLink", "createInvoiceLink"])
+
+
+if __name__ == "__main__":
+    unittest.main()
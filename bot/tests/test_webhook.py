@@ -0,0 +1,108 @@
+import asyncio
+import unittest
+
+from aiogram import Bot, Dispatcher
+from aiohttp import web
+
+from bot.api import create_app
+from bot.bot_handlers import register_bot_handlers
+from bot.payments import build_invoice_payload
+from bot.tests.api_support import BOT_TOKEN, ApiTestCase
+from bot.webhook import SECRET_TOKEN_HEADER, WebhookUpdates
+
+
+SECRET = "webhook-secret"
+
+
+def _successful_payment_update(update_id: int, user_id: int, amount: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 1700000000,
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Test", "username": f"user_{user_id}"},
+            "successful_payment": {
+                "currency": "XTR",
+                "total_amount": amount,
+                "invoice_payload": build_invoice_payload(amount, user_id),
+                "telegram_payment_charge_id": f"charge-{update_id}",
+                "provider_payment_charge_id": f"provider-{update_id}",
+            },
+        },
+    }
+
+
+class WebhookTest(ApiTestCase):
+    def build_app(self) -> web.Application:
+        # Обработчикам нужен настоящий Bot, а API-части хватает заглушки из базового класса.
+        self.telegram_bot = Bot(BOT_TOKEN)
+        self.dp = Dispatcher()
+        self.webhook = WebhookUpdates(self.dp, self.telegram_bot, secret_token=SECRET, max_concurrency=2)
+        return create_app(self.bot, self.db, webhook=self.webhook)
+
+    async def asyncTearDown(self):
+        await super().asyncTearDown()
+        await self.telegram_bot.session.close()
+
+    async def _post_update(self, update: dict, secret: str = SECRET):
+        return await self.client.post("/telegram/webhook", json=update, headers={SECRET_TOKEN_HEADER: secret})
+
+    async def test_recorded_payment_update_is_processed(self):
+        register_bot_handlers(self.dp, self.db)
+
+        response = await self._post_update(_successful_payment_update(1001, 777, 50))
+        await self.webhook.close()
+
+        self.assertEqual(response.status, 200)
+        leaderboard = await self.db.get_leaderboard(limit=1)
+        self.assertEqual(
+            (leaderboard[0]["userId"], leaderboard[0]["username"], leaderboard[0]["spentStars"]),
+            (777, "user_777", 50),
+        )
+
+    async def test_wrong_secret_and_malformed_updates_are_rejected(self):
+        handled = []
+
+        @self.dp.message()
+        async def _handler(message) -> None:
+            handled.append(message.message_id)
+
+        wrong_secret = await self._post_update(_successful_payment_update(1, 777, 50), secret="guess")
+        garbled_secret = await self._post_update(_successful_payment_update(2, 777, 50), secret="é")
+        malformed = await self.client.post("/telegram/webhook", data=b"{", headers={SECRET_TOKEN_HEADER: SECRET})
+
+        await self.webhook.close()
+
+        self.assertEqual((wrong_secret.status, garbled_secret.status, malformed.status), (401, 401, 400))
+        self.assertEqual(handled, [])
+
+    async def test_update_processing_is_bounded(self):
+        running = 0
+        peak = 0
+        release = asyncio.Event()
+
+        @self.dp.message()
+        async def _slow_handler(message) -> None:
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await release.wait()
+            running -= 1
+
+        posts = [asyncio.create_task(self._post_update(_successful_payment_update(i, 777, 25))) for i in range(5)]
+        while self.webhook.received < 2:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05)
+
+        self.assertEqual(self.webhook.received, 2)
+        release.set()
+        responses = await asyncio.gather(*posts)
+        await self.webhook.close()
+
+        self.assertEqual([response.status for response in responses], [200] * 5)
+        self.assertEqual(peak, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
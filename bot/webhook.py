@@ -0,0 +1,68 @@
+import asyncio
+import logging
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from pydantic import ValidationError
+
+from security import secrets_match
+from serialization import JSONDecodeError, loads
+
+
+logger = logging.getLogger(__name__)
+
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookUpdates:
+    def __init__(self, dp: Dispatcher, bot: Bot, *, secret_token: str, max_concurrency: int = 32) -> None:
+        self.dp = dp
+        self.bot = bot
+        self.secret_token = secret_token
+        self.max_concurrency = max(1, max_concurrency)
+        self.received = 0
+        self.failed = 0
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        self._tasks: set[asyncio.Task] = set()
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._tasks)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if not secrets_match(self.secret_token, request.headers.get(SECRET_TOKEN_HEADER, "")):
+            logger.warning("webhook_secret_mismatch", extra={"remote": request.remote})
+            return web.Response(status=401)
+
+        try:
+            update = Update.model_validate(loads(await request.read()), context={"bot": self.bot})
+        except (JSONDecodeError, ValidationError):
+            logger.warning("webhook_update_invalid")
+            return web.Response(status=400)
+
+        # Пока все слоты заняты, Telegram ждет ответа и не шлет новые обновления в это соединение.
+        await self._slots.acquire()
+        self.received += 1
+        task = asyncio.create_task(self._process(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.Response(status=200)
+
+    async def _process(self, update: Update) -> None:
+        try:
+            await self.dp.feed_update(self.bot, update)
+        except Exception:
+            self.failed += 1
+            logger.exception("webhook_update_failed", extra={"update_id": update.update_id})
+        finally:
+            self._slots.release()
+
+    async def close(self, timeout: float = 10.0) -> None:
+        if not self._tasks:
+            return
+
+        _, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)